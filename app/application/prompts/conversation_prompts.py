@@ -410,4 +410,22 @@ VALIDATE_FALLBACK_CHOICE_PROMPT_TEMPLATE = ChatPromptTemplate.from_template(
 
     Categoria:
     """
-)
\ No newline at end of file
+)
+# Templates de classificação que podem ser agrupados em lote (LLM_BATCHING_NODES):
+# nome -> (template, variável da mensagem, respostas aceitas). No lote, respostas fora da lista são refeitas individualmente.
+BATCHABLE_CLASSIFICATION_PROMPTS = {
+    "check_cancellation": (CHECK_CANCELLATION_PROMPT_TEMPLATE, "user_message", ("SIM", "NAO")),
+    "categorization": (
+        CATEGORIZATION_PROMPT_TEMPLATE,
+        "user_query",
+        (
+            "Criar Agendamento",
+            "Consultar Agendamento",
+            "Atualizar Agendamento",
+            "Cancelar Agendamento",
+            "Informações Unidade",
+            "Saudação ou Despedida",
+            "Fora do Escopo",
+        ),
+    ),
+}
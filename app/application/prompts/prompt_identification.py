@@ -0,0 +1,107 @@
+"""
+Identificação do template que montou o prompt de uma chamada ao LLM.
+
+Os nós marcam cada chamada com o nome do template (prompt_config) nos metadados da run do LangChain; métricas,
+contabilidade de tokens, tracing e turnos lentos só leem esse metadado (template_from_metadata). O reconhecimento
+pelo texto renderizado (PromptTemplateMatcher) fica para quem precisa das variáveis do prompt, como o
+FakeChatModel e a gravação de respostas, e não roda no caminho das chamadas reais.
+"""
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Pattern, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+
+from app.application.prompts import conversation_prompts
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE_METADATA_KEY = "prompt_template"
+UNKNOWN_TEMPLATE = "UNKNOWN"
+
+
+def prompt_config(template_name: str) -> RunnableConfig:
+    """config do invoke que marca a chamada ao LLM com o template do prompt (nome sem o sufixo _PROMPT_TEMPLATE)."""
+    return {"metadata": {PROMPT_TEMPLATE_METADATA_KEY: template_name}}
+
+
+def template_from_metadata(metadata: Optional[Mapping[str, Any]]) -> str:
+    """Nome do template marcado por prompt_config nos metadados da run, ou UNKNOWN."""
+    return (metadata or {}).get(PROMPT_TEMPLATE_METADATA_KEY) or UNKNOWN_TEMPLATE
+
+
+class PromptTemplateMatcher:
+    """
+    Reconhece qual template de conversation_prompts gerou uma lista de mensagens e extrai suas variáveis.
+    Cada mensagem do template é renderizada com sentinelas no lugar das variáveis e vira uma regex.
+    """
+
+    def __init__(self, templates: Dict[str, ChatPromptTemplate]):
+        self._compiled: List[Tuple[str, List[Pattern]]] = []
+        for name, template in templates.items():
+            try:
+                self._compiled.append((name, self._compile(template)))
+            except Exception as e:
+                logger.warning(f"PromptTemplateMatcher: template '{name}' não pôde ser compilado para reconhecimento: {e}")
+
+    @staticmethod
+    def _compile(template: ChatPromptTemplate) -> List[Pattern]:
+        sentinels = {var: f"\x00{var}\x00" for var in template.input_variables}
+        patterns = []
+        for message in template.format_messages(**sentinels):
+            pieces = re.split(r"\x00(\w+)\x00", message.content)
+            pattern, seen = "", set()
+            for i, piece in enumerate(pieces):
+                if i % 2 == 0:
+                    pattern += re.escape(piece)
+                elif piece in seen:
+                    pattern += f"(?P={piece})"
+                else:
+                    seen.add(piece)
+                    pattern += f"(?P<{piece}>.*?)"
+            patterns.append(re.compile(f"^{pattern}$", re.DOTALL))
+        return patterns
+
+    def match(self, messages: List[BaseMessage]) -> Tuple[str, Dict[str, str]]:
+        contents = [m.content if isinstance(m.content, str) else str(m.content) for m in messages]
+        for name, patterns in self._compiled:
+            if len(patterns) != len(contents):
+                continue
+            variables: Dict[str, str] = {}
+            for pattern, content in zip(patterns, contents):
+                found = pattern.match(content)
+                if not found:
+                    break
+                variables.update(found.groupdict())
+            else:
+                return name, variables
+        return UNKNOWN_TEMPLATE, {"prompt": "\n".join(contents)}
+
+
+def registered_templates() -> Dict[str, ChatPromptTemplate]:
+    return {
+        name.removesuffix("_PROMPT_TEMPLATE"): value
+        for name, value in vars(conversation_prompts).items()
+        if name.endswith("_PROMPT_TEMPLATE") and isinstance(value, ChatPromptTemplate)
+    }
+
+
+_matcher: Optional[PromptTemplateMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_template_matcher() -> PromptTemplateMatcher:
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = PromptTemplateMatcher(registered_templates())
+    return _matcher
+
+
+def identify_prompt_template(messages: List[BaseMessage]) -> str:
+    """Nome do template de conversation_prompts que gerou as mensagens pelo texto (UNKNOWN se nenhum)."""
+    return get_template_matcher().match(messages)[0]
@@ -1,14 +1,23 @@
 import logging
+from datetime import datetime, timezone
 from typing import List, Optional
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, RemoveMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 
 from app.application.prompts.conversation_prompts import (
     CATEGORIZATION_PROMPT_TEMPLATE, GREETING_FAREWELL_PROMPT_TEMPLATE
 )
+from app.application.prompts.prompt_identification import prompt_config
+from app.application.services.intent_classifier import get_intent_classifier, log_intent_sample
+from app.core.config import settings
+from app.infrastructure.metrics import HISTORY_COMPACTION_BYTES_SAVED, SESSIONS_EXPIRED
 logger = logging.getLogger(__name__)
 
+_history_serde = JsonPlusSerializer()
+
 def get_last_user_message_content(messages: List[BaseMessage]) -> Optional[str]:
     """Extrai o conteúdo da última mensagem do usuário (HumanMessage)."""
     if not messages:
@@ -18,18 +27,97 @@ def get_last_user_message_content(messages: List[BaseMessage]) -> Optional[str]:
         return last_message.content
     return None
 
+def _extend_history_summary(existing_summary: Optional[str], older_messages: List[BaseMessage]) -> str:
+    """Acrescenta as mensagens compactadas ao resumo (uma linha curta por mensagem), mantendo só o final do texto."""
+    lines = [existing_summary] if existing_summary else []
+    for message in older_messages:
+        speaker = "Paciente" if isinstance(message, HumanMessage) else "Assistente"
+        content = " ".join(str(message.content).split())
+        lines.append(f"{speaker}: {content[:200]}")
+    summary = "\n".join(lines)
+    max_chars = settings.MESSAGE_HISTORY_SUMMARY_MAX_CHARS
+    if len(summary) > max_chars:
+        summary = summary[-max_chars:]
+        summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+    return summary
+
+
+def compact_message_history(messages: List[BaseMessage], existing_summary: Optional[str] = None) -> dict:
+    """
+    Política de janela do histórico: mantém só as últimas MESSAGE_HISTORY_MAX_MESSAGES mensagens do thread
+    (os nós só leem as duas últimas) e remove as anteriores com RemoveMessage; com MESSAGE_HISTORY_SUMMARY_ENABLED,
+    as removidas viram linhas em `history_summary`. Retorna as atualizações de estado (vazio se não há o que compactar).
+    """
+    max_messages = settings.MESSAGE_HISTORY_MAX_MESSAGES
+    if not max_messages or len(messages) <= max_messages:
+        return {}
+
+    older_messages = [message for message in messages[:-max_messages] if message.id]
+    if not older_messages:
+        return {}
+    updates: dict = {"messages": [RemoveMessage(id=message.id) for message in older_messages]}
+    bytes_saved = len(_history_serde.dumps_typed(older_messages)[1])
+    if settings.MESSAGE_HISTORY_SUMMARY_ENABLED:
+        updates["history_summary"] = _extend_history_summary(existing_summary, older_messages)
+        bytes_saved -= len(updates["history_summary"].encode("utf-8")) - len((existing_summary or "").encode("utf-8"))
+    HISTORY_COMPACTION_BYTES_SAVED.observe(max(bytes_saved, 0))
+    logger.debug("Histórico compactado: %d mensagens removidas, ~%d bytes a menos por checkpoint.", len(older_messages), bytes_saved)
+    return updates
+
+
+def expire_idle_session(state: dict, now: Optional[datetime] = None) -> Optional[dict]:
+    """
+    TTL da sessão: se a última atividade (`last_activity_at`) é mais antiga que SESSION_IDLE_TTL_MINUTES, retorna as
+    atualizações que zeram o estado da conversa (operação, passo e dados do agendamento, histórico) mantendo só a
+    mensagem atual, para o turno seguir como uma conversa nova. Retorna None se a sessão ainda está ativa.
+    """
+    ttl_minutes = settings.SESSION_IDLE_TTL_MINUTES
+    last_activity_at = state.get("last_activity_at")
+    if ttl_minutes is None or not last_activity_at:
+        return None
+    now = now or datetime.now(timezone.utc)
+    try:
+        idle_minutes = (now - datetime.fromisoformat(last_activity_at)).total_seconds() / 60
+    except (TypeError, ValueError):
+        logger.warning("last_activity_at inválido no estado: %r", last_activity_at)
+        return None
+    if idle_minutes < ttl_minutes:
+        return None
+
+    from app.application.workflows.main_workflow_state import MainWorkflowState
+
+    preserved_keys = {"messages", "user_phone", "last_activity_at"}
+    updates = {key: None for key in MainWorkflowState.__annotations__ if key not in preserved_keys}
+    messages = state.get("messages", [])
+    current_message = messages[-1:] if messages and isinstance(messages[-1], HumanMessage) else []
+    updates["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES), *current_message]
+    SESSIONS_EXPIRED.inc()
+    logger.info("Sessão inativa há %.0f min (TTL %s min): estado da conversa reiniciado.", idle_minutes, ttl_minutes)
+    return updates
+
+
 def categorize_intent_service(user_query: str, llm_client: ChatOpenAI) -> str:
     """
-    Categoriza a intenção do usuário usando o LLM.
+    Categoriza a intenção do usuário.
+    Usa o classificador local quando ele está configurado e confiante; caso contrário, chama o LLM.
     """
     if not user_query:
         return "Indefinido"
-    
+
+    intent_classifier = get_intent_classifier()
+    if intent_classifier is not None:
+        categoria_local, confianca = intent_classifier.classify(user_query)
+        if confianca >= settings.INTENT_CLASSIFIER_THRESHOLD:
+            logger.info(f"Intenção categorizada localmente como '{categoria_local}' (confiança {confianca:.2f}).")
+            return categoria_local
+        logger.debug(f"Classificador local inseguro ('{categoria_local}', {confianca:.2f}). Usando o LLM.")
+
     chain = CATEGORIZATION_PROMPT_TEMPLATE | llm_client
     try:
-        response = chain.invoke({"user_query": user_query})
+        response = chain.invoke({"user_query": user_query}, config=prompt_config("CATEGORIZATION"))
         categoria_llm = response.content
         categoria_limpa = categoria_llm.replace('Categoria: ', '').replace('"', '').strip()
+        log_intent_sample(user_query, categoria_limpa)
         return categoria_limpa
     except Exception as e:
         logger.error(f"Erro durante a categorização com LLM: {e}")
@@ -45,7 +133,7 @@ def generate_greeting_farewell_service(user_query: Optional[str], llm_client: Ch
     chain = GREETING_FAREWELL_PROMPT_TEMPLATE | llm_client
     logger.info(f"Geração de saudação/despedida com LLM: {user_query}")
     try:
-        response = chain.invoke({"user_message": user_query})
+        response = chain.invoke({"user_message": user_query}, config=prompt_config("GREETING_FAREWELL"))
         logger.info(f"Resposta gerada pelo LLM: {response.content.strip()}")
         return response.content.strip()
     except Exception as e:
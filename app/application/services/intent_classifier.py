@@ -0,0 +1,358 @@
+"""
+Classificador local de intenção (TF-IDF de n-gramas de caracteres + regressão logística multinomial).
+
+Responde sem rede os casos em que tem confiança (ex.: "oi", "quero agendar") e deixa o restante para o LLM.
+É treinado a partir dos pares (mensagem, categoria) registrados em INTENT_CLASSIFIER_LOG_PATH
+(INTENT_CLASSIFIER_LOG_ENABLED; o arquivo do dia mais os rotacionados, <path>.AAAA-MM-DD).
+
+Uso:
+    python -m app.application.services.intent_classifier train --data intents.jsonl --output intent_model.json
+    python -m app.application.services.intent_classifier evaluate --data intents_test.jsonl --model intent_model.json
+    python -m app.application.services.intent_classifier predict --model intent_model.json "quero marcar consulta"
+"""
+import argparse
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from logging.handlers import QueueListener, TimedRotatingFileHandler
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_CATEGORIES = [
+    "Criar Agendamento",
+    "Consultar Agendamento",
+    "Atualizar Agendamento",
+    "Cancelar Agendamento",
+    "Informações Unidade",
+    "Saudação ou Despedida",
+    "Fora do Escopo",
+]
+
+MODEL_VERSION = 1
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def extract_features(text: str, ngram_range: Tuple[int, int] = (2, 4)) -> Counter:
+    """Contagem de n-gramas de caracteres (com bordas de palavra) e de palavras inteiras."""
+    normalized = normalize_text(text)
+    features: Counter = Counter()
+    padded = f" {normalized} "
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for i in range(len(padded) - n + 1):
+            features[f"c:{padded[i:i + n]}"] += 1
+    for word in normalized.split():
+        features[f"w:{word}"] += 1
+    return features
+
+
+class IntentClassifier:
+    """Modelo linear esparso; os vetores são dicts {feature: valor}."""
+
+    def __init__(
+        self,
+        labels: List[str],
+        idf: Dict[str, float],
+        weights: Dict[str, Dict[str, float]],
+        bias: Dict[str, float],
+        ngram_range: Tuple[int, int] = (2, 4),
+    ):
+        self.labels = labels
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.ngram_range = tuple(ngram_range)
+
+    def vectorize(self, text: str) -> Dict[str, float]:
+        counts = extract_features(text, self.ngram_range)
+        vector = {f: (1.0 + math.log(c)) * self.idf[f] for f, c in counts.items() if f in self.idf}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {f: v / norm for f, v in vector.items()} if norm else {}
+
+    def _scores(self, vector: Dict[str, float]) -> Dict[str, float]:
+        return {
+            label: self.bias[label] + sum(self.weights[label].get(f, 0.0) * v for f, v in vector.items())
+            for label in self.labels
+        }
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        return _softmax(self._scores(self.vectorize(text)))
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Retorna (categoria mais provável, probabilidade)."""
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "labels": self.labels,
+            "ngram_range": list(self.ngram_range),
+            "idf": self.idf,
+            "weights": self.weights,
+            "bias": self.bias,
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError(f"Versão de modelo de intenção não suportada: {data.get('version')}")
+        return cls(data["labels"], data["idf"], data["weights"], data["bias"], tuple(data["ngram_range"]))
+
+
+def _softmax(scores: Dict[str, float]) -> Dict[str, float]:
+    max_score = max(scores.values())
+    exps = {label: math.exp(score - max_score) for label, score in scores.items()}
+    total = sum(exps.values())
+    return {label: value / total for label, value in exps.items()}
+
+
+def train_intent_classifier(
+    samples: List[Tuple[str, str]],
+    epochs: int = 30,
+    learning_rate: float = 0.5,
+    l2: float = 1e-4,
+    min_df: int = 1,
+    ngram_range: Tuple[int, int] = (2, 4),
+    seed: int = 13,
+) -> IntentClassifier:
+    """Treina TF-IDF + regressão logística multinomial com SGD (L2) sobre vetores esparsos."""
+    if not samples:
+        raise ValueError("Nenhuma amostra para treinar o classificador de intenção.")
+    labels = sorted({label for _, label in samples})
+
+    document_frequency: Counter = Counter()
+    for text, _ in samples:
+        document_frequency.update(extract_features(text, ngram_range).keys())
+    n_docs = len(samples)
+    idf = {
+        f: math.log((1 + n_docs) / (1 + df)) + 1.0
+        for f, df in document_frequency.items()
+        if df >= min_df
+    }
+
+    model = IntentClassifier(labels, idf, {label: {} for label in labels}, {label: 0.0 for label in labels}, ngram_range)
+    vectors = [(model.vectorize(text), label) for text, label in samples]
+    rng = random.Random(seed)
+
+    for epoch in range(epochs):
+        rng.shuffle(vectors)
+        step = learning_rate / (1.0 + epoch * 0.1)
+        total_loss = 0.0
+        for vector, target in vectors:
+            probabilities = _softmax(model._scores(vector))
+            total_loss -= math.log(max(probabilities[target], 1e-12))
+            for label in labels:
+                gradient = probabilities[label] - (1.0 if label == target else 0.0)
+                label_weights = model.weights[label]
+                model.bias[label] -= step * gradient
+                for f, v in vector.items():
+                    w = label_weights.get(f, 0.0)
+                    label_weights[f] = w - step * (gradient * v + l2 * w)
+        logger.debug("Intent classifier: época %d/%d, loss médio %.4f", epoch + 1, epochs, total_loss / len(vectors))
+
+    for label in labels:
+        model.weights[label] = {f: round(w, 6) for f, w in model.weights[label].items() if abs(w) > 1e-5}
+    return model
+
+
+def load_samples(path: str) -> List[Tuple[str, str]]:
+    """Lê pares (mensagem, categoria) de um JSONL com campos "message" e "category"."""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            message, category = record.get("message"), record.get("category")
+            if message and category in INTENT_CATEGORIES:
+                samples.append((message, category))
+    return samples
+
+
+def evaluate_intent_classifier(model: IntentClassifier, samples: Iterable[Tuple[str, str]], threshold: float) -> dict:
+    """Acurácia geral, por categoria e a cobertura (fração respondida localmente) no limiar informado."""
+    total = correct = confident = confident_correct = 0
+    per_label: Dict[str, Dict[str, int]] = defaultdict(lambda: {"tp": 0, "fp": 0, "fn": 0})
+    start = time.perf_counter()
+    for text, expected in samples:
+        predicted, confidence = model.classify(text)
+        total += 1
+        if predicted == expected:
+            correct += 1
+            per_label[expected]["tp"] += 1
+        else:
+            per_label[predicted]["fp"] += 1
+            per_label[expected]["fn"] += 1
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == expected
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for label, counts in sorted(per_label.items()):
+        precision = counts["tp"] / (counts["tp"] + counts["fp"]) if counts["tp"] + counts["fp"] else 0.0
+        recall = counts["tp"] / (counts["tp"] + counts["fn"]) if counts["tp"] + counts["fn"] else 0.0
+        report[label] = {"precision": round(precision, 3), "recall": round(recall, 3), "support": counts["tp"] + counts["fn"]}
+    return {
+        "samples": total,
+        "accuracy": round(correct / total, 4) if total else 0.0,
+        "threshold": threshold,
+        "coverage": round(confident / total, 4) if total else 0.0,
+        "accuracy_when_confident": round(confident_correct / confident, 4) if confident else 0.0,
+        "avg_latency_ms": round(elapsed * 1000 / total, 3) if total else 0.0,
+        "per_label": report,
+    }
+
+
+_intent_classifier: Optional[IntentClassifier] = None
+_intent_classifier_loaded = False
+_sample_logger: Optional[logging.Logger] = None
+_sample_listener: Optional[QueueListener] = None
+_sample_logger_failed = False
+_sample_logger_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Carrega (uma vez) o modelo de INTENT_CLASSIFIER_MODEL_PATH. Retorna None se não estiver configurado."""
+    global _intent_classifier, _intent_classifier_loaded
+    if not _intent_classifier_loaded:
+        from app.core.config import settings
+
+        _intent_classifier_loaded = True
+        model_path = settings.INTENT_CLASSIFIER_MODEL_PATH
+        if model_path:
+            try:
+                _intent_classifier = IntentClassifier.load(model_path)
+                logger.info("Classificador local de intenção carregado de '%s' (%d features).", model_path, len(_intent_classifier.idf))
+            except Exception as e:
+                logger.error("Não foi possível carregar o classificador de intenção de '%s': %s", model_path, e)
+    return _intent_classifier
+
+
+def _get_sample_logger() -> Optional[logging.Logger]:
+    """
+    Logger das amostras: só enfileira (NonBlockingQueueHandler, descarta com a fila cheia) e um QueueListener próprio
+    grava o JSONL com rotação diária, mantendo INTENT_CLASSIFIER_LOG_RETENTION_DAYS arquivos. Não propaga para o
+    root, então o texto do paciente não vai para o stdout da aplicação.
+    """
+    global _sample_logger, _sample_listener, _sample_logger_failed
+    if _sample_logger is not None or _sample_logger_failed:
+        return _sample_logger
+    from app.core.config import settings
+    from app.core.logging_config import NonBlockingQueueHandler
+
+    with _sample_logger_lock:
+        if _sample_logger is None and not _sample_logger_failed:
+            log_path = settings.INTENT_CLASSIFIER_LOG_PATH
+            try:
+                file_handler = TimedRotatingFileHandler(
+                    log_path, when="midnight", backupCount=settings.INTENT_CLASSIFIER_LOG_RETENTION_DAYS, encoding="utf-8"
+                )
+            except OSError as e:
+                logger.warning("Não foi possível abrir o registro de amostras de intenção em '%s': %s", log_path, e)
+                _sample_logger_failed = True
+                return None
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_SIZE)
+            sample_logger = logging.getLogger(f"{__name__}.samples")
+            sample_logger.propagate = False
+            sample_logger.setLevel(logging.INFO)
+            sample_logger.addHandler(NonBlockingQueueHandler(log_queue))
+            _sample_listener = QueueListener(log_queue, file_handler)
+            _sample_listener.start()
+            atexit.register(_sample_listener.stop)
+            _sample_logger = sample_logger
+    return _sample_logger
+
+
+def log_intent_sample(message: str, category: str) -> None:
+    """
+    Enfileira o par (mensagem, categoria) decidido pelo LLM para treinos futuros, se INTENT_CLASSIFIER_LOG_ENABLED.
+    Não faz I/O no thread do nó: a gravação é do QueueListener das amostras.
+    """
+    from app.core.config import settings
+
+    if not settings.INTENT_CLASSIFIER_LOG_ENABLED or category not in INTENT_CATEGORIES:
+        return
+    sample_logger = _get_sample_logger()
+    if sample_logger is not None:
+        sample_logger.info("%s", json.dumps({"message": message, "category": category, "ts": time.time()}, ensure_ascii=False))
+
+
+def _split(samples: List[Tuple[str, str]], test_fraction: float, seed: int) -> Tuple[list, list]:
+    shuffled = list(samples)
+    random.Random(seed).shuffle(shuffled)
+    n_test = int(len(shuffled) * test_fraction)
+    return shuffled[n_test:], shuffled[:n_test]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treino e avaliação do classificador local de intenção.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Treina um modelo a partir de um JSONL de (message, category).")
+    train_parser.add_argument("--data", required=True)
+    train_parser.add_argument("--output", required=True)
+    train_parser.add_argument("--epochs", type=int, default=30)
+    train_parser.add_argument("--learning-rate", type=float, default=0.5)
+    train_parser.add_argument("--l2", type=float, default=1e-4)
+    train_parser.add_argument("--min-df", type=int, default=1)
+    train_parser.add_argument("--test-fraction", type=float, default=0.2, help="Fração separada para avaliação (0 para usar tudo).")
+    train_parser.add_argument("--threshold", type=float, default=0.85)
+    train_parser.add_argument("--seed", type=int, default=13)
+
+    eval_parser = subparsers.add_parser("evaluate", help="Avalia um modelo salvo em um JSONL rotulado.")
+    eval_parser.add_argument("--data", required=True)
+    eval_parser.add_argument("--model", required=True)
+    eval_parser.add_argument("--threshold", type=float, default=0.85)
+
+    predict_parser = subparsers.add_parser("predict", help="Classifica mensagens avulsas.")
+    predict_parser.add_argument("--model", required=True)
+    predict_parser.add_argument("messages", nargs="+")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "train":
+        all_samples = load_samples(args.data)
+        train_samples, test_samples = _split(all_samples, args.test_fraction, args.seed)
+        print(f"Amostras: {len(all_samples)} (treino {len(train_samples)}, teste {len(test_samples)})")
+        print(f"Distribuição: {dict(Counter(label for _, label in all_samples))}")
+        trained = train_intent_classifier(
+            train_samples, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2, min_df=args.min_df, seed=args.seed
+        )
+        trained.save(args.output)
+        print(f"Modelo salvo em {args.output} ({os.path.getsize(args.output) / 1024:.1f} KiB)")
+        if test_samples:
+            print(json.dumps(evaluate_intent_classifier(trained, test_samples, args.threshold), indent=2, ensure_ascii=False))
+    elif args.command == "evaluate":
+        loaded = IntentClassifier.load(args.model)
+        print(json.dumps(evaluate_intent_classifier(loaded, load_samples(args.data), args.threshold), indent=2, ensure_ascii=False))
+    else:
+        loaded = IntentClassifier.load(args.model)
+        for message in args.messages:
+            label, confidence = loaded.classify(message)
+            print(f"{confidence:.3f}  {label}  <- {message}")
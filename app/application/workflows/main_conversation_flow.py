@@ -1,12 +1,14 @@
 import logging
 import json
 import re
+import time as time_module
 import requests
 
-from datetime import datetime, date, timedelta, time
+from datetime import datetime, date, timedelta, time, timezone
 from functools import partial
 from typing import Optional, List, Dict
 from app.core.config import settings
+from app.core.logging_config import summarize_state
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
@@ -16,6 +18,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from .main_workflow_state import MainWorkflowState
 from app.application.services.conversation_service import (
     categorize_intent_service,
+    compact_message_history,
+    expire_idle_session,
     generate_greeting_farewell_service,
     get_last_user_message_content
 )
@@ -40,8 +44,16 @@ from app.application.prompts.conversation_prompts import (
     SCHEDULING_SUCCESS_MESSAGE_PROMPT_TEMPLATE,
     VALIDATE_FALLBACK_CHOICE_PROMPT_TEMPLATE
 )
+from app.application.prompts.prompt_identification import prompt_config
 from app.domain.models.user_profile import FullNameModel
-from app.infrastructure.llm_clients import get_llm_client
+from app.infrastructure.checkpointer import flush_checkpointer
+from app.infrastructure.clients.apphealth_client import get_apphealth_client
+from app.infrastructure.llm_accounting import TokenAccountingCallbackHandler
+from app.infrastructure.llm_clients import get_node_llm_client
+from app.infrastructure.metrics import GRAPH_TURN_DURATION, get_graph_node_metrics_handler
+from app.infrastructure.professional_catalog import get_professional_catalog
+from app.infrastructure.slow_turns import TurnRecorder, current_turn_recorder, finish_turn
+from app.infrastructure.tracing import TracedStateGraph, http_client_span, inject_trace_headers, record_http_response
 
 logger = logging.getLogger(__name__)
 
@@ -89,7 +101,7 @@ def solicitar_nome_agendamento_node(state: MainWorkflowState, llm_client: ChatOp
     
     prompt = REQUEST_FULL_NAME_PROMPT_TEMPLATE.format_messages()
     logger.debug(f"Gerando solicitação de nome completo com o LLM. Prompt: {prompt}")
-    ai_response = llm_client.invoke(prompt)
+    ai_response = llm_client.invoke(prompt, config=prompt_config("REQUEST_FULL_NAME"))
     resposta_llm = ai_response.content.strip()
     logger.info(f"Resposta do LLM para solicitação de nome completo: {resposta_llm}")
 
@@ -99,17 +111,18 @@ def solicitar_nome_agendamento_node(state: MainWorkflowState, llm_client: ChatOp
         "current_operation": "SCHEDULING"
     }
 
-def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     """
     Nó para coletar a resposta do usuário, extrair o nome e validá-lo.
     """
     logger.debug("--- Nó Agendamento: coletar_validar_nome_agendamento_node ---")
+    classifier_llm = classifier_llm_client or llm_client
     user_message_content = get_last_user_message_content(state["messages"])
 
     if not user_message_content:
         logger.warning("Nenhuma resposta do usuário para coletar/validar o nome.")
         reprompt_messages = REQUEST_FULL_NAME_PROMPT_TEMPLATE.format_messages()
-        ai_reprompt_response = llm_client.invoke(reprompt_messages)
+        ai_reprompt_response = llm_client.invoke(reprompt_messages, config=prompt_config("REQUEST_FULL_NAME"))
         return {
             "response_to_user": "Não recebi seu nome. " + ai_reprompt_response.content.strip(),
             "scheduling_step": "VALIDATING_FULL_NAME", 
@@ -122,7 +135,7 @@ def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client:
     extracted_name = "NOME_NAO_IDENTIFICADO"
     try:
         extraction_prompt_messages = EXTRACT_FULL_NAME_PROMPT_TEMPLATE.format_messages(user_message=user_message_content)
-        llm_extraction_response = llm_client.invoke(extraction_prompt_messages)
+        llm_extraction_response = classifier_llm.invoke(extraction_prompt_messages, config=prompt_config("EXTRACT_FULL_NAME"))
         extracted_name = llm_extraction_response.content.strip()
         logger.info(f"Nome extraído pelo LLM: '{extracted_name}' (da entrada: '{user_message_content}')")
     except Exception as e:
@@ -136,7 +149,7 @@ def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client:
     if not extracted_name or extracted_name == "NOME_NAO_IDENTIFICADO":
         logger.warning(f"LLM não conseguiu extrair um nome válido da entrada: '{user_message_content}'. Retorno do LLM: '{extracted_name}'")
         reprompt_messages = REQUEST_FULL_NAME_PROMPT_TEMPLATE.format_messages()
-        ai_reprompt_response = llm_client.invoke(reprompt_messages)
+        ai_reprompt_response = llm_client.invoke(reprompt_messages, config=prompt_config("REQUEST_FULL_NAME"))
         return {
             "response_to_user": "Não consegui identificar um nome válido na sua resposta. " + ai_reprompt_response.content.strip(),
             "scheduling_step": "VALIDATING_FULL_NAME",
@@ -149,7 +162,7 @@ def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client:
         logger.info(f"Nome extraído e validado com sucesso: {final_validated_name}")
 
         prompt_messages_especialidade = REQUEST_SPECIALTY_PROMPT_TEMPLATE.format_messages(user_name=final_validated_name)
-        ai_response_especialidade = llm_client.invoke(prompt_messages_especialidade)
+        ai_response_especialidade = llm_client.invoke(prompt_messages_especialidade, config=prompt_config("REQUEST_SPECIALTY"))
         pergunta_especialidade = ai_response_especialidade.content.strip()
         logger.info(f"Pergunta sobre especialidade gerada após validar nome: '{pergunta_especialidade}'")
         
@@ -183,8 +196,9 @@ def coletar_validar_nome_agendamento_node(state: MainWorkflowState, llm_client:
             "current_operation": "SCHEDULING"
         }
 
-def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     logger.debug("--- Nó Agendamento: coletar_validar_especialidade_node ---")
+    classifier_llm = classifier_llm_client or llm_client
     messages = state.get("messages", [])
     last_user_message = messages[-1].content if messages and isinstance(messages[-1], HumanMessage) else ""
     user_full_name = state.get("user_full_name", "Prezado(a) cliente")
@@ -203,12 +217,13 @@ def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: Cha
         "Authorization": f"{api_token}",
         "Content-Type": "application/json"
     }
-    url_especialidades_todas = "https://back.homologacao.apphealth.com.br:9090/api-vizi/especialidades"
+    apphealth_client = get_apphealth_client()
+    url_especialidades_todas = apphealth_client.url("especialidades")
     especialidades_api_list = []
     nomes_especialidades_oficiais = []
 
     try:
-        response = requests.get(url_especialidades_todas, headers=api_headers, timeout=10)
+        response = apphealth_client.get("especialidades", headers=api_headers, timeout=10)
         response.raise_for_status()
         especialidades_api_list = response.json()
 
@@ -247,7 +262,7 @@ def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: Cha
     )
     cleaned_specialty_name = ""
     try:
-        validated_specialty_response = llm_client.invoke(prompt_validate_specialty_messages)
+        validated_specialty_response = classifier_llm.invoke(prompt_validate_specialty_messages, config=prompt_config("VALIDATE_SPECIALTY"))
         cleaned_specialty_name = validated_specialty_response.content.strip()
         logger.info(f"Resultado da validação/classificação da entrada de especialidade: '{cleaned_specialty_name}' para entrada '{last_user_message}'")
 
@@ -289,7 +304,7 @@ def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: Cha
     )
 
     try:
-        match_response = llm_client.invoke(prompt_match_specialty_messages)
+        match_response = classifier_llm.invoke(prompt_match_specialty_messages, config=prompt_config("MATCH_OFFICIAL_SPECIALTY"))
         nome_especialidade_llm_match = match_response.content.strip()
         logger.info(f"LLM de correspondência sugeriu: '{nome_especialidade_llm_match}' para a entrada normalizada '{cleaned_specialty_name}'")
 
@@ -313,7 +328,7 @@ def coletar_validar_especialidade_node(state: MainWorkflowState, llm_client: Cha
                     user_name=user_full_name,
                     user_specialty=official_specialty_name
                 )
-                next_question_response = llm_client.invoke(next_question_prompt)
+                next_question_response = llm_client.invoke(next_question_prompt, config=prompt_config("REQUEST_PROFESSIONAL_PREFERENCE"))
                 response_text_for_user = next_question_response.content.strip()
 
                 return {
@@ -354,7 +369,7 @@ def solicitar_preferencia_profissional_node(state: MainWorkflowState, llm_client
         user_name=user_name, 
         user_specialty=user_specialty
     )
-    ai_response = llm_client.invoke(prompt_messages)
+    ai_response = llm_client.invoke(prompt_messages, config=prompt_config("REQUEST_PROFESSIONAL_PREFERENCE"))
     pergunta_preferencia = ai_response.content.strip()
     logger.info(f"Pergunta sobre preferência de profissional gerada: '{pergunta_preferencia}'")
 
@@ -388,7 +403,7 @@ def coletar_classificar_preferencia_profissional_node(state: MainWorkflowState,
     )
     
     try:
-        llm_classification_response_str = llm_client.invoke(prompt_messages).content.strip()
+        llm_classification_response_str = llm_client.invoke(prompt_messages, config=prompt_config("CLASSIFY_PROFESSIONAL_PREFERENCE")).content.strip()
         logger.debug(f"Resposta de classificação do LLM (raw): {llm_classification_response_str}")
         
         match = re.search(r'\{.*\}', llm_classification_response_str, re.DOTALL)
@@ -445,9 +460,11 @@ def coletar_classificar_preferencia_profissional_node(state: MainWorkflowState,
 async def processing_professional_logic_node(
     state: MainWorkflowState,
     *, 
-    llm_client: ChatOpenAI
+    llm_client: ChatOpenAI,
+    classifier_llm_client: Optional[ChatOpenAI] = None
 ) -> dict:
-    logger.debug(f"--- Nó Agendamento: processing_professional_logic_node. Estado: {state} ---")
+    logger.debug("--- Nó Agendamento: processing_professional_logic_node. Estado: %s ---", summarize_state(state))
+    classifier_llm = classifier_llm_client or llm_client
     
     preference_type = state.get("professional_preference_type")
     user_typed_name = state.get("user_provided_professional_name") 
@@ -482,12 +499,12 @@ async def processing_professional_logic_node(
 
         api_token = settings.APPHEALTH_API_TOKEN
         api_headers = {"Authorization": f"{api_token}", "Content-Type": "application/json"}
-        url_prof_especialidade = f"https://back.homologacao.apphealth.com.br:9090/api-vizi/profissionais"
+        apphealth_client = get_apphealth_client()
         params_prof = {"status": "true", "especialidadeId": user_chosen_specialty_id} 
         
         lista_profissionais_da_especialidade_api = []
         try:
-            response_prof = requests.get(url_prof_especialidade, headers=api_headers, params=params_prof, timeout=10)
+            response_prof = apphealth_client.get("profissionais", headers=api_headers, params=params_prof, timeout=10)
             response_prof.raise_for_status()
             lista_profissionais_da_especialidade_api = response_prof.json() 
         except requests.exceptions.RequestException as e:
@@ -519,7 +536,7 @@ async def processing_professional_logic_node(
                 user_typed_name=cleaned_user_typed_name, 
                 professional_names_from_api_list_str=", ".join(nomes_api_para_match)
             )
-            llm_match_response = llm_client.invoke(match_name_prompt_messages)
+            llm_match_response = classifier_llm.invoke(match_name_prompt_messages, config=prompt_config("MATCH_SPECIFIC_PROFESSIONAL_NAME"))
             matched_name_from_llm = llm_match_response.content.strip().strip('.').strip(',') 
             logger.info(f"LLM de correspondência de nome sugeriu (e foi limpo para): '{matched_name_from_llm}' para a entrada limpa '{cleaned_user_typed_name}'")
 
@@ -549,7 +566,7 @@ async def processing_professional_logic_node(
                 user_name=user_full_name,
                 professional_name_or_specialty_based=official_prof_name
             )
-            updates_for_state["response_to_user"] = llm_client.invoke(turn_request_prompt).content.strip()
+            updates_for_state["response_to_user"] = llm_client.invoke(turn_request_prompt, config=prompt_config("REQUEST_TURN_PREFERENCE")).content.strip()
             
         else: 
             logger.warning(f"Nome '{user_typed_name}' (LLM match: '{matched_name_from_llm}') não validado ou não encontrado na API para especialidade {user_specialty_name}.")
@@ -570,7 +587,7 @@ async def processing_professional_logic_node(
             user_name=user_full_name, 
             user_specialty=user_specialty_name
         )
-        updates_for_state["response_to_user"] = llm_client.invoke(prompt_ask_name_messages).content.strip()
+        updates_for_state["response_to_user"] = llm_client.invoke(prompt_ask_name_messages, config=prompt_config("REQUEST_SPECIFIC_PROFESSIONAL_NAME")).content.strip()
         updates_for_state["scheduling_step"] = "CLASSIFYING_PROFESSIONAL_PREFERENCE" 
         
     else: 
@@ -581,7 +598,7 @@ async def processing_professional_logic_node(
         )
         updates_for_state["scheduling_step"] = "CLASSIFYING_PROFESSIONAL_PREFERENCE" 
 
-    logger.info(f"Atualizações do processing_professional_logic_node: {updates_for_state}")
+    logger.info("Atualizações do processing_professional_logic_node: %s", summarize_state(updates_for_state))
     return updates_for_state
 
 def solicitar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
@@ -599,7 +616,7 @@ def solicitar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> di
         user_name=user_name,
         professional_name_or_specialty_based=professional_for_prompt
     )
-    ai_response = llm_client.invoke(prompt_messages)
+    ai_response = llm_client.invoke(prompt_messages, config=prompt_config("REQUEST_TURN_PREFERENCE"))
     pergunta_turno = ai_response.content.strip()
     logger.info(f"Pergunta sobre turno gerada: '{pergunta_turno}'")
 
@@ -609,6 +626,47 @@ def solicitar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> di
         "current_operation": "SCHEDULING"
     }
 
+def _presented_professionals(state: MainWorkflowState) -> List[Dict]:
+    """
+    Resolve `available_professionals_list` (ids, na ordem apresentada) para [{"id", "nome"}] pelo catálogo em cache.
+    Ids fora do cache (outro worker, TTL vencido) fazem uma nova consulta à API da especialidade. Ids que nem assim
+    se resolvem (profissional desativado depois da apresentação) ficam como {"id", "nome": None}, para a numeração
+    continuar a que o paciente viu. Checkpoints antigos, que guardavam os dicts, são devolvidos como estão.
+    """
+    presented = state.get("available_professionals_list") or []
+    if not presented or isinstance(presented[0], dict):
+        return list(presented)
+
+    catalog = get_professional_catalog()
+    names = catalog.names_for(presented)
+    specialty_id = state.get("user_chosen_specialty_id")
+    if len(names) < len(presented) and specialty_id:
+        logger.info("Catálogo de profissionais sem %d de %d ids; consultando a API para a especialidade %s.", len(presented) - len(names), len(presented), specialty_id)
+        try:
+            response = get_apphealth_client().get(
+                "profissionais",
+                headers={"Authorization": settings.APPHEALTH_API_TOKEN},
+                params={"especialidadeId": specialty_id, "status": "true"},
+                timeout=10,
+            )
+            response.raise_for_status()
+            catalog.put_many(response.json() or [])
+            names = catalog.names_for(presented)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Falha ao recarregar o catálogo de profissionais: %s", e)
+    return [{"id": professional_id, "nome": names.get(professional_id)} for professional_id in presented]
+
+def _presented_time_slots(presented: Optional[List]) -> List[Dict[str, str]]:
+    """Expande `available_times_presented` ([horaInicio, horaFim] da API) para os dicts usados na validação."""
+    slots = []
+    for entry in presented or []:
+        if isinstance(entry, dict):  # checkpoints antigos guardavam os dicts completos
+            slots.append(entry)
+        else:
+            hora_inicio, hora_fim = entry
+            slots.append({"display": hora_inicio[:5], "horaInicio_api": hora_inicio, "horaFim_api": hora_fim})
+    return slots
+
 def list_available_professionals_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
     """
     Busca profissionais disponíveis para a especialidade escolhida e os apresenta.
@@ -631,7 +689,7 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
             "Você é um assistente de agendamento. Informe ao usuário {user_name} que ocorreu um problema "
             "ao tentar identificar a especialidade para buscar os profissionais e que será necessário tentar novamente a seleção da especialidade."
         )
-        error_response_content = llm_client.invoke(error_prompt.format_messages(user_name=user_full_name)).content.strip()
+        error_response_content = llm_client.invoke(error_prompt.format_messages(user_name=user_full_name), config=prompt_config("SPECIALTY_NOT_FOUND_ERROR")).content.strip()
         return {
             "response_to_user": error_response_content,
             "scheduling_step": "VALIDATING_SPECIALTY",
@@ -640,12 +698,13 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
             "available_professionals_list": None
         }
 
-    url = "https://back.homologacao.apphealth.com.br:9090/api-vizi/profissionais"
+    apphealth_client = get_apphealth_client()
+    url = apphealth_client.url("profissionais")
     params = {"especialidadeId": specialty_id, "status": "true"}
     logger.info(f"Consultando API de profissionais: {url} com params: {params}")
 
     try:
-        response = requests.get(url, headers=api_headers, params=params, timeout=10)
+        response = apphealth_client.get("profissionais", headers=api_headers, params=params, timeout=10)
         response.raise_for_status()
         professionals_api_data = response.json()
 
@@ -656,7 +715,8 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
                 "para a especialidade {specialty_name}. Pergunte se ele gostaria de tentar outra especialidade ou nomear um profissional específico."
             )
             no_professionals_response = llm_client.invoke(
-                no_professionals_prompt.format_messages(user_name=user_full_name, specialty_name=specialty_name)
+                no_professionals_prompt.format_messages(user_name=user_full_name, specialty_name=specialty_name),
+                config=prompt_config("NO_PROFESSIONALS_FOUND"),
             ).content.strip()
             return {
                 "response_to_user": no_professionals_response,
@@ -679,6 +739,8 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
                 "available_professionals_list": []
             }
 
+        get_professional_catalog().put_many(simplified_professionals_list)
+
         max_to_show = 5
         professionals_to_show = simplified_professionals_list[:max_to_show]
         
@@ -709,14 +771,15 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
                 user_name=user_full_name,
                 specialty_name=specialty_name,
                 list_of_professional_names_str=names_list_for_prompt.strip()
-            )
+            ),
+            config=prompt_config("PRESENT_PROFESSIONALS"),
         ).content.strip()
 
         return {
             "response_to_user": presentation_message,
             "scheduling_step": "VALIDATING_CHOSEN_PROFESSIONAL_FROM_LIST",
             "current_operation": "SCHEDULING",
-            "available_professionals_list": simplified_professionals_list # Salva a lista completa com IDs
+            "available_professionals_list": [prof["id"] for prof in simplified_professionals_list]  # só os ids; nomes no catálogo
         }
 
     except requests.exceptions.HTTPError as e:
@@ -743,14 +806,15 @@ def list_available_professionals_node(state: MainWorkflowState, llm_client: Chat
             "current_operation": "SCHEDULING"
         }
 
-def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     """
     Coleta a escolha do usuário da lista de profissionais apresentada e a valida.
     """
     logger.debug("--- Nó Agendamento: collect_validate_chosen_professional_node ---")
+    classifier_llm = classifier_llm_client or llm_client
     user_response_content = get_last_user_message_content(state["messages"]).strip()
     
-    professionals_shown_list = state.get("available_professionals_list", []) 
+    professionals_shown_list = _presented_professionals(state)
     user_full_name = state.get("user_full_name", "Paciente")
 
     if not user_response_content:
@@ -780,6 +844,13 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
         choice_num = int(user_response_content)
         if 1 <= choice_num <= len(professionals_shown_list):
             selected = professionals_shown_list[choice_num - 1]
+            if not selected.get("nome"):
+                logger.warning("Profissional %s escolhido pelo número %d não está mais disponível; listando novamente.", selected.get("id"), choice_num)
+                return {
+                    "response_to_user": f"Desculpe, {user_full_name}, o profissional de número {choice_num} não está mais disponível. Vou buscar a lista atualizada de profissionais.",
+                    "scheduling_step": "LISTING_AVAILABLE_PROFESSIONALS",
+                    "current_operation": "SCHEDULING"
+                }
             chosen_prof_id = selected.get("id")
             chosen_prof_name = selected.get("nome")
     except ValueError:
@@ -794,7 +865,7 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
                     user_typed_name=cleaned_user_response,
                     professional_names_from_api_list_str=professional_names_from_api_list_str
                 )
-                llm_match_response = llm_client.invoke(match_name_prompt_messages)
+                llm_match_response = classifier_llm.invoke(match_name_prompt_messages, config=prompt_config("MATCH_SPECIFIC_PROFESSIONAL_NAME"))
                 matched_name_from_llm = llm_match_response.content.strip().strip('.').strip(',')
                 logger.info(f"LLM de correspondência de nome em collect_validate_chosen_professional_node sugeriu: '{matched_name_from_llm}' para a entrada '{cleaned_user_response}'")
 
@@ -834,7 +905,8 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
                         user_name=user_full_name, 
                         user_input=cleaned_user_response,
                         matched_names_list_str=matched_names_for_prompt
-                    )
+                    ),
+                    config=prompt_config("AMBIGUOUS_PROFESSIONAL_CHOICE"),
                 ).content.strip()
                 return {
                     "response_to_user": ambiguous_response,
@@ -848,7 +920,7 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
             user_name=user_full_name,
             professional_name_or_specialty_based=chosen_prof_name
         )
-        next_question_response = llm_client.invoke(next_question_prompt)
+        next_question_response = llm_client.invoke(next_question_prompt, config=prompt_config("REQUEST_TURN_PREFERENCE"))
         response_text_for_user = next_question_response.content.strip()
         
         return_state = {
@@ -859,7 +931,7 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
             "current_operation": "SCHEDULING",
             "available_professionals_list": None 
         }
-        logger.debug(f"Retornando de collect_validate_chosen_professional_node (SUCESSO): {return_state}")
+        logger.debug("Retornando de collect_validate_chosen_professional_node (SUCESSO): %s", summarize_state(return_state))
         return return_state
     else:
         logger.warning(f"Escolha do profissional '{user_response_content}' não validada (nem por número, nem LLM, nem substring).")
@@ -879,14 +951,15 @@ def collect_validate_chosen_professional_node(state: MainWorkflowState, llm_clie
                 user_name=user_full_name, 
                 user_input=user_response_content,
                 original_list_str=original_list_for_reprompt
-                )
+                ),
+            config=prompt_config("INVALID_PROFESSIONAL_CHOICE"),
         ).content.strip()
         return_state_failure = {
             "response_to_user": invalid_response, # Certifique-se que invalid_response é só a mensagem de erro correta
             "scheduling_step": "VALIDATING_CHOSEN_PROFESSIONAL_FROM_LIST",
             "current_operation": "SCHEDULING"
         }
-        logger.debug(f"Retornando de collect_validate_chosen_professional_node (FALHA VALIDAÇÃO): {return_state_failure}")
+        logger.debug("Retornando de collect_validate_chosen_professional_node (FALHA VALIDAÇÃO): %s", summarize_state(return_state_failure))
         return return_state_failure
 
 def collect_validate_chosen_date_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
@@ -932,7 +1005,7 @@ def collect_validate_chosen_date_node(state: MainWorkflowState, llm_client: Chat
             user_response=user_response_content,
             date_options_internal_list_str=date_options_internal_list_str
         )
-        llm_response = llm_client.invoke(prompt_messages).content.strip()
+        llm_response = llm_client.invoke(prompt_messages, config=prompt_config("VALIDATE_CHOSEN_DATE")).content.strip()
         logger.info(f"LLM para validação de data retornou: '{llm_response}'")
         
         if llm_response in available_dates_api_format:
@@ -983,18 +1056,20 @@ def fetch_and_present_available_times_node(state: MainWorkflowState, llm_client:
             "scheduling_step": "SCHEDULING_ERROR" 
         }
 
-    api_url = f"https://back.homologacao.apphealth.com.br:9090/api-vizi/agenda/profissionais/{professional_id}/horarios"
+    apphealth_client = get_apphealth_client()
+    api_path = f"agenda/profissionais/{professional_id}/horarios"
+    api_url = apphealth_client.url(api_path)
     headers = {"Authorization": settings.APPHEALTH_API_TOKEN} 
     params = {"data": chosen_date_str}
 
     response_to_user = ""
     next_scheduling_step = "AWAITING_TIME_CHOICE"
-    available_times_presented_for_state: List[Dict[str, str]] = []
+    available_times_presented_for_state: List[List[str]] = []
 
 
     try:
         logger.info(f"Chamando API de horários: GET {api_url} com params: {params}")
-        api_response = requests.get(api_url, headers=headers, params=params, timeout=10)
+        api_response = apphealth_client.get(api_path, headers=headers, params=params, timeout=10)
         api_response.raise_for_status()
         available_slots_from_api = api_response.json() 
         logger.info(f"API de horários retornou {len(available_slots_from_api)} slots.")
@@ -1035,14 +1110,15 @@ def fetch_and_present_available_times_node(state: MainWorkflowState, llm_client:
                  response_to_user = f"Desculpe, {user_full_name}, após filtrar pelo turno da {chosen_turn.lower()}, não encontramos horários disponíveis para {professional_name} no dia {datetime.strptime(chosen_date_str, '%Y-%m-%d').strftime('%d/%m/%Y')}. Gostaria de tentar outro turno ou data?"
                  next_scheduling_step = "VALIDATING_TURN_PREFERENCE" 
             else:
-                available_times_presented_for_state = sorted_unique_slots[:3]
-                
-                if not available_times_presented_for_state:
+                presented_slots = sorted_unique_slots[:3]
+                available_times_presented_for_state = [[slot["horaInicio_api"], slot["horaFim_api"]] for slot in presented_slots]
+
+                if not presented_slots:
                     response_to_user = f"Desculpe, {user_full_name}, não consegui encontrar horários para o turno da {chosen_turn.lower()} no dia {datetime.strptime(chosen_date_str, '%Y-%m-%d').strftime('%d/%m/%Y')} para {professional_name}. Gostaria de tentar outra data ou turno?"
                     next_scheduling_step = "VALIDATING_TURN_PREFERENCE"
                 else:
                     times_list_for_prompt_display = [
-                        f"{i+1}. {slot_data['display']}" for i, slot_data in enumerate(available_times_presented_for_state)
+                        f"{i+1}. {slot_data['display']}" for i, slot_data in enumerate(presented_slots)
                     ]
                     times_list_str = "\n".join(times_list_for_prompt_display)
                     
@@ -1076,11 +1152,12 @@ def fetch_and_present_available_times_node(state: MainWorkflowState, llm_client:
         "messages": AIMessage(content=response_to_user) 
     }
 
-def coletar_validar_horario_escolhido_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def coletar_validar_horario_escolhido_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     logger.info(f"--- Nó: coletar_validar_horario_escolhido_node (Session ID: {state.get('session_id', 'N/A')}) ---")
+    classifier_llm = classifier_llm_client or llm_client
     user_response_content = get_last_user_message_content(state["messages"])
     
-    available_times_details_list = state.get("available_times_presented", []) 
+    available_times_details_list = _presented_time_slots(state.get("available_times_presented"))
     user_full_name = state.get("user_full_name", "Paciente")
     chosen_specialty = state.get("user_chosen_specialty", "a especialidade")
     chosen_professional_name = state.get("user_chosen_professional_name", "o profissional")
@@ -1118,7 +1195,7 @@ def coletar_validar_horario_escolhido_node(state: MainWorkflowState, llm_client:
             user_response=user_response_content,
             time_options_internal_list_str=time_options_internal_list_str
         )
-        llm_response = llm_client.invoke(prompt_messages)
+        llm_response = classifier_llm.invoke(prompt_messages, config=prompt_config("VALIDATE_CHOSEN_TIME"))
         chosen_time_display_from_llm = llm_response.content.strip() 
         logger.info(f"LLM para validação de horário (display HH:MM) retornou: '{chosen_time_display_from_llm}'")
     except Exception as e:
@@ -1152,7 +1229,7 @@ def coletar_validar_horario_escolhido_node(state: MainWorkflowState, llm_client:
                 chosen_date_display=chosen_date_display_for_confirmation,
                 chosen_time=user_chosen_time_hhmm
             )
-            confirmation_response = llm_client.invoke(confirmation_prompt_messages)
+            confirmation_response = llm_client.invoke(confirmation_prompt_messages, config=prompt_config("FINAL_SCHEDULING_CONFIRMATION"))
             response_text_for_user = confirmation_response.content.strip()
         except Exception as e:
             logger.error(f"Erro ao gerar mensagem de confirmação final: {e}")
@@ -1259,7 +1336,7 @@ def check_cancellation_node(state: MainWorkflowState, llm_client: ChatOpenAI) ->
 
     try:
         prompt_messages = CHECK_CANCELLATION_PROMPT_TEMPLATE.format_messages(user_message=user_message_content)
-        llm_response = llm_client.invoke(prompt_messages)
+        llm_response = llm_client.invoke(prompt_messages, config=prompt_config("CHECK_CANCELLATION"))
         cancellation_intent = llm_response.content.strip().upper()
         logger.info(f"Verificação de cancelamento para '{user_message_content}': LLM respondeu '{cancellation_intent}'")
 
@@ -1268,10 +1345,12 @@ def check_cancellation_node(state: MainWorkflowState, llm_client: ChatOpenAI) ->
             user_phone_from_state = state.get("user_phone")
 
             if user_phone_from_state:
-                n8n_webhook_url_cancel = f"https://n8n-server.apphealth.com.br/webhook/remove-tag?phone={user_phone_from_state}"
+                n8n_webhook_url_cancel = f"{settings.N8N_BASE_URL}/webhook/remove-tag?phone={user_phone_from_state}"
                 logger.info(f"Tentando chamar webhook N8N para remover tag (cancelamento): GET {n8n_webhook_url_cancel}")
                 try:
-                    response = requests.get(n8n_webhook_url_cancel, timeout=10)
+                    with http_client_span("n8n", "GET", n8n_webhook_url_cancel) as span:
+                        response = requests.get(n8n_webhook_url_cancel, headers=inject_trace_headers(), timeout=10)
+                        record_http_response(span, response.status_code)
                     response.raise_for_status()
                     logger.info(f"Webhook N8N para remover tag (cancelamento) retornou status {response.status_code}")
                 except Exception as e:
@@ -1311,7 +1390,7 @@ def process_fallback_choice_node(state: MainWorkflowState, llm_client: ChatOpenA
     """
     Processa a escolha do usuário após uma situação de fallback no agendamento, usando LLM para interpretação.
     """
-    logger.debug(f"--- Nó: process_fallback_choice_node (LLM). Estado: {state} ---")
+    logger.debug("--- Nó: process_fallback_choice_node (LLM). Estado: %s ---", summarize_state(state))
     user_message_content = get_last_user_message_content(state.get("messages", []))
     user_full_name = state.get("user_full_name", "Prezado(a) cliente")
     previous_step = state.get("previous_scheduling_step")
@@ -1383,7 +1462,7 @@ def process_fallback_choice_node(state: MainWorkflowState, llm_client: ChatOpenA
             cancel_option_text=cancel_option_text_for_llm
         )
         logger.debug(f"Prompt para LLM de validação de fallback: {prompt_llm}")
-        llm_response_obj = llm_client.invoke(prompt_llm)
+        llm_response_obj = llm_client.invoke(prompt_llm, config=prompt_config("VALIDATE_FALLBACK_CHOICE"))
         llm_classification = llm_response_obj.content.strip().upper()
         logger.info(f"LLM classificou a escolha de fallback como: '{llm_classification}' para a entrada '{user_message_content}'")
     except Exception as e:
@@ -1467,12 +1546,13 @@ def process_fallback_choice_node(state: MainWorkflowState, llm_client: ChatOpenA
 
 # === consultas api ===
 
-def coletar_validar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def coletar_validar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     """
     Nó para coletar a resposta do usuário sobre o turno e validá-la.
     Inspirado em agentv1.py (processar_input_turno).
     """
     logger.debug("--- Nó Agendamento: coletar_validar_turno_node ---")
+    classifier_llm = classifier_llm_client or llm_client
     user_response_content = get_last_user_message_content(state["messages"])
 
     if not user_response_content:
@@ -1504,8 +1584,8 @@ def coletar_validar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI)
     prompt_template_turno = ChatPromptTemplate.from_template(prompt_classificacao_turno_str)
     
     try:
-        chain_turno = prompt_template_turno | llm_client
-        llm_classification_response_str = chain_turno.invoke({"user_response": user_response_content}).content.strip().upper()
+        chain_turno = prompt_template_turno | classifier_llm
+        llm_classification_response_str = chain_turno.invoke({"user_response": user_response_content}, config=prompt_config("CLASSIFY_TURN_PREFERENCE")).content.strip().upper()
         logger.info(f"LLM classificou o turno como: '{llm_classification_response_str}' para o input '{user_response_content}'")
 
         if llm_classification_response_str == "MANHA":
@@ -1530,7 +1610,7 @@ def coletar_validar_turno_node(state: MainWorkflowState, llm_client: ChatOpenAI)
                 user_name=user_name_for_prompt,
                 professional_name_or_specialty_based=professional_for_prompt
             )
-            ai_reprompt_response = llm_client.invoke(reprompt_messages)
+            ai_reprompt_response = llm_client.invoke(reprompt_messages, config=prompt_config("REQUEST_TURN_PREFERENCE"))
             reprompt_text = ai_reprompt_response.content.strip()
 
             return {
@@ -1572,7 +1652,7 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
             "Você é um assistente de agendamento. Informe ao usuário {user_name} que ocorreu um problema "
             "ao tentar identificar o profissional para buscar as datas e que será necessário tentar novamente a seleção do profissional."
         )
-        error_response_content = llm_client.invoke(error_prompt.format_messages(user_name=user_full_name)).content.strip()
+        error_response_content = llm_client.invoke(error_prompt.format_messages(user_name=user_full_name), config=prompt_config("PROFESSIONAL_NOT_FOUND_ERROR")).content.strip()
         return {
             "response_to_user": error_response_content,
             "scheduling_step": "REQUESTING_PROFESSIONAL_PREFERENCE", 
@@ -1590,13 +1670,14 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
         mes_consulta = data_alvo_consulta.strftime("%m")
         ano_consulta = data_alvo_consulta.strftime("%Y")
         
-        url = f"https://back.homologacao.apphealth.com.br:9090/api-vizi/agenda/profissionais/{id_profissional}/datas"
+        api_path = f"agenda/profissionais/{id_profissional}/datas"
+        url = get_apphealth_client().url(api_path)
         params = {"mes": mes_consulta, "ano": ano_consulta}
         logger.info(f"Consultando API de datas: {url} com params: {params}")
 
         try:
             import requests
-            response = requests.get(url, headers=api_headers, params=params, timeout=10)
+            response = get_apphealth_client().get(api_path, headers=api_headers, params=params, timeout=10)
             response.raise_for_status() 
             datas_mes_api = response.json() 
 
@@ -1617,7 +1698,7 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
                 "Você é um assistente de agendamento. Informe ao usuário {user_name} que houve um problema técnico "
                 "(código de erro {status_code}) ao tentar buscar as datas disponíveis e peça para tentar mais tarde."
             )
-            error_response_content = llm_client.invoke(error_prompt_http.format_messages(user_name=user_full_name, status_code=e.response.status_code if e.response else "desconhecido")).content.strip()
+            error_response_content = llm_client.invoke(error_prompt_http.format_messages(user_name=user_full_name, status_code=e.response.status_code if e.response else "desconhecido"), config=prompt_config("AVAILABLE_DATES_HTTP_ERROR")).content.strip()
             return {
                 "response_to_user": error_response_content,
                 "scheduling_step": "REQUESTING_TURN_PREFERENCE",
@@ -1629,7 +1710,7 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
                 "Você é um assistente de agendamento. Informe ao usuário {user_name} que não foi possível conectar ao sistema "
                 "para buscar as datas e sugira verificar a conexão ou tentar mais tarde."
             )
-            error_response_content = llm_client.invoke(error_prompt_req.format_messages(user_name=user_full_name)).content.strip()
+            error_response_content = llm_client.invoke(error_prompt_req.format_messages(user_name=user_full_name), config=prompt_config("AVAILABLE_DATES_REQUEST_ERROR")).content.strip()
             return {
                 "response_to_user": error_response_content,
                 "scheduling_step": "REQUESTING_TURN_PREFERENCE",
@@ -1653,7 +1734,7 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
             "Você é um assistente de agendamento. Informe ao usuário {user_name} que, no momento, não foram encontradas datas disponíveis "
             "para o profissional {professional_name}. Pergunte se ele gostaria de tentar com outro profissional ou especialidade, ou verificar mais tarde."
         )
-        no_dates_response = llm_client.invoke(no_dates_prompt.format_messages(user_name=user_full_name, professional_name=nome_profissional)).content.strip()
+        no_dates_response = llm_client.invoke(no_dates_prompt.format_messages(user_name=user_full_name, professional_name=nome_profissional), config=prompt_config("NO_AVAILABLE_DATES")).content.strip()
         return {
             "response_to_user": no_dates_response,
             "scheduling_step": "AWAITING_RETRY_OPTION_AFTER_NO_AVAILABILITY",
@@ -1688,7 +1769,8 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
             chosen_turn=user_chosen_turn.lower(),
             professional_name=nome_profissional,
             available_dates_list_str=lista_datas_str_prompt.strip()
-        )
+        ),
+        config=prompt_config("PRESENT_AVAILABLE_DATES"),
     ).content.strip()
 
     return {
@@ -1698,11 +1780,12 @@ def fetch_and_present_available_dates_node(state: MainWorkflowState, llm_client:
         "available_dates_presented": datas_para_apresentar_api_format 
     }
 
-def process_final_scheduling_confirmation_node(state: MainWorkflowState, llm_client: ChatOpenAI) -> dict:
+def process_final_scheduling_confirmation_node(state: MainWorkflowState, llm_client: ChatOpenAI, classifier_llm_client: Optional[ChatOpenAI] = None) -> dict:
     """
     Processa a resposta do usuário à pergunta de confirmação final do agendamento.
     """
     logger.debug("--- Nó Agendamento: process_final_scheduling_confirmation_node ---")
+    classifier_llm = classifier_llm_client or llm_client
     user_response_content = get_last_user_message_content(state["messages"])
     user_full_name = state.get("user_full_name", "Cliente")
     user_phone_from_state = state.get("user_phone")
@@ -1729,7 +1812,7 @@ def process_final_scheduling_confirmation_node(state: MainWorkflowState, llm_cli
 
     try:
         prompt_messages = VALIDATE_FINAL_CONFIRMATION_PROMPT_TEMPLATE.format_messages(user_response=user_response_content)
-        llm_response = llm_client.invoke(prompt_messages)
+        llm_response = classifier_llm.invoke(prompt_messages, config=prompt_config("VALIDATE_FINAL_CONFIRMATION"))
         confirmation_status = llm_response.content.strip().upper()
         logger.info(f"Status da confirmação final pelo LLM: {confirmation_status}")
 
@@ -1784,22 +1867,25 @@ def process_final_scheduling_confirmation_node(state: MainWorkflowState, llm_cli
 
             api_token = settings.APPHEALTH_API_TOKEN
             headers = {"Authorization": f"{api_token}", "Content-Type": "application/json"}
-            api_url = "https://back.homologacao.apphealth.com.br:9090/api-vizi/agendamentos"
+            apphealth_client = get_apphealth_client()
+            api_url = apphealth_client.url("agendamentos")
 
             logger.info(f"Tentando realizar agendamento via API. URL: {api_url}, Payload: {json.dumps(payload, indent=2)}")
 
             try:
-                response = requests.post(api_url, headers=headers, json=payload, timeout=20)
+                response = apphealth_client.post("agendamentos", headers=headers, json=payload, timeout=20)
                 response.raise_for_status() 
                 api_response_data = response.json()
                 agendamento_id_api = api_response_data.get("id", "N/A") 
                 logger.info(f"Agendamento CONFIRMADO via API para {user_full_name}. ID: {agendamento_id_api}. Resposta: {api_response_data}")
 
                 if user_phone_from_state:
-                    n8n_webhook_url = f"https://n8n-server.apphealth.com.br/webhook/remove-tag?phone={user_phone_from_state}"
+                    n8n_webhook_url = f"{settings.N8N_BASE_URL}/webhook/remove-tag?phone={user_phone_from_state}"
                     logger.info(f"Tentando chamar webhook N8N para remover tag: GET {n8n_webhook_url}")
                     try:
-                        response_n8n = requests.get(n8n_webhook_url, timeout=10)
+                        with http_client_span("n8n", "GET", n8n_webhook_url) as span:
+                            response_n8n = requests.get(n8n_webhook_url, headers=inject_trace_headers(), timeout=10)
+                            record_http_response(span, response_n8n.status_code)
                         response_n8n.raise_for_status()
                         logger.info(f"Webhook N8N 'remove-tag' chamado com sucesso para {user_phone_from_state}. Status: {response_n8n.status_code}. Resposta: {response_n8n.text[:200]}")
                     except requests.exceptions.HTTPError as http_err_n8n:
@@ -1824,7 +1910,7 @@ def process_final_scheduling_confirmation_node(state: MainWorkflowState, llm_cli
                         chosen_time=hora_inicio_hhmm_str,
                         agendamento_id_api=agendamento_id_api
                     )
-                    success_response_llm = llm_client.invoke(success_prompt_messages)
+                    success_response_llm = llm_client.invoke(success_prompt_messages, config=prompt_config("SCHEDULING_SUCCESS_MESSAGE"))
                     success_message = success_response_llm.content.strip()
                     logger.info(f"Mensagem de sucesso gerada pelo LLM: '{success_message}'")
                 
@@ -1892,7 +1978,7 @@ def placeholder_fallback_node(state: MainWorkflowState, llm_client: ChatOpenAI)
     Nó de fallback para lidar com erros não recuperáveis ou intenções não claras durante uma operação.
     Oferece opções ao usuário para tentar novamente, mudar de rota ou cancelar.
     """
-    logger.debug(f"--- Nó: placeholder_fallback_node. Estado atual: {state} ---")
+    logger.debug("--- Nó: placeholder_fallback_node. Estado atual: %s ---", summarize_state(state))
     user_full_name = state.get("user_full_name", "Prezado(a) cliente")
     current_op = state.get("current_operation")
     current_step = state.get("scheduling_step") 
@@ -1953,23 +2039,31 @@ def placeholder_fallback_node(state: MainWorkflowState, llm_client: ChatOpenAI)
         response_text += "\nPor favor, digite o número da opção desejada."
 
     updates_for_state["response_to_user"] = response_text
-    logger.info(f"Placeholder fallback: Próximo passo definido como '{updates_for_state.get('scheduling_step')}'. Mensagem: '{response_text}'")
+    logger.info("Placeholder fallback: Próximo passo definido como '%s'. Mensagem: '%s'", updates_for_state.get('scheduling_step'), response_text)
     return updates_for_state
 
 # === NOVO NÓ DISPATCHER ===
 def dispatcher_node(state: MainWorkflowState) -> dict:
     """
-    Verifica se há uma operação em andamento.
-    Este nó não modifica o estado, apenas o lê para o roteamento.
+    Verifica se há uma operação em andamento, aplica o TTL da sessão e a compactação do histórico de mensagens.
+    Fora isso, este nó apenas lê o estado para o roteamento.
     Retorna um dicionário que pode ser usado pela lógica de roteamento condicional.
     """
     logger.debug("--- Nó: dispatcher_node ---")
-    current_op = state.get("current_operation")
+    now = datetime.now(timezone.utc)
+
+    # Primeiro nó de todo turno: uma sessão abandonada recomeça do zero numa única escrita, em vez de
+    # seguir pelo passo de agendamento antigo; senão o histórico do thread (telefone) é mantido na janela configurada.
+    updates = expire_idle_session(state, now)
+    if updates is None:
+        updates = compact_message_history(state.get("messages", []), state.get("history_summary"))
+        updates["current_operation"] = state.get("current_operation")
+    updates["last_activity_at"] = now.isoformat()
+
+    current_op = updates["current_operation"]
     logger.info(f"Dispatcher: Current operation = {current_op}")
-    
-    # Este nó não altera o estado, apenas retorna o que será usado para rotear.
     # A lógica de roteamento condicional usará o valor de 'current_operation'.
-    return {"current_operation": current_op} # Passa o valor para a função de roteamento
+    return updates
 
 # === LÓGICA DE ROTEAMENTO ===
 def route_initial_or_ongoing(state: MainWorkflowState) -> str:
@@ -2096,7 +2190,7 @@ def route_after_fallback_choice(state: MainWorkflowState) -> str:
     """
     Roteia após o usuário ter feito uma escolha no nó de fallback.
     """
-    logger.info(f"Roteamento após escolha de fallback. Estado: {state}")
+    logger.info("Roteamento após escolha de fallback. Estado: %s", summarize_state(state))
     next_scheduling_step = state.get("scheduling_step")
     response_to_user = state.get("response_to_user")
 
@@ -2113,32 +2207,31 @@ def route_after_fallback_choice(state: MainWorkflowState) -> str:
 # === CONSTRUÇÃO DO GRAFO ===
 def get_main_conversation_graph_definition() -> StateGraph:
     logger.info("Definindo a estrutura do grafo principal da conversa (sem subgrafos)")
-    workflow_builder = StateGraph(MainWorkflowState)
-    llm_instance = get_llm_client()
+    workflow_builder = TracedStateGraph(MainWorkflowState)
 
     workflow_builder.add_node("dispatcher", dispatcher_node)
-    workflow_builder.add_node("categorize_intent", partial(categorize_node, llm_client=llm_instance))
-    workflow_builder.add_node("handle_greeting_farewell", partial(greeting_farewell_node, llm_client=llm_instance))
-    workflow_builder.add_node("placeholder_fallback_node", partial(placeholder_fallback_node, llm_client=llm_instance))
-    workflow_builder.add_node("solicitar_nome_agendamento_node", partial(solicitar_nome_agendamento_node, llm_client=llm_instance))
-    workflow_builder.add_node("coletar_validar_nome_agendamento_node", partial(coletar_validar_nome_agendamento_node, llm_client=llm_instance))
-    workflow_builder.add_node("coletar_validar_especialidade_node", partial(coletar_validar_especialidade_node, llm_client=llm_instance)) 
-    workflow_builder.add_node("solicitar_preferencia_profissional_node", partial(solicitar_preferencia_profissional_node, llm_client=llm_instance))
-    workflow_builder.add_node("coletar_classificar_preferencia_profissional_node", partial(coletar_classificar_preferencia_profissional_node, llm_client=llm_instance))
-    workflow_builder.add_node("processing_professional_logic_node", partial(processing_professional_logic_node, llm_client=llm_instance))
-    workflow_builder.add_node("list_available_professionals_node", partial(list_available_professionals_node, llm_client=llm_instance))
-    workflow_builder.add_node("collect_validate_chosen_professional_node", partial(collect_validate_chosen_professional_node, llm_client=llm_instance))
-    workflow_builder.add_node("solicitar_turno_node", partial(solicitar_turno_node, llm_client=llm_instance))
-    workflow_builder.add_node("coletar_validar_turno_node", partial(coletar_validar_turno_node, llm_client=llm_instance))
-    workflow_builder.add_node("fetch_and_present_available_dates_node", partial(fetch_and_present_available_dates_node, llm_client=llm_instance))
-    workflow_builder.add_node("collect_validate_chosen_date_node", partial(collect_validate_chosen_date_node, llm_client=llm_instance))
-    workflow_builder.add_node("fetch_and_present_available_times_node", partial(fetch_and_present_available_times_node, llm_client=llm_instance))
-    workflow_builder.add_node("process_retry_option_choice_node", partial(process_retry_option_choice_node, llm_client=llm_instance))
-    workflow_builder.add_node("coletar_validar_horario_escolhido_node", partial(coletar_validar_horario_escolhido_node, llm_client=llm_instance))
-    workflow_builder.add_node("process_final_scheduling_confirmation_node", partial(process_final_scheduling_confirmation_node, llm_client=llm_instance))
+    workflow_builder.add_node("categorize_intent", partial(categorize_node, llm_client=get_node_llm_client("categorize_intent")))
+    workflow_builder.add_node("handle_greeting_farewell", partial(greeting_farewell_node, llm_client=get_node_llm_client("handle_greeting_farewell")))
+    workflow_builder.add_node("placeholder_fallback_node", partial(placeholder_fallback_node, llm_client=get_node_llm_client("placeholder_fallback_node")))
+    workflow_builder.add_node("solicitar_nome_agendamento_node", partial(solicitar_nome_agendamento_node, llm_client=get_node_llm_client("solicitar_nome_agendamento_node")))
+    workflow_builder.add_node("coletar_validar_nome_agendamento_node", partial(coletar_validar_nome_agendamento_node, llm_client=get_node_llm_client("coletar_validar_nome_agendamento_node"), classifier_llm_client=get_node_llm_client("coletar_validar_nome_agendamento_node", role="classifier")))
+    workflow_builder.add_node("coletar_validar_especialidade_node", partial(coletar_validar_especialidade_node, llm_client=get_node_llm_client("coletar_validar_especialidade_node"), classifier_llm_client=get_node_llm_client("coletar_validar_especialidade_node", role="classifier")))
+    workflow_builder.add_node("solicitar_preferencia_profissional_node", partial(solicitar_preferencia_profissional_node, llm_client=get_node_llm_client("solicitar_preferencia_profissional_node")))
+    workflow_builder.add_node("coletar_classificar_preferencia_profissional_node", partial(coletar_classificar_preferencia_profissional_node, llm_client=get_node_llm_client("coletar_classificar_preferencia_profissional_node")))
+    workflow_builder.add_node("processing_professional_logic_node", partial(processing_professional_logic_node, llm_client=get_node_llm_client("processing_professional_logic_node"), classifier_llm_client=get_node_llm_client("processing_professional_logic_node", role="classifier")))
+    workflow_builder.add_node("list_available_professionals_node", partial(list_available_professionals_node, llm_client=get_node_llm_client("list_available_professionals_node")))
+    workflow_builder.add_node("collect_validate_chosen_professional_node", partial(collect_validate_chosen_professional_node, llm_client=get_node_llm_client("collect_validate_chosen_professional_node"), classifier_llm_client=get_node_llm_client("collect_validate_chosen_professional_node", role="classifier")))
+    workflow_builder.add_node("solicitar_turno_node", partial(solicitar_turno_node, llm_client=get_node_llm_client("solicitar_turno_node")))
+    workflow_builder.add_node("coletar_validar_turno_node", partial(coletar_validar_turno_node, llm_client=get_node_llm_client("coletar_validar_turno_node"), classifier_llm_client=get_node_llm_client("coletar_validar_turno_node", role="classifier")))
+    workflow_builder.add_node("fetch_and_present_available_dates_node", partial(fetch_and_present_available_dates_node, llm_client=get_node_llm_client("fetch_and_present_available_dates_node")))
+    workflow_builder.add_node("collect_validate_chosen_date_node", partial(collect_validate_chosen_date_node, llm_client=get_node_llm_client("collect_validate_chosen_date_node")))
+    workflow_builder.add_node("fetch_and_present_available_times_node", partial(fetch_and_present_available_times_node, llm_client=get_node_llm_client("fetch_and_present_available_times_node")))
+    workflow_builder.add_node("process_retry_option_choice_node", partial(process_retry_option_choice_node, llm_client=get_node_llm_client("process_retry_option_choice_node")))
+    workflow_builder.add_node("coletar_validar_horario_escolhido_node", partial(coletar_validar_horario_escolhido_node, llm_client=get_node_llm_client("coletar_validar_horario_escolhido_node"), classifier_llm_client=get_node_llm_client("coletar_validar_horario_escolhido_node", role="classifier")))
+    workflow_builder.add_node("process_final_scheduling_confirmation_node", partial(process_final_scheduling_confirmation_node, llm_client=get_node_llm_client("process_final_scheduling_confirmation_node"), classifier_llm_client=get_node_llm_client("process_final_scheduling_confirmation_node", role="classifier")))
     workflow_builder.add_node("route_after_user_interaction", lambda state: state) 
-    workflow_builder.add_node("check_cancellation_node", partial(check_cancellation_node, llm_client=llm_instance))
-    workflow_builder.add_node("process_fallback_choice_node", partial(process_fallback_choice_node, llm_client=llm_instance))
+    workflow_builder.add_node("check_cancellation_node", partial(check_cancellation_node, llm_client=get_node_llm_client("check_cancellation_node")))
+    workflow_builder.add_node("process_fallback_choice_node", partial(process_fallback_choice_node, llm_client=get_node_llm_client("process_fallback_choice_node")))
 
     workflow_builder.set_entry_point("dispatcher")
 
@@ -2259,7 +2352,7 @@ async def arun_main_conversation_flow(
     checkpointer: BaseCheckpointSaver, 
     user_phone: Optional[str] = None,
 ) -> Optional[str]:
-    logger.info(f"Executando arun_main_conversation_flow para session_id: {session_id} com texto: '{user_text}'")
+    logger.info("Executando arun_main_conversation_flow para session_id: %s com texto: '%s'", session_id, user_text)
     
     if not checkpointer:
         logger.error("ERRO CRÍTICO: checkpointer não foi fornecido para arun_main_conversation_flow.")
@@ -2275,25 +2368,52 @@ async def arun_main_conversation_flow(
     if user_phone:
         initial_input_data["user_phone"] = user_phone
     
-    config = {"configurable": {"thread_id": session_id}}
+    config = {"configurable": {"thread_id": session_id}, "callbacks": [get_graph_node_metrics_handler()]}
+    token_accounting = TokenAccountingCallbackHandler(session_id) if settings.LLM_USAGE_ACCOUNTING_ENABLED else None
+    if token_accounting:
+        config["callbacks"].append(token_accounting)
+    turn_recorder = TurnRecorder(session_id, user_text) if settings.SLOW_TURN_RECORDING_ENABLED else None
+    if turn_recorder:
+        config["callbacks"].append(turn_recorder)
+    recorder_token = current_turn_recorder.set(turn_recorder)
     
-    logger.debug(f"Invocando grafo principal para session_id: {session_id} com input_data: {initial_input_data}")
+    logger.debug("Invocando grafo principal para session_id: %s com input_data: %s", session_id, summarize_state(initial_input_data))
 
+    turn_started = time_module.perf_counter()
     try:
         async for event_chunk in graph_with_persistence.astream(initial_input_data, config=config, stream_mode="values"):
+            if final_state is None and turn_recorder:
+                # O primeiro chunk de "values" é o estado carregado do checkpoint já com a entrada aplicada.
+                turn_recorder.step_before = event_chunk.get("scheduling_step")
             final_state = event_chunk 
-            logger.debug(f"Chunk do grafo (session_id {session_id}): {event_chunk}")
+            logger.debug("Chunk do grafo (session_id %s): %s", session_id, summarize_state(event_chunk))
+        await flush_checkpointer(checkpointer)
     except Exception as graph_error:
-        logger.error(f"Erro ao invocar o grafo LangGraph para thread {session_id}: {graph_error}", exc_info=True)
+        GRAPH_TURN_DURATION.labels(outcome="error").observe(time_module.perf_counter() - turn_started)
+        try:
+            # Com durabilidade por turno, o estado até o último super-step concluído ainda está em memória.
+            await flush_checkpointer(checkpointer)
+        except Exception as flush_error:
+            logger.error("Falha ao gravar o checkpoint do turno da thread %s: %s", session_id, flush_error, exc_info=True)
+        if turn_recorder:
+            finish_turn(turn_recorder, (final_state or {}).get("scheduling_step"), "error")
+        logger.error("Erro ao invocar o grafo LangGraph para thread %s: %s", session_id, graph_error, exc_info=True)
         return "Desculpe, ocorreu um erro interno ao processar sua solicitação. - Erro: {graph_error}"
+    finally:
+        current_turn_recorder.reset(recorder_token)
+    GRAPH_TURN_DURATION.labels(outcome="ok").observe(time_module.perf_counter() - turn_started)
+    if turn_recorder:
+        finish_turn(turn_recorder, (final_state or {}).get("scheduling_step"), "ok")
+    if token_accounting:
+        token_accounting.check_turn_budget()
 
     if final_state:
-        logger.info(f"Estado final do grafo (session_id {session_id}): {final_state}")
+        logger.info("Estado final do grafo (session_id %s): %s", session_id, summarize_state(final_state))
         
         response_content_to_send = final_state.get("response_to_user")
 
         if response_content_to_send:
-            logger.info(f"Resposta do arun_main_conversation_flow (session_id {session_id}): '{response_content_to_send}'")
+            logger.info("Resposta do arun_main_conversation_flow (session_id %s): '%s'", session_id, response_content_to_send)
             return response_content_to_send
         else:
             all_messages = final_state.get('messages', [])
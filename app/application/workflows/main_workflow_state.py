@@ -5,6 +5,8 @@ from langgraph.graph.message import add_messages
 
 class MainWorkflowState(TypedDict, total=False):
     messages: Annotated[List[BaseMessage], add_messages]
+    history_summary: Optional[str]  # resumo das mensagens removidas pela compactação do histórico
+    last_activity_at: Optional[str]  # ISO 8601 (UTC) do último turno, para o TTL da sessão
     categoria: Optional[str] = None
     current_operation: Optional[str]
     response_to_user: Optional[str] = None
@@ -21,12 +23,12 @@ class MainWorkflowState(TypedDict, total=False):
     user_chosen_professional_id: Optional[int] 
     user_chosen_professional_name: Optional[str]
 
-    available_professionals_list: Optional[List[Dict]] 
+    available_professionals_list: Optional[List[int]]  # ids apresentados, na ordem; nomes vêm do catálogo em cache
 
     user_chosen_turn: Optional[str] 
     available_dates_presented: Optional[List[str]] 
     user_chosen_date: Optional[str] 
-    available_times_presented: Optional[List[Dict[str, str]]] 
+    available_times_presented: Optional[List[List[str]]]  # [horaInicio, horaFim] da API, na ordem apresentada
     user_chosen_time: Optional[str] 
     user_chosen_time_fim: Optional[str] 
 
@@ -6,6 +6,7 @@ from langchain_core.messages import AIMessage, HumanMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 
+from app.core.logging_config import summarize_state
 from .sheduling_state import SchedulingWorkflowState
 # Futuramente, importaremos serviços específicos para agendamento aqui
 # from app.application.services.scheduling_service import (
@@ -13,6 +14,7 @@ from .sheduling_state import SchedulingWorkflowState
 #     processar_resposta_nome_completo_service
 # )
 from app.application.prompts.conversation_prompts import REQUEST_FULL_NAME_PROMPT_TEMPLATE
+from app.application.prompts.prompt_identification import prompt_config
 from app.infrastructure.llm_clients import get_llm_client # Para passar ao subgrafo, se necessário
 
 logger = logging.getLogger(__name__)
@@ -25,10 +27,10 @@ def internal_scheduling_dispatcher_node(state: SchedulingWorkflowState) -> dict:
     Decide qual nó executar com base em 'proximo_passo_agendamento'.
     Este nó APENAS lê o estado para roteamento, não o modifica aqui.
     """
-    logger.debug(f"--- Subgrafo Dispatcher: Estado recebido: {state} ---")
+    logger.debug("--- Subgrafo Dispatcher: Estado recebido: %s ---", summarize_state(state))
     proximo_passo = state.get("proximo_passo_agendamento")
     contador_carregado = state.get("contador_teste") # LOGAR O CONTADOR
-    logger.info(f"Subgrafo Dispatcher: Próximo passo agendamento = {proximo_passo}, Contador Teste Carregado = {contador_carregado}")
+    logger.info("Subgrafo Dispatcher: Próximo passo agendamento = %s, Contador Teste Carregado = %s", proximo_passo, contador_carregado)
     
     # Simplesmente retorna o estado; o roteamento condicional usará 'proximo_passo_agendamento'.
     # Não precisamos retornar explicitamente 'proximo_passo' no dict, a função de roteamento o acessará do estado.
@@ -47,7 +49,7 @@ def solicitar_nome_completo_node(state: SchedulingWorkflowState, llm_client: Cha
 
     prompt = REQUEST_FULL_NAME_PROMPT_TEMPLATE.format_messages()
     logger.debug(f"Gerando solicitação de nome completo com o LLM. Prompt: {prompt}")
-    ai_response = llm_client.invoke(prompt)
+    ai_response = llm_client.invoke(prompt, config=prompt_config("REQUEST_FULL_NAME"))
     resposta_llm = ai_response.content
     logger.info(f"Resposta do LLM para solicitação de nome completo: {resposta_llm}")
 
@@ -1,21 +1,313 @@
+from typing import Dict, Optional
+
+from pydantic import BaseModel, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
 load_dotenv()
 
+class LLMProfile(BaseModel):
+    """Configuração de um cliente de LLM (modelo e parâmetros de geração)."""
+    model: str
+    temperature: float = 0.2
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    priority: Optional[str] = None
+
 class Settings(BaseSettings):
     OPENAI_API_KEY: str
-    OPENAI_MODEL_NAME: str = "gpt-4o-mini"  
-    OPENAI_TEMPERATURE: float = 0.2        
+    OPENAI_MODEL_NAME: str = "gpt-4o-mini"
+    OPENAI_TEMPERATURE: float = 0.2
 
     APPHEALTH_API_TOKEN: str
-    
+    APPHEALTH_API_BASE_URL: str = "https://back.homologacao.apphealth.com.br:9090/api-vizi"
+    APPHEALTH_HTTP_POOL_MAXSIZE: int = 32
+    N8N_BASE_URL: str = "https://n8n-server.apphealth.com.br"
+
+    # Backend de LLM: "openai" ou "fake" (FakeChatModel determinístico, sem rede, para carga/benchmarks)
+    LLM_BACKEND: str = "openai"
+    LLM_FAKE_MODE: str = "rules"  # "rules" ou "recorded"
+    LLM_FAKE_RECORDINGS_PATH: Optional[str] = None
+    LLM_FAKE_LATENCY_DISTRIBUTION: str = "lognormal"  # "fixed", "uniform" ou "lognormal"
+    LLM_FAKE_LATENCY_MS: float = 600.0
+    LLM_FAKE_LATENCY_JITTER: float = 0.5
+    LLM_FAKE_ERROR_RATE: float = 0.0
+    LLM_FAKE_SEED: Optional[int] = None
+    LLM_RECORD_PATH: Optional[str] = None  # com LLM_BACKEND=openai, grava as respostas reais para o modo "recorded"
+
+    # Gateway de LLM (limite de concorrência e rate limit compartilhado)
+    LLM_MAX_IN_FLIGHT: int = 8
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_TOKENS_PER_MINUTE: int = 200_000
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 60.0
+    LLM_ESTIMATED_COMPLETION_TOKENS: int = 256
+    LLM_DEFAULT_PRIORITY: str = "interactive"
+    LLM_RATE_LIMIT_BACKEND: str = "local"  # "local" ou "postgres"
+    LLM_RATE_LIMIT_DATABASE_URL: Optional[str] = None
+
+    # Perfis de LLM e roteamento nó -> perfil.
+    # O perfil "default" é derivado de OPENAI_MODEL_NAME/OPENAI_TEMPERATURE se não for informado.
+    # Chaves "<nó>.classifier" definem o cliente usado nas chamadas de rótulo de nós que também geram texto livre.
+    LLM_PROFILES: Dict[str, LLMProfile] = {
+        "classifier": LLMProfile(model="gpt-4o-mini", temperature=0.0, max_tokens=32, timeout=10.0),
+        "extraction": LLMProfile(model="gpt-4o-mini", temperature=0.0, max_tokens=96, timeout=15.0),
+        "fast": LLMProfile(model="gpt-4.1-nano", temperature=0.0, timeout=8.0),
+    }
+    LLM_NODE_PROFILES: Dict[str, str] = {
+        "categorize_intent": "classifier",
+        "check_cancellation_node": "classifier",
+        "process_fallback_choice_node": "classifier",
+        "collect_validate_chosen_date_node": "classifier",
+        "coletar_classificar_preferencia_profissional_node": "extraction",
+        "coletar_validar_nome_agendamento_node.classifier": "extraction",
+        "coletar_validar_especialidade_node.classifier": "classifier",
+        "processing_professional_logic_node.classifier": "classifier",
+        "collect_validate_chosen_professional_node.classifier": "classifier",
+        "coletar_validar_turno_node.classifier": "classifier",
+        "coletar_validar_horario_escolhido_node.classifier": "classifier",
+        "process_final_scheduling_confirmation_node.classifier": "classifier",
+    }
+
+    # SLO de latência por nó: prazo por chamada, retry único no perfil rápido e resposta determinística.
+    # Chaves de LLM_NODE_DEADLINE_SECONDS/LLM_CANNED_RESPONSES seguem o mesmo formato de LLM_NODE_PROFILES.
+    LLM_FALLBACK_PROFILE: Optional[str] = "fast"
+    LLM_DEFAULT_DEADLINE_SECONDS: float = 20.0
+    LLM_FALLBACK_DEADLINE_SECONDS: float = 8.0
+    LLM_NODE_DEADLINE_SECONDS: Dict[str, float] = {
+        "categorize_intent": 6.0,
+        "check_cancellation_node": 4.0,
+        "process_fallback_choice_node": 6.0,
+        "collect_validate_chosen_date_node": 6.0,
+    }
+    LLM_CANNED_RESPONSES: Dict[str, str] = {
+        "check_cancellation_node": "NAO",
+    }
+    LLM_LATENCY_WINDOW: int = 200
+    LLM_DEGRADED_P95_RATIO: float = 0.8
+    LLM_DEGRADED_MIN_SAMPLES: int = 20
+    LLM_DEGRADED_COOLDOWN_SECONDS: float = 30.0
+
+    # Micro-batching de chamadas de classificação entre sessões concorrentes (nó -> template em BATCHABLE_CLASSIFICATION_PROMPTS).
+    LLM_BATCHING_ENABLED: bool = False
+    LLM_BATCH_WINDOW_MS: int = 150
+    LLM_BATCH_MAX_SIZE: int = 16
+    LLM_BATCHING_NODES: Dict[str, str] = {
+        "check_cancellation_node": "check_cancellation",
+        "categorize_intent": "categorization",
+    }
+
+    # Classificador local de intenção (categorize_intent): responde casos confiantes sem chamar o LLM.
+    INTENT_CLASSIFIER_MODEL_PATH: Optional[str] = None
+    INTENT_CLASSIFIER_THRESHOLD: float = 0.85
+    # Amostras (mensagem do paciente, categoria decidida pelo LLM) para treinar o classificador. Contêm texto livre
+    # de pacientes (dado sensível): desligado por padrão, gravado fora do turno por um thread próprio em
+    # INTENT_CLASSIFIER_LOG_PATH, com rotação diária; arquivos mais antigos que INTENT_CLASSIFIER_LOG_RETENTION_DAYS
+    # são apagados na rotação. O diretório deve ter acesso restrito ao time que treina o modelo.
+    INTENT_CLASSIFIER_LOG_ENABLED: bool = False
+    INTENT_CLASSIFIER_LOG_PATH: Optional[str] = None
+    INTENT_CLASSIFIER_LOG_RETENTION_DAYS: int = 30
+
+    # Tracing OpenTelemetry: um trace por mensagem Z-API (nós, LLM, HTTP e checkpoints como spans filhos).
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "file"  # "file" (JSONL), "otlp" (usa OTEL_EXPORTER_OTLP_ENDPOINT) ou "console"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    TRACING_SERVICE_NAME: str = "healthai-assistant"
+    TRACING_SAMPLE_RATIO: float = 1.0
+
+    # Contabilidade de tokens/custo por sessão, nó e template (tabela llm_token_usage + /api/v1/admin/llm-usage)
+    LLM_USAGE_ACCOUNTING_ENABLED: bool = True
+    LLM_USAGE_FLUSH_SECONDS: float = 10.0
+    LLM_PRICING: Dict[str, Dict[str, float]] = {  # USD por 1M tokens
+        "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+        "gpt-4o": {"input": 2.50, "output": 10.00},
+        "gpt-4.1-mini": {"input": 0.40, "output": 1.60},
+        "gpt-4.1-nano": {"input": 0.10, "output": 0.40},
+    }
+    # Orçamento por turno (None = sem limite). "warn" só registra; "raise" faz arun_main_conversation_flow falhar (testes/CI).
+    LLM_TURN_MAX_CALLS: Optional[int] = None
+    LLM_TURN_MAX_TOKENS: Optional[int] = None
+    LLM_TURN_BUDGET_MODE: str = "warn"
+    ADMIN_API_TOKEN: Optional[str] = None  # header X-Admin-Token dos endpoints administrativos; sem ele ficam desabilitados
+
+    # Logging (app/core/logging_config.py): escrita fora do event loop via QueueHandler/QueueListener
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" ou "text"
+    LOG_QUEUE_MAX_SIZE: int = 10000  # com a fila cheia os registros são descartados
+    LOG_STATE_MAX_CHARS: int = 2000  # tamanho máximo dos resumos de estado do grafo nos logs
+    LOG_SAMPLING: Dict[str, float] = {}  # prefixo do logger -> fração mantida dos registros abaixo de WARNING
+
+    # Profiling sob demanda (/api/v1/admin/profile e /api/v1/admin/memory-growth)
+    PROFILING_MAX_SECONDS: float = 120.0
+    TRACEMALLOC_FRAMES: int = 10
+
+    # Gravador de turnos lentos (/api/v1/admin/slow-turns): nós, LLM e HTTP de cada turno acima do limite
+    SLOW_TURN_RECORDING_ENABLED: bool = True
+    SLOW_TURN_THRESHOLD_SECONDS: float = 8.0
+    SLOW_TURN_MAX_RECORDS: int = 200
+
+    # Janela do histórico de mensagens do thread (None = sem limite); as mais antigas podem virar history_summary
+    MESSAGE_HISTORY_MAX_MESSAGES: Optional[int] = 20
+    MESSAGE_HISTORY_SUMMARY_ENABLED: bool = False
+    MESSAGE_HISTORY_SUMMARY_MAX_CHARS: int = 2000
+    # Sessão sem mensagens há mais tempo recomeça do zero no próximo turno (None = nunca expira)
+    SESSION_IDLE_TTL_MINUTES: Optional[float] = 1440.0
+
+    # Retenção das tabelas do checkpointer (tarefa do lifespan e python -m app.infrastructure.checkpoint_retention)
+    CHECKPOINT_RETENTION_ENABLED: bool = False
+    CHECKPOINT_RETENTION_INTERVAL_SECONDS: float = 3600.0
+    CHECKPOINT_KEEP_LAST: int = 10  # checkpoints mantidos por thread
+    CHECKPOINT_IDLE_TTL_DAYS: float = 90.0  # threads sem atividade há mais tempo são apagadas
+    CHECKPOINT_RETENTION_MIN_IDLE_SECONDS: float = 900.0  # threads ativas há menos tempo não são podadas
+    CHECKPOINT_RETENTION_BATCH_SIZE: int = 200
+    CHECKPOINT_RETENTION_BATCH_PAUSE_SECONDS: float = 0.2
+    # Serialização dos blobs do checkpointer: "jsonplus" (padrão do LangGraph) ou "zlib" (comprime os blobs grandes).
+    # Os dois leem blobs comprimidos, então dá para voltar para "jsonplus" sem perder as sessões gravadas com "zlib".
+    CHECKPOINT_SERIALIZER: str = "jsonplus"
+    # "step": um checkpoint por super-step (padrão do LangGraph); "turn": um checkpoint por turno, gravado no fim
+    # numa transação. Com "turn", uma queda no meio do turno perde o turno inteiro.
+    CHECKPOINT_DURABILITY: str = "step"
+    # Writes de cada super-step enviadas no mesmo pipeline (round trip) do checkpoint seguinte
+    CHECKPOINT_PIPELINE_WRITES: bool = False
+    # prepare_threshold das conexões do pool: 0 prepara no servidor já na primeira execução (como o
+    # AsyncPostgresSaver.from_conn_string); None desliga, necessário com PgBouncer em modo transaction antigo.
+    POSTGRES_PREPARE_THRESHOLD: Optional[int] = 0
+
+    # Conexão com o Postgres (checkpointer, contabilidade de tokens, retenção)
+    POSTGRES_USER: Optional[str] = None
+    POSTGRES_PASSWORD: Optional[str] = None
+    POSTGRES_HOST: str = "localhost"
+    POSTGRES_PORT: int = 5432
+    POSTGRES_DB: Optional[str] = None
+    # AsyncConnectionPool de cada worker (processo do uvicorn): o total de conexões é WEB_CONCURRENCY x max_size.
+    POSTGRES_POOL_MIN_SIZE: int = 1
+    POSTGRES_POOL_MAX_SIZE: int = 5
+    POSTGRES_POOL_TIMEOUT_SECONDS: float = 30.0  # espera máxima por uma conexão antes de PoolTimeout
+    POSTGRES_POOL_MAX_WAITING: int = 0  # requisições na fila do pool antes de recusar na hora (0 = sem limite)
+    POSTGRES_POOL_MAX_IDLE_SECONDS: float = 600.0  # conexões acima do min_size ociosas há mais tempo são fechadas
+    POSTGRES_POOL_MAX_LIFETIME_SECONDS: float = 3600.0  # conexões são recicladas depois desse tempo
+    # "none" entrega a conexão como está; "checkout" testa cada conexão ao sair do pool (um round trip a mais, mas uma
+    # conexão derrubada pelo servidor ou por um proxy é trocada antes de chegar ao turno)
+    POSTGRES_POOL_CHECK: str = "none"
+    POSTGRES_STATEMENT_TIMEOUT_MS: Optional[int] = 15000  # statement_timeout das conexões do pool (None = do servidor)
+    # Orçamento de conexões da aplicação no servidor; com ele definido, WEB_CONCURRENCY x max_size não pode passar
+    WEB_CONCURRENCY: int = 1
+    POSTGRES_CONNECTION_BUDGET: Optional[int] = None
+    # Último checkpoint de cada thread em memória no worker (atualizado depois do commit de cada turno). Validação antes de usar o cache:
+    # "version" confere o checkpoint_id mais recente no Postgres (leitura só do índice); "none" confia no cache e só
+    # é seguro com roteamento fixo do telefone para o worker.
+    HOT_SESSION_CACHE_ENABLED: bool = False
+    HOT_SESSION_CACHE_MAX_ENTRIES: int = 1000
+    HOT_SESSION_CACHE_VALIDATION: str = "version"
+    # Exclusão mútua por thread entre workers/réplicas: pg_advisory_xact_lock no início do turno, mantido até o commit
+    # da conexão no fim do turno. Um segundo turno do mesmo telefone espera sem segurar conexão do pool (fila local no
+    # worker, novas tentativas com backoff entre workers) até SESSION_LOCK_TIMEOUT_SECONDS; depois o paciente é avisado
+    # para reenviar a mensagem.
+    SESSION_LOCK_ENABLED: bool = False
+    SESSION_LOCK_TIMEOUT_SECONDS: float = 10.0
+    CHECKPOINT_COMPRESSION_MIN_BYTES: int = 1024
+    CHECKPOINT_COMPRESSION_LEVEL: int = 6
+
+    # Catálogo de profissionais em memória: o estado guarda só os ids apresentados e os nomes vêm daqui
+    PROFESSIONAL_CATALOG_TTL_SECONDS: float = 900.0
+    PROFESSIONAL_CATALOG_MAX_ENTRIES: int = 5000
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
+    @model_validator(mode="after")
+    def _validate_llm_profiles(self) -> "Settings":
+        if "default" not in self.LLM_PROFILES:
+            self.LLM_PROFILES["default"] = LLMProfile(
+                model=self.OPENAI_MODEL_NAME,
+                temperature=self.OPENAI_TEMPERATURE,
+                timeout=30.0,
+            )
+        unknown_profiles = {p for p in self.LLM_NODE_PROFILES.values() if p not in self.LLM_PROFILES}
+        if unknown_profiles:
+            raise ValueError(f"LLM_NODE_PROFILES referencia perfis inexistentes em LLM_PROFILES: {sorted(unknown_profiles)}")
+        if self.LLM_BACKEND not in ("openai", "fake"):
+            raise ValueError(f"LLM_BACKEND inválido: '{self.LLM_BACKEND}'. Use 'openai' ou 'fake'.")
+        if self.LLM_FALLBACK_PROFILE and self.LLM_FALLBACK_PROFILE not in self.LLM_PROFILES:
+            raise ValueError(f"LLM_FALLBACK_PROFILE '{self.LLM_FALLBACK_PROFILE}' não está definido em LLM_PROFILES.")
+        if self.TRACING_EXPORTER not in ("file", "otlp", "console"):
+            raise ValueError(f"TRACING_EXPORTER inválido: '{self.TRACING_EXPORTER}'. Use 'file', 'otlp' ou 'console'.")
+        if self.LLM_TURN_BUDGET_MODE not in ("warn", "raise"):
+            raise ValueError(f"LLM_TURN_BUDGET_MODE inválido: '{self.LLM_TURN_BUDGET_MODE}'. Use 'warn' ou 'raise'.")
+        if self.LOG_FORMAT not in ("json", "text"):
+            raise ValueError(f"LOG_FORMAT inválido: '{self.LOG_FORMAT}'. Use 'json' ou 'text'.")
+        if self.LOG_LEVEL.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+            raise ValueError(f"LOG_LEVEL inválido: '{self.LOG_LEVEL}'.")
+        for logger_prefix, rate in self.LOG_SAMPLING.items():
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError(f"LOG_SAMPLING['{logger_prefix}'] deve estar entre 0 e 1 (recebido {rate}).")
+        if self.INTENT_CLASSIFIER_LOG_ENABLED and not self.INTENT_CLASSIFIER_LOG_PATH:
+            raise ValueError("INTENT_CLASSIFIER_LOG_ENABLED exige INTENT_CLASSIFIER_LOG_PATH.")
+        if self.INTENT_CLASSIFIER_LOG_RETENTION_DAYS < 1:
+            raise ValueError("INTENT_CLASSIFIER_LOG_RETENTION_DAYS deve ser pelo menos 1.")
+        if self.MESSAGE_HISTORY_MAX_MESSAGES is not None and self.MESSAGE_HISTORY_MAX_MESSAGES < 2:
+            raise ValueError("MESSAGE_HISTORY_MAX_MESSAGES deve ser pelo menos 2 (os nós leem as duas últimas mensagens).")
+        if self.CHECKPOINT_KEEP_LAST < 1:
+            raise ValueError("CHECKPOINT_KEEP_LAST deve ser pelo menos 1 (o último checkpoint é o estado da conversa).")
+        if self.CHECKPOINT_SERIALIZER not in ("jsonplus", "zlib"):
+            raise ValueError(f"CHECKPOINT_SERIALIZER inválido: '{self.CHECKPOINT_SERIALIZER}'. Use 'jsonplus' ou 'zlib'.")
+        if self.CHECKPOINT_DURABILITY not in ("step", "turn"):
+            raise ValueError(f"CHECKPOINT_DURABILITY inválido: '{self.CHECKPOINT_DURABILITY}'. Use 'step' ou 'turn'.")
+        if self.HOT_SESSION_CACHE_VALIDATION not in ("version", "none"):
+            raise ValueError(f"HOT_SESSION_CACHE_VALIDATION inválido: '{self.HOT_SESSION_CACHE_VALIDATION}'. Use 'version' ou 'none'.")
+        if not 1 <= self.CHECKPOINT_COMPRESSION_LEVEL <= 9:
+            raise ValueError(f"CHECKPOINT_COMPRESSION_LEVEL deve estar entre 1 e 9 (recebido {self.CHECKPOINT_COMPRESSION_LEVEL}).")
+        if self.POSTGRES_POOL_MIN_SIZE < 0 or self.POSTGRES_POOL_MAX_SIZE < max(self.POSTGRES_POOL_MIN_SIZE, 1):
+            raise ValueError(
+                f"Tamanho do pool inválido: POSTGRES_POOL_MIN_SIZE={self.POSTGRES_POOL_MIN_SIZE}, "
+                f"POSTGRES_POOL_MAX_SIZE={self.POSTGRES_POOL_MAX_SIZE} (0 <= min <= max, max >= 1)."
+            )
+        for field in ("POSTGRES_POOL_TIMEOUT_SECONDS", "POSTGRES_POOL_MAX_IDLE_SECONDS", "POSTGRES_POOL_MAX_LIFETIME_SECONDS"):
+            if getattr(self, field) <= 0:
+                raise ValueError(f"{field} deve ser maior que zero (recebido {getattr(self, field)}).")
+        if self.POSTGRES_POOL_MAX_WAITING < 0:
+            raise ValueError(f"POSTGRES_POOL_MAX_WAITING não pode ser negativo (recebido {self.POSTGRES_POOL_MAX_WAITING}).")
+        if self.POSTGRES_POOL_CHECK not in ("none", "checkout"):
+            raise ValueError(f"POSTGRES_POOL_CHECK inválido: '{self.POSTGRES_POOL_CHECK}'. Use 'none' ou 'checkout'.")
+        if self.POSTGRES_STATEMENT_TIMEOUT_MS is not None and self.POSTGRES_STATEMENT_TIMEOUT_MS < 0:
+            raise ValueError(f"POSTGRES_STATEMENT_TIMEOUT_MS não pode ser negativo (recebido {self.POSTGRES_STATEMENT_TIMEOUT_MS}).")
+        if self.SESSION_LOCK_TIMEOUT_SECONDS <= 0:
+            raise ValueError(f"SESSION_LOCK_TIMEOUT_SECONDS deve ser maior que zero (recebido {self.SESSION_LOCK_TIMEOUT_SECONDS}).")
+        if self.WEB_CONCURRENCY < 1:
+            raise ValueError(f"WEB_CONCURRENCY deve ser pelo menos 1 (recebido {self.WEB_CONCURRENCY}).")
+        if self.POSTGRES_CONNECTION_BUDGET is not None and self.WEB_CONCURRENCY * self.POSTGRES_POOL_MAX_SIZE > self.POSTGRES_CONNECTION_BUDGET:
+            raise ValueError(
+                f"WEB_CONCURRENCY ({self.WEB_CONCURRENCY}) x POSTGRES_POOL_MAX_SIZE ({self.POSTGRES_POOL_MAX_SIZE}) passa de "
+                f"POSTGRES_CONNECTION_BUDGET ({self.POSTGRES_CONNECTION_BUDGET}); reduza o pool por worker."
+            )
+        if not 0.0 <= self.TRACING_SAMPLE_RATIO <= 1.0:
+            raise ValueError(f"TRACING_SAMPLE_RATIO deve estar entre 0 e 1 (recebido {self.TRACING_SAMPLE_RATIO}).")
+        return self
+
 settings = Settings()
 
 if __name__ == "__main__":
     print("Configurações carregadas:")
     print(f"  OpenAI API Key: {'*' * (len(settings.OPENAI_API_KEY) - 4) + settings.OPENAI_API_KEY[-4:] if settings.OPENAI_API_KEY else 'Não definida'}")
     print(f"  OpenAI Model Name: {settings.OPENAI_MODEL_NAME}")
-    print(f"  OpenAI Temperature: {settings.OPENAI_TEMPERATURE}")
\ No newline at end of file
+    print(f"  OpenAI Temperature: {settings.OPENAI_TEMPERATURE}")
+    for profile_name, profile in settings.LLM_PROFILES.items():
+        print(f"  LLM Profile '{profile_name}': {profile.model_dump()}")
+    print(f"  AppHealth API: {settings.APPHEALTH_API_BASE_URL}")
+    print(f"  LLM Backend: {settings.LLM_BACKEND}" + (f" (mode={settings.LLM_FAKE_MODE}, latency={settings.LLM_FAKE_LATENCY_DISTRIBUTION} {settings.LLM_FAKE_LATENCY_MS}ms, error_rate={settings.LLM_FAKE_ERROR_RATE})" if settings.LLM_BACKEND == "fake" else ""))
+    print(f"  LLM Gateway: max_in_flight={settings.LLM_MAX_IN_FLIGHT}, rpm={settings.LLM_REQUESTS_PER_MINUTE}, tpm={settings.LLM_TOKENS_PER_MINUTE}, backend={settings.LLM_RATE_LIMIT_BACKEND}")
+    print(f"  LLM SLO: fallback_profile={settings.LLM_FALLBACK_PROFILE}, default_deadline={settings.LLM_DEFAULT_DEADLINE_SECONDS}s, node_deadlines={settings.LLM_NODE_DEADLINE_SECONDS}")
+    print(f"  LLM Batching: enabled={settings.LLM_BATCHING_ENABLED}, window={settings.LLM_BATCH_WINDOW_MS}ms, max_size={settings.LLM_BATCH_MAX_SIZE}, nodes={settings.LLM_BATCHING_NODES}")
+    print(f"  Intent Classifier: model={settings.INTENT_CLASSIFIER_MODEL_PATH}, threshold={settings.INTENT_CLASSIFIER_THRESHOLD}, sample_log={settings.INTENT_CLASSIFIER_LOG_ENABLED} ({settings.INTENT_CLASSIFIER_LOG_PATH}, retention={settings.INTENT_CLASSIFIER_LOG_RETENTION_DAYS}d)")
+    print(f"  Tracing: enabled={settings.TRACING_ENABLED}, exporter={settings.TRACING_EXPORTER}, sample_ratio={settings.TRACING_SAMPLE_RATIO}")
+    print(f"  LLM Usage: accounting={settings.LLM_USAGE_ACCOUNTING_ENABLED}, turn_max_calls={settings.LLM_TURN_MAX_CALLS}, turn_max_tokens={settings.LLM_TURN_MAX_TOKENS}, mode={settings.LLM_TURN_BUDGET_MODE}")
+    print(f"  Logging: level={settings.LOG_LEVEL}, format={settings.LOG_FORMAT}, queue_max={settings.LOG_QUEUE_MAX_SIZE}, sampling={settings.LOG_SAMPLING}")
+    print(f"  Profiling: max_seconds={settings.PROFILING_MAX_SECONDS}, tracemalloc_frames={settings.TRACEMALLOC_FRAMES}")
+    print(f"  Slow Turns: enabled={settings.SLOW_TURN_RECORDING_ENABLED}, threshold={settings.SLOW_TURN_THRESHOLD_SECONDS}s, max_records={settings.SLOW_TURN_MAX_RECORDS}")
+    print(f"  Message History: max_messages={settings.MESSAGE_HISTORY_MAX_MESSAGES}, summary={settings.MESSAGE_HISTORY_SUMMARY_ENABLED}, summary_max_chars={settings.MESSAGE_HISTORY_SUMMARY_MAX_CHARS}, session_idle_ttl={settings.SESSION_IDLE_TTL_MINUTES}min")
+    print(f"  Checkpoint Retention: enabled={settings.CHECKPOINT_RETENTION_ENABLED}, keep_last={settings.CHECKPOINT_KEEP_LAST}, idle_ttl={settings.CHECKPOINT_IDLE_TTL_DAYS}d, interval={settings.CHECKPOINT_RETENTION_INTERVAL_SECONDS}s")
+    print(f"  Checkpoint Durability: {settings.CHECKPOINT_DURABILITY}, pipeline_writes={settings.CHECKPOINT_PIPELINE_WRITES}, prepare_threshold={settings.POSTGRES_PREPARE_THRESHOLD}")
+    print(f"  Postgres: {settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB} (user={settings.POSTGRES_USER}, password={'definida' if settings.POSTGRES_PASSWORD else 'Não definida'})")
+    print(f"  Postgres Pool (por worker): min={settings.POSTGRES_POOL_MIN_SIZE}, max={settings.POSTGRES_POOL_MAX_SIZE}, timeout={settings.POSTGRES_POOL_TIMEOUT_SECONDS}s, max_waiting={settings.POSTGRES_POOL_MAX_WAITING}, max_idle={settings.POSTGRES_POOL_MAX_IDLE_SECONDS}s, max_lifetime={settings.POSTGRES_POOL_MAX_LIFETIME_SECONDS}s, check={settings.POSTGRES_POOL_CHECK}, statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT_MS}ms, workers={settings.WEB_CONCURRENCY}, budget={settings.POSTGRES_CONNECTION_BUDGET}")
+    print(f"  Session Lock: enabled={settings.SESSION_LOCK_ENABLED}, timeout={settings.SESSION_LOCK_TIMEOUT_SECONDS}s")
+    print(f"  Hot Session Cache: enabled={settings.HOT_SESSION_CACHE_ENABLED}, max_entries={settings.HOT_SESSION_CACHE_MAX_ENTRIES}, validation={settings.HOT_SESSION_CACHE_VALIDATION}")
+    print(f"  Checkpoint Serializer: {settings.CHECKPOINT_SERIALIZER} (min_bytes={settings.CHECKPOINT_COMPRESSION_MIN_BYTES}, level={settings.CHECKPOINT_COMPRESSION_LEVEL})")
+    print(f"  Professional Catalog: ttl={settings.PROFESSIONAL_CATALOG_TTL_SECONDS}s, max_entries={settings.PROFESSIONAL_CATALOG_MAX_ENTRIES}")
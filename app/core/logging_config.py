@@ -0,0 +1,178 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Mapping, Optional
+
+from app.core.config import settings
+
+# Atributos padrão do LogRecord; o que não estiver aqui veio de `extra=` e vai para o JSON.
+_RESERVED_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+_logging_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro: timestamp UTC, nível, logger, mensagem, campos de `extra` e exceção."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Mantém só uma fração dos registros abaixo de WARNING dos loggers configurados em LOG_SAMPLING
+    (prefixo do nome do logger -> taxa entre 0 e 1; vale o prefixo mais longo). WARNING ou acima nunca é descartado.
+    """
+
+    def __init__(self, rates: Mapping[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._rate_cache: Dict[str, float] = {}
+
+    def _rate_for(self, logger_name: str) -> float:
+        rate = self._rate_cache.get(logger_name)
+        if rate is None:
+            matches = [prefix for prefix in self.rates if logger_name == prefix or logger_name.startswith(prefix + ".")]
+            rate = self.rates[max(matches, key=len)] if matches else 1.0
+            self._rate_cache[logger_name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que só resolve a mensagem (%-style) no thread de quem loga; formatação final (JSON) e escrita
+    ficam no thread do QueueListener. Com a fila cheia o registro é descartado em vez de bloquear o event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A mensagem é resolvida agora: os argumentos podem ser objetos mutáveis (estado do grafo).
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StateSummary:
+    """
+    Resumo preguiçoso e limitado de um estado do grafo (ou de qualquer dict) para logs %-style:
+    só é montado se o registro for emitido. Mensagens viram contagem + última mensagem; valores longos são cortados.
+    """
+
+    __slots__ = ("state", "max_chars")
+
+    def __init__(self, state: Any, max_chars: Optional[int] = None):
+        self.state = state
+        self.max_chars = max_chars or settings.LOG_STATE_MAX_CHARS
+
+    @staticmethod
+    def _short(value: Any, limit: int = 120) -> str:
+        text = repr(value)
+        return text if len(text) <= limit else text[: limit - 3] + "..."
+
+    def __str__(self) -> str:
+        if not isinstance(self.state, Mapping):
+            text = self._short(self.state, self.max_chars)
+            return text
+        parts = []
+        for key, value in self.state.items():
+            if value is None or value == [] or value == {}:
+                continue
+            if key == "messages" and isinstance(value, list):
+                last = value[-1]
+                last_text = getattr(last, "content", last)
+                parts.append(f"messages=<{len(value)} msgs, última={type(last).__name__}:{self._short(last_text, 160)}>")
+            else:
+                parts.append(f"{key}={self._short(value)}")
+        text = "{" + ", ".join(parts) + "}"
+        if len(text) > self.max_chars:
+            text = text[: self.max_chars - 4] + "...}"
+        return text
+
+    __repr__ = __str__
+
+
+def summarize_state(state: Any, max_chars: Optional[int] = None) -> StateSummary:
+    return StateSummary(state, max_chars)
+
+
+def setup_logging() -> None:
+    """
+    Configura o logging do processo: handler de fila no root (o event loop só enfileira), QueueListener escrevendo
+    no stdout em JSON ou texto (LOG_FORMAT), nível em LOG_LEVEL e amostragem por logger em LOG_SAMPLING.
+    """
+    global _listener
+    with _logging_lock:
+        if _listener is not None:
+            return
+
+        output_handler = logging.StreamHandler(sys.stdout)
+        if settings.LOG_FORMAT == "json":
+            output_handler.setFormatter(JsonFormatter())
+        else:
+            output_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+        log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        if settings.LOG_SAMPLING:
+            queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLING))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+        for noisy_logger in ("httpcore", "httpx", "openai", "urllib3", "psycopg"):
+            logging.getLogger(noisy_logger).setLevel(max(logging.WARNING, root.level))
+
+        _listener = QueueListener(log_queue, output_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Esvazia a fila e para o QueueListener."""
+    global _listener
+    with _logging_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
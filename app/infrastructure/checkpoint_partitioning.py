@@ -0,0 +1,177 @@
+"""
+Particionamento opcional das tabelas do checkpointer por hash de thread_id.
+
+Migração explícita, fora do lifespan (o AsyncPostgresSaver.setup() continua criando as tabelas normais):
+
+    python -m app.infrastructure.checkpoint_partitioning status
+    python -m app.infrastructure.checkpoint_partitioning migrate --partitions 16 [--drop-old]
+
+checkpoints, checkpoint_blobs e checkpoint_writes viram tabelas particionadas por HASH (thread_id) com o mesmo
+número de partições, então a partição N das três guarda as mesmas threads; as chaves primárias e os índices por
+thread_id do saver são recriados na tabela pai e ficam locais (alinhados) em cada partição. Todas as consultas do
+saver filtram por thread_id e tocam uma partição só, e as chaves primárias contêm thread_id, então os
+ON CONFLICT do saver continuam valendo. A retenção (checkpoint_retention) percorre partição por partição.
+
+A migração copia os dados numa transação com as tabelas antigas travadas para escrita: rodar com a aplicação
+parada ou numa janela de manutenção. As tabelas antigas ficam como <tabela>_unpartitioned (rollback) a menos que
+--drop-old seja usado. Migrações futuras do saver com CREATE INDEX CONCURRENTLY não rodam em tabela particionada.
+"""
+import argparse
+import asyncio
+import logging
+import re
+from typing import Dict, List
+
+import psycopg
+from psycopg import sql
+
+from app.infrastructure.db_pool import postgres_conninfo
+
+logger = logging.getLogger(__name__)
+
+# Colunas da chave primária de cada tabela, como nas migrações do AsyncPostgresSaver.
+CHECKPOINT_TABLES = {
+    "checkpoints": ("thread_id", "checkpoint_ns", "checkpoint_id"),
+    "checkpoint_blobs": ("thread_id", "checkpoint_ns", "channel", "version"),
+    "checkpoint_writes": ("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"),
+}
+UNPARTITIONED_SUFFIX = "_unpartitioned"
+
+PARTITIONS_SQL = """
+SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass(%s)
+"""
+HASH_BOUND_RE = re.compile(r"modulus (\d+), remainder (\d+)")
+
+
+def partition_name(table: str, remainder: int, partitions: int) -> str:
+    return f"{table}_p{remainder:0{max(2, len(str(partitions - 1)))}d}"
+
+
+async def is_partitioned(conn: psycopg.AsyncConnection, table: str = "checkpoints") -> bool:
+    cursor = await conn.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = await cursor.fetchone()
+    return bool(row and row[0])
+
+
+async def checkpoint_partitions(conn: psycopg.AsyncConnection) -> List[Dict[str, str]]:
+    """
+    Partições das três tabelas agrupadas pelo resto do hash: [{"checkpoints": "checkpoints_p00", ...}, ...].
+    Lista vazia se as tabelas não estiverem particionadas (ou não estiverem alinhadas: mesmo módulo e restos).
+    """
+    by_table: Dict[str, Dict[int, str]] = {}
+    moduli = set()
+    for table in CHECKPOINT_TABLES:
+        cursor = await conn.execute(PARTITIONS_SQL, (table,))
+        by_table[table] = {}
+        for name, bound in await cursor.fetchall():
+            match = HASH_BOUND_RE.search(bound or "")
+            if match is None:
+                return []
+            moduli.add(int(match.group(1)))
+            by_table[table][int(match.group(2))] = name
+    remainders = set(by_table["checkpoints"])
+    if not remainders or len(moduli) != 1 or any(set(partitions) != remainders for partitions in by_table.values()):
+        if remainders:
+            logger.warning("Partições das tabelas do checkpointer não estão alinhadas; tratando como não particionadas.")
+        return []
+    return [{table: by_table[table][remainder] for table in CHECKPOINT_TABLES} for remainder in sorted(remainders)]
+
+
+async def migrate_to_hash_partitions(conn: psycopg.AsyncConnection, partitions: int, drop_old: bool = False) -> Dict[str, int]:
+    """Recria as três tabelas particionadas por hash de thread_id e copia as linhas; devolve as linhas copiadas por tabela."""
+    if partitions < 2:
+        raise ValueError("Use pelo menos 2 partições.")
+    copied: Dict[str, int] = {}
+    async with conn.transaction():
+        if await is_partitioned(conn):
+            raise RuntimeError("As tabelas do checkpointer já estão particionadas.")
+        for table in CHECKPOINT_TABLES:
+            await conn.execute(sql.SQL("LOCK TABLE {} IN EXCLUSIVE MODE").format(sql.Identifier(table)))
+        for table, primary_key in CHECKPOINT_TABLES.items():
+            new_table, old_table = f"{table}_partitioned", f"{table}{UNPARTITIONED_SUFFIX}"
+            await conn.execute(
+                sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY HASH (thread_id)").format(
+                    sql.Identifier(new_table), sql.Identifier(table)
+                )
+            )
+            for remainder in range(partitions):
+                await conn.execute(
+                    sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES WITH (MODULUS {}, REMAINDER {})").format(
+                        sql.Identifier(partition_name(table, remainder, partitions)),
+                        sql.Identifier(new_table),
+                        sql.Literal(partitions),
+                        sql.Literal(remainder),
+                    )
+                )
+            cursor = await conn.execute(
+                sql.SQL("INSERT INTO {} SELECT * FROM {}").format(sql.Identifier(new_table), sql.Identifier(table))
+            )
+            copied[table] = cursor.rowcount
+
+            # Libera os nomes da tabela e dos índices para a versão particionada.
+            await conn.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(old_table)))
+            for index in (f"{table}_pkey", f"{table}_thread_id_idx"):
+                await conn.execute(
+                    sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {}").format(
+                        sql.Identifier(index), sql.Identifier(index.replace(table, old_table, 1))
+                    )
+                )
+            await conn.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(new_table), sql.Identifier(table)))
+            await conn.execute(
+                sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({})").format(
+                    sql.Identifier(table), sql.Identifier(f"{table}_pkey"), sql.SQL(", ").join(map(sql.Identifier, primary_key))
+                )
+            )
+            await conn.execute(
+                sql.SQL("CREATE INDEX {} ON {} (thread_id)").format(sql.Identifier(f"{table}_thread_id_idx"), sql.Identifier(table))
+            )
+            if drop_old:
+                await conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(old_table)))
+            logger.info("Tabela %s particionada em %s partições (%s linhas copiadas).", table, partitions, copied[table])
+    for table in CHECKPOINT_TABLES:
+        await conn.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+    return copied
+
+
+async def partition_status(conn: psycopg.AsyncConnection) -> List[Dict[str, object]]:
+    """Linhas estimadas e tamanho de cada partição (ou das tabelas, se não particionadas)."""
+    groups = await checkpoint_partitions(conn) or [{table: table for table in CHECKPOINT_TABLES}]
+    status = []
+    for group in groups:
+        row: Dict[str, object] = {}
+        for table, relation in group.items():
+            cursor = await conn.execute(
+                "SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE oid = to_regclass(%s)", (relation,)
+            )
+            estimated_rows, total_bytes = await cursor.fetchone()
+            row[table] = {"relation": relation, "estimated_rows": max(estimated_rows, 0), "total_bytes": total_bytes}
+        status.append(row)
+    return status
+
+
+async def _main(args: argparse.Namespace) -> None:
+    async with await psycopg.AsyncConnection.connect(args.dsn, autocommit=True) as conn:
+        if args.command == "migrate":
+            copied = await migrate_to_hash_partitions(conn, args.partitions, drop_old=args.drop_old)
+            print(f"Migração concluída: {copied}")
+            return
+        partitioned = await is_partitioned(conn)
+        print(f"Tabelas do checkpointer {'particionadas por hash de thread_id' if partitioned else 'não particionadas'}.")
+        for row in await partition_status(conn):
+            print("  " + "  ".join(f"{info['relation']}: ~{info['estimated_rows']} linhas, {info['total_bytes'] // 1024}KB" for info in row.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particionamento por hash de thread_id das tabelas do checkpointer.")
+    parser.add_argument("command", choices=["status", "migrate"])
+    parser.add_argument("--dsn", default=postgres_conninfo(), help="Conexão do Postgres (padrão: POSTGRES_* de Settings).")
+    parser.add_argument("--partitions", type=int, default=16, help="Número de partições (o mesmo nas três tabelas).")
+    parser.add_argument("--drop-old", action="store_true", help="Apaga as tabelas antigas em vez de mantê-las como *_unpartitioned.")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("Informe --dsn ou as variáveis POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_DB.")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg import errors as pg_errors
+from psycopg import sql
+
+from app.core.config import settings
+from app.infrastructure.checkpoint_partitioning import CHECKPOINT_TABLES, checkpoint_partitions
+from app.infrastructure.db_pool import postgres_conninfo
+from app.infrastructure.metrics import CHECKPOINT_RETENTION_DELETED_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Chave do advisory lock de sessão que garante uma só execução da retenção por vez entre os workers.
+RETENTION_ADVISORY_LOCK_KEY = 0x4EA17C4B
+
+# Um lote de threads (keyset por thread_id) já classificado pela última atividade (campo `ts` do checkpoint):
+# expirada = sem atividade há mais de idle_ttl; podável = mais de keep_last checkpoints e quieta há min_idle.
+SCAN_THREADS_SQL = """
+SELECT thread_id,
+       max((checkpoint ->> 'ts')::timestamptz) < now() - %(idle_ttl)s AS expired,
+       count(*) > %(keep_last)s AND max((checkpoint ->> 'ts')::timestamptz) < now() - %(min_idle)s AS prunable
+FROM {checkpoints}
+WHERE thread_id > %(after)s
+GROUP BY thread_id
+ORDER BY thread_id
+LIMIT %(limit)s
+"""
+
+DELETE_THREAD_SQL = (
+    "DELETE FROM {checkpoint_writes} WHERE thread_id = ANY(%s)",
+    "DELETE FROM {checkpoint_blobs} WHERE thread_id = ANY(%s)",
+    "DELETE FROM {checkpoints} WHERE thread_id = ANY(%s)",
+)
+
+# Apaga os checkpoints além dos `keep_last` mais recentes de cada (thread, namespace) e as escritas pendentes deles.
+# As escritas do pai do checkpoint mais antigo mantido ficam: o saver as lê como pending_sends desse checkpoint.
+PRUNE_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+           row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+    FROM {checkpoints}
+    WHERE thread_id = ANY(%(threads)s)
+), pruned AS (
+    DELETE FROM {checkpoints} c
+    USING ranked r
+    WHERE r.rn > %(keep_last)s
+      AND c.thread_id = r.thread_id AND c.checkpoint_ns = r.checkpoint_ns AND c.checkpoint_id = r.checkpoint_id
+    RETURNING c.thread_id, c.checkpoint_ns, c.checkpoint_id
+), pruned_writes AS (
+    DELETE FROM {checkpoint_writes} w
+    USING pruned p
+    WHERE w.thread_id = p.thread_id AND w.checkpoint_ns = p.checkpoint_ns AND w.checkpoint_id = p.checkpoint_id
+      AND NOT EXISTS (
+          SELECT 1 FROM ranked k
+          WHERE k.rn <= %(keep_last)s AND k.thread_id = p.thread_id AND k.checkpoint_ns = p.checkpoint_ns
+            AND k.parent_checkpoint_id = p.checkpoint_id
+      )
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM pruned), (SELECT count(*) FROM pruned_writes)
+"""
+
+# Blobs que nenhum checkpoint restante referencia em channel_versions (mesma junção do SELECT do saver).
+PRUNE_BLOBS_SQL = """
+DELETE FROM {checkpoint_blobs} b
+WHERE b.thread_id = ANY(%s)
+  AND NOT EXISTS (
+      SELECT 1 FROM {checkpoints} c
+      WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+        AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+  )
+"""
+
+
+# Partição não vazia sem nenhum checkpoint dentro do idle_ttl: todas as threads dela expiraram.
+PARTITION_EXPIRED_SQL = """
+SELECT EXISTS (SELECT 1 FROM {checkpoints})
+       AND NOT EXISTS (SELECT 1 FROM {checkpoints} WHERE (checkpoint ->> 'ts')::timestamptz >= now() - %s)
+"""
+COUNT_ROWS_SQL = "SELECT count(*) FROM {table}"
+
+# Tabelas sem particionamento; com partições, cada grupo de checkpoint_partitions() toma o lugar deste.
+UNPARTITIONED_TABLES = {table: table for table in CHECKPOINT_TABLES}
+
+
+def _sql(template: str, tables: Dict[str, str]) -> sql.Composed:
+    return sql.SQL(template).format(**{name: sql.Identifier(relation) for name, relation in tables.items()})
+
+
+@dataclass
+class RetentionPolicy:
+    keep_last: int = 10
+    idle_ttl: timedelta = timedelta(days=90)
+    # Threads com atividade mais recente que isso não são podadas: não disputa linhas com um turno em andamento
+    # nem apaga um blob que um checkpoint ainda não commitado vai referenciar.
+    min_idle: timedelta = timedelta(minutes=15)
+    batch_size: int = 200
+    batch_pause_seconds: float = 0.2
+    lock_timeout_ms: int = 2000
+
+    @classmethod
+    def from_settings(cls) -> "RetentionPolicy":
+        return cls(
+            keep_last=settings.CHECKPOINT_KEEP_LAST,
+            idle_ttl=timedelta(days=settings.CHECKPOINT_IDLE_TTL_DAYS),
+            min_idle=timedelta(seconds=settings.CHECKPOINT_RETENTION_MIN_IDLE_SECONDS),
+            batch_size=settings.CHECKPOINT_RETENTION_BATCH_SIZE,
+            batch_pause_seconds=settings.CHECKPOINT_RETENTION_BATCH_PAUSE_SECONDS,
+        )
+
+
+@dataclass
+class RetentionStats:
+    threads_scanned: int = 0
+    threads_deleted: int = 0
+    threads_pruned: int = 0
+    checkpoints_deleted: int = 0
+    writes_deleted: int = 0
+    blobs_deleted: int = 0
+    batches_skipped: int = 0
+    partitions_truncated: int = 0
+
+
+async def _apply_batch(conn: psycopg.AsyncConnection, tables: Dict[str, str], expired: List[str], prunable: List[str], policy: RetentionPolicy, stats: RetentionStats, dry_run: bool) -> None:
+    async with conn.transaction(force_rollback=dry_run):
+        async with conn.cursor() as cur:
+            await cur.execute(f"SET LOCAL lock_timeout = {int(policy.lock_timeout_ms)}")
+            if expired:
+                deleted = []
+                for statement in DELETE_THREAD_SQL:
+                    await cur.execute(_sql(statement, tables), (expired,))
+                    deleted.append(cur.rowcount)
+                stats.writes_deleted += deleted[0]
+                stats.blobs_deleted += deleted[1]
+                stats.checkpoints_deleted += deleted[2]
+                stats.threads_deleted += len(expired)
+            if prunable:
+                await cur.execute(_sql(PRUNE_CHECKPOINTS_SQL, tables), {"threads": prunable, "keep_last": policy.keep_last})
+                checkpoints_deleted, writes_deleted = await cur.fetchone()
+                await cur.execute(_sql(PRUNE_BLOBS_SQL, tables), (prunable,))
+                stats.checkpoints_deleted += checkpoints_deleted
+                stats.writes_deleted += writes_deleted
+                stats.blobs_deleted += cur.rowcount
+                stats.threads_pruned += len(prunable)
+
+
+async def _truncate_expired_partition(conn: psycopg.AsyncConnection, tables: Dict[str, str], policy: RetentionPolicy, stats: RetentionStats, dry_run: bool) -> bool:
+    """
+    Esvazia de uma vez (TRUNCATE) as três partições de um mesmo resto do hash quando todas as threads delas
+    expiraram, em vez de apagar linha a linha. Confere sem lock (para logo no primeiro checkpoint recente) e
+    confirma com as partições travadas, para não perder um turno que chegou entre as duas leituras.
+    """
+    async with conn.transaction():
+        cursor = await conn.execute(_sql(PARTITION_EXPIRED_SQL, tables), (policy.idle_ttl,))
+        (expired,) = await cursor.fetchone()
+    if not expired:
+        return False
+    try:
+        async with conn.transaction(force_rollback=dry_run):
+            await conn.execute(f"SET LOCAL lock_timeout = {int(policy.lock_timeout_ms)}")
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                await conn.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(tables[table])))
+            cursor = await conn.execute(_sql(PARTITION_EXPIRED_SQL, tables), (policy.idle_ttl,))
+            (expired,) = await cursor.fetchone()
+            if not expired:
+                return False
+            cursor = await conn.execute(_sql("SELECT count(DISTINCT thread_id) FROM {checkpoints}", tables))
+            (threads,) = await cursor.fetchone()
+            counts = {}
+            for table in CHECKPOINT_TABLES:
+                cursor = await conn.execute(_sql(COUNT_ROWS_SQL, {"table": tables[table]}))
+                (counts[table],) = await cursor.fetchone()
+            await conn.execute(
+                sql.SQL("TRUNCATE {}").format(sql.SQL(", ").join(sql.Identifier(tables[table]) for table in CHECKPOINT_TABLES))
+            )
+    except pg_errors.LockNotAvailable as e:
+        stats.batches_skipped += 1
+        logger.warning("Retenção de checkpoints: partição %s ignorada por lock (%s).", tables["checkpoints"], e)
+        return True
+    stats.partitions_truncated += 1
+    stats.threads_scanned += threads
+    stats.threads_deleted += threads
+    stats.checkpoints_deleted += counts["checkpoints"]
+    stats.writes_deleted += counts["checkpoint_writes"]
+    stats.blobs_deleted += counts["checkpoint_blobs"]
+    logger.info("Retenção de checkpoints: partição %s esvaziada (%s threads expiradas).", tables["checkpoints"], threads)
+    return True
+
+
+async def _retain_tables(conn: psycopg.AsyncConnection, tables: Dict[str, str], policy: RetentionPolicy, stats: RetentionStats, dry_run: bool) -> None:
+    scan_sql = _sql(SCAN_THREADS_SQL, tables)
+    scan_params = {"idle_ttl": policy.idle_ttl, "keep_last": policy.keep_last, "min_idle": policy.min_idle, "limit": policy.batch_size, "after": ""}
+    while True:
+        async with conn.transaction():
+            cursor = await conn.execute(scan_sql, scan_params)
+            rows = await cursor.fetchall()
+        if not rows:
+            break
+        scan_params["after"] = rows[-1][0]
+        stats.threads_scanned += len(rows)
+
+        expired = [thread_id for thread_id, is_expired, _ in rows if is_expired]
+        prunable = [thread_id for thread_id, is_expired, is_prunable in rows if is_prunable and not is_expired]
+        if expired or prunable:
+            try:
+                await _apply_batch(conn, tables, expired, prunable, policy, stats, dry_run)
+            except pg_errors.LockNotAvailable as e:
+                # Lote disputado com um turno em andamento: fica para a próxima execução.
+                stats.batches_skipped += 1
+                logger.warning("Retenção de checkpoints: lote iniciado em '%s' ignorado por lock (%s).", rows[0][0], e)
+            await asyncio.sleep(policy.batch_pause_seconds)
+
+        if len(rows) < policy.batch_size:
+            break
+
+
+async def run_retention(conn: psycopg.AsyncConnection, policy: RetentionPolicy, dry_run: bool = False) -> RetentionStats:
+    """
+    Percorre as threads do checkpointer em lotes (keyset por thread_id), cada lote na sua própria transação curta
+    com lock_timeout e uma pausa entre lotes. Threads sem atividade há mais de `idle_ttl` são apagadas por inteiro;
+    nas demais ficam só os `keep_last` checkpoints mais recentes e os blobs que eles referenciam.
+    Com as tabelas particionadas por hash (checkpoint_partitioning), o mesmo é feito partição por partição, direto
+    nas partições, e uma partição em que todas as threads expiraram é esvaziada com TRUNCATE.
+    Com `dry_run` cada transação é desfeita no final: os números mostram o que seria apagado.
+    """
+    stats = RetentionStats()
+    async with conn.transaction():
+        partitions = await checkpoint_partitions(conn)
+    for tables in partitions or [UNPARTITIONED_TABLES]:
+        if partitions and await _truncate_expired_partition(conn, tables, policy, stats, dry_run):
+            continue
+        await _retain_tables(conn, tables, policy, stats, dry_run)
+
+    if not dry_run:
+        CHECKPOINT_RETENTION_DELETED_ROWS.labels(table="checkpoints").inc(stats.checkpoints_deleted)
+        CHECKPOINT_RETENTION_DELETED_ROWS.labels(table="checkpoint_writes").inc(stats.writes_deleted)
+        CHECKPOINT_RETENTION_DELETED_ROWS.labels(table="checkpoint_blobs").inc(stats.blobs_deleted)
+    return stats
+
+
+async def run_retention_exclusive(conn: psycopg.AsyncConnection, policy: RetentionPolicy, dry_run: bool = False) -> Optional[RetentionStats]:
+    """
+    Executa a retenção só se nenhum outro worker/CLI estiver executando (advisory lock de sessão). Retorna None se não executou.
+    A varredura e os DELETEs de um lote podem passar do statement_timeout das conexões do pool
+    (POSTGRES_STATEMENT_TIMEOUT_MS), então ele fica desligado na sessão durante a retenção; a espera por locks
+    continua limitada pelo lock_timeout de cada lote.
+    """
+    await conn.execute("SET statement_timeout = 0")
+    await conn.commit()
+    try:
+        cursor = await conn.execute("SELECT pg_try_advisory_lock(%s)", (RETENTION_ADVISORY_LOCK_KEY,))
+        (acquired,) = await cursor.fetchone()
+        await conn.commit()
+        if not acquired:
+            return None
+        try:
+            return await run_retention(conn, policy, dry_run)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (RETENTION_ADVISORY_LOCK_KEY,))
+            await conn.commit()
+    finally:
+        # A conexão volta ao pool com o statement_timeout da sessão (o das opções de conexão).
+        await conn.execute("RESET statement_timeout")
+        await conn.commit()
+
+
+async def run_retention_loop(db_pool: Any, interval_seconds: float) -> None:
+    """Tarefa do lifespan: aplica a política de retenção do Settings a cada `interval_seconds`."""
+    policy = RetentionPolicy.from_settings()
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            async with db_pool.connection() as conn:
+                stats = await run_retention_exclusive(conn, policy)
+            if stats is None:
+                logger.info("Retenção de checkpoints já em execução em outro processo; rodada ignorada.")
+            else:
+                logger.info("Retenção de checkpoints concluída: %s", asdict(stats))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Falha na retenção de checkpoints: %s", e, exc_info=True)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    policy = RetentionPolicy(
+        keep_last=args.keep_last,
+        idle_ttl=timedelta(days=args.idle_days),
+        min_idle=timedelta(seconds=args.min_idle_seconds),
+        batch_size=args.batch_size,
+        batch_pause_seconds=args.pause_ms / 1000,
+    )
+    async with await psycopg.AsyncConnection.connect(args.dsn) as conn:
+        stats = await run_retention_exclusive(conn, policy, dry_run=args.dry_run)
+    if stats is None:
+        print("Outra execução da retenção está em andamento; nada foi feito.")
+        return
+    print(f"{'[dry-run] ' if args.dry_run else ''}Retenção de checkpoints:")
+    for key, value in asdict(stats).items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retenção/limpeza das tabelas do checkpointer do LangGraph.")
+    parser.add_argument("--dsn", default=postgres_conninfo(), help="Conexão do Postgres (padrão: POSTGRES_* de Settings).")
+    parser.add_argument("--keep-last", type=int, default=settings.CHECKPOINT_KEEP_LAST)
+    parser.add_argument("--idle-days", type=float, default=settings.CHECKPOINT_IDLE_TTL_DAYS)
+    parser.add_argument("--min-idle-seconds", type=float, default=settings.CHECKPOINT_RETENTION_MIN_IDLE_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=settings.CHECKPOINT_RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=float, default=settings.CHECKPOINT_RETENTION_BATCH_PAUSE_SECONDS * 1000)
+    parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria apagado (cada lote é desfeito).")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("Informe --dsn ou as variáveis POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_DB.")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
@@ -0,0 +1,333 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from psycopg.types.json import Jsonb
+
+from app.core.config import settings
+from app.infrastructure.hot_session_cache import PendingSessionUpdates, get_hot_session_cache
+from app.infrastructure.metrics import (
+    CHECKPOINT_COALESCED_WRITES,
+    CHECKPOINT_OPERATION_DURATION,
+    HOT_SESSION_CACHE_LOOKUPS,
+    observe_duration,
+)
+from app.infrastructure.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+LATEST_CHECKPOINT_ID_SQL = """
+SELECT checkpoint_id FROM checkpoints
+WHERE thread_id = %s AND checkpoint_ns = %s
+ORDER BY checkpoint_id DESC
+LIMIT 1
+"""
+
+COMPRESSED_TYPE_SUFFIX = "+zlib"
+
+
+class CompressedJsonPlusSerializer(JsonPlusSerializer):
+    """
+    JsonPlusSerializer (msgpack) que comprime com zlib os blobs a partir de `min_bytes`; o tipo gravado ganha o sufixo
+    "+zlib" (ex.: "msgpack+zlib"). Blobs pequenos ou que não diminuem ficam como estão. A leitura aceita os dois
+    formatos, e com `min_bytes=None` ele só lê: é o que permite desligar a compressão sem perder as sessões gravadas.
+    """
+
+    def __init__(self, min_bytes: Optional[int] = 1024, level: int = 6):
+        super().__init__()
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if self.min_bytes is None or len(data) < self.min_bytes or type_ not in ("msgpack", "json"):
+            return type_, data
+        compressed = zlib.compress(data, self.level)
+        if len(compressed) >= len(data):
+            return type_, data
+        return type_ + COMPRESSED_TYPE_SUFFIX, compressed
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(COMPRESSED_TYPE_SUFFIX):
+            return super().loads_typed((type_[: -len(COMPRESSED_TYPE_SUFFIX)], zlib.decompress(payload)))
+        return super().loads_typed(data)
+
+
+_checkpoint_serde: Optional[CompressedJsonPlusSerializer] = None
+_checkpoint_serde_lock = threading.Lock()
+
+
+def get_checkpoint_serde() -> CompressedJsonPlusSerializer:
+    """Serializador dos checkpointers conforme CHECKPOINT_SERIALIZER (com "jsonplus" grava sem comprimir)."""
+    global _checkpoint_serde
+    if _checkpoint_serde is None:
+        with _checkpoint_serde_lock:
+            if _checkpoint_serde is None:
+                min_bytes = settings.CHECKPOINT_COMPRESSION_MIN_BYTES if settings.CHECKPOINT_SERIALIZER == "zlib" else None
+                _checkpoint_serde = CompressedJsonPlusSerializer(min_bytes=min_bytes, level=settings.CHECKPOINT_COMPRESSION_LEVEL)
+    return _checkpoint_serde
+
+
+class InstrumentedAsyncPostgresSaver(AsyncPostgresSaver):
+    """
+    AsyncPostgresSaver que mede as leituras (aget_tuple) e escritas (aput, aput_writes) do checkpoint
+    no histograma healthai_checkpoint_operation_duration_seconds e como spans do trace do turno.
+    O comportamento é o mesmo do saver original; sem `serde` explícito usa get_checkpoint_serde().
+    Com HOT_SESSION_CACHE_ENABLED, a leitura do último checkpoint passa pelo cache de sessões do worker. As leituras
+    e escritas do turno só chegam ao cache no acommit(), depois do commit da transação da conexão.
+
+    Com CHECKPOINT_PIPELINE_WRITES, as writes de um super-step não vão ao banco na hora: ficam na fila e seguem no
+    mesmo pipeline (um round trip) do próximo aput, junto com os blobs e o checkpoint. A fila também é enviada antes
+    de qualquer leitura e no aflush() do fim do turno.
+    """
+
+    def __init__(self, conn: Any, pipe: Any = None, serde: Any = None, pipeline_writes: Optional[bool] = None):
+        super().__init__(conn=conn, pipe=pipe, serde=serde or get_checkpoint_serde())
+        self.hot_sessions = get_hot_session_cache()
+        self._session_updates = PendingSessionUpdates(self.hot_sessions) if self.hot_sessions is not None else None
+        self.pipeline_writes = settings.CHECKPOINT_PIPELINE_WRITES if pipeline_writes is None else pipeline_writes
+        self._queued_writes: List[Tuple[str, List[Tuple[Any, ...]]]] = []
+
+    @staticmethod
+    def _thread_key(config: RunnableConfig) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    async def _latest_checkpoint_id(self, thread_id: str, checkpoint_ns: str) -> Optional[str]:
+        async with self._cursor() as cur:
+            await cur.execute(LATEST_CHECKPOINT_ID_SQL, (thread_id, checkpoint_ns))
+            row = await cur.fetchone()
+        return row["checkpoint_id"] if row else None
+
+    async def _cached_tuple(self, config: RunnableConfig) -> Tuple[str, Optional[CheckpointTuple]]:
+        key = self._thread_key(config)
+        cached = self.hot_sessions.get(key)
+        if cached is None:
+            return "miss", None
+        if settings.HOT_SESSION_CACHE_VALIDATION == "none" or await self._latest_checkpoint_id(*key) == cached.checkpoint["id"]:
+            return "hit", cached
+        # Outro worker gravou um checkpoint mais novo para a thread.
+        self.hot_sessions.invalidate(key)
+        return "stale", None
+
+    async def _send_queued_writes(self) -> None:
+        if not self._queued_writes:
+            return
+        queued, self._queued_writes = self._queued_writes, []
+        async with self._cursor(pipeline=True) as cur:
+            for query, params in queued:
+                await cur.executemany(query, params)
+
+    async def _aput_pipelined(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: Any) -> RunnableConfig:
+        """O aput do AsyncPostgresSaver com as writes da fila no mesmo pipeline: uma sincronização por super-step."""
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable["checkpoint_ns"]
+        copy = checkpoint.copy()
+        blobs = await asyncio.to_thread(self._dump_blobs, thread_id, checkpoint_ns, copy.pop("channel_values"), new_versions)
+        queued, self._queued_writes = self._queued_writes, []
+        async with self._cursor(pipeline=True) as cur:
+            for query, params in queued:
+                await cur.executemany(query, params)
+            if blobs:
+                await cur.executemany(self.UPSERT_CHECKPOINT_BLOBS_SQL, blobs)
+            await cur.execute(
+                self.UPSERT_CHECKPOINTS_SQL,
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    configurable.get("checkpoint_id"),
+                    Jsonb(self._dump_checkpoint(copy)),
+                    self._dump_metadata(get_checkpoint_metadata(config, metadata)),
+                ),
+            )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        await self._send_queued_writes()
+        with observe_duration(CHECKPOINT_OPERATION_DURATION, operation="get_tuple"), \
+                tracer.start_as_current_span("checkpoint.get_tuple") as span:
+            if self.hot_sessions is None or get_checkpoint_id(config):
+                return await super().aget_tuple(config)
+            key = self._thread_key(config)
+            changed_in_turn, checkpoint_tuple = self._session_updates.lookup(key)
+            if changed_in_turn:
+                # A thread já foi gravada neste turno: vale o que está na transação, não o cache.
+                return checkpoint_tuple or await super().aget_tuple(config)
+            result, checkpoint_tuple = await self._cached_tuple(config)
+            HOT_SESSION_CACHE_LOOKUPS.labels(result=result).inc()
+            span.set_attribute("checkpoint.cache", result)
+            if checkpoint_tuple is None:
+                checkpoint_tuple = await super().aget_tuple(config)
+                if checkpoint_tuple is not None:
+                    self._session_updates.put(key, checkpoint_tuple)
+            return checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: Any) -> RunnableConfig:
+        with observe_duration(CHECKPOINT_OPERATION_DURATION, operation="put"), \
+                tracer.start_as_current_span("checkpoint.put", attributes={"checkpoint.queued_writes": len(self._queued_writes)}):
+            if self.pipeline_writes:
+                next_config = await self._aput_pipelined(config, checkpoint, metadata, new_versions)
+            else:
+                next_config = await super().aput(config, checkpoint, metadata, new_versions)
+        if self._session_updates is not None:
+            self._session_updates.put(self._thread_key(config), CheckpointTuple(
+                config=next_config,
+                checkpoint=checkpoint,
+                metadata=get_checkpoint_metadata(config, metadata),
+                parent_config=config if get_checkpoint_id(config) else None,
+                pending_writes=[],
+            ))
+        return next_config
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        with observe_duration(CHECKPOINT_OPERATION_DURATION, operation="put_writes"), \
+                tracer.start_as_current_span("checkpoint.put_writes", attributes={"checkpoint.writes": len(writes)}):
+            if self.pipeline_writes:
+                configurable = config["configurable"]
+                query = self.UPSERT_CHECKPOINT_WRITES_SQL if all(w[0] in WRITES_IDX_MAP for w in writes) else self.INSERT_CHECKPOINT_WRITES_SQL
+                params = await asyncio.to_thread(
+                    self._dump_writes, configurable["thread_id"], configurable["checkpoint_ns"], configurable["checkpoint_id"], task_id, task_path, writes,
+                )
+                self._queued_writes.append((query, params))
+            else:
+                await super().aput_writes(config, writes, task_id, task_path)
+        if self._session_updates is not None:
+            self._session_updates.add_writes(self._thread_key(config), get_checkpoint_id(config), task_id, writes)
+
+    async def aflush(self) -> None:
+        """Fim do turno: envia as writes que ainda estão na fila."""
+        if self._queued_writes:
+            with observe_duration(CHECKPOINT_OPERATION_DURATION, operation="flush"), tracer.start_as_current_span("checkpoint.flush"):
+                await self._send_queued_writes()
+
+    async def acommit(self) -> None:
+        """
+        Fim do turno, depois do aflush(): confirma a transação da conexão e só então publica no cache de sessões os
+        checkpoints do turno. Uma transação abortada (erro de SQL no turno) é desfeita, e as threads do turno saem do cache.
+        """
+        if isinstance(self.conn, AsyncConnection) and not self.conn.autocommit:
+            if self.conn.info.transaction_status == TransactionStatus.INERROR:
+                logger.warning("Transação do turno abortada por erro no banco; desfazendo sem atualizar o cache de sessões.")
+                await self.conn.rollback()
+                if self._session_updates is not None:
+                    self._session_updates.discard()
+                return
+            await self.conn.commit()
+        if self._session_updates is not None:
+            self._session_updates.publish()
+
+
+class CoalescingAsyncPostgresSaver(InstrumentedAsyncPostgresSaver):
+    """
+    Durabilidade por turno (CHECKPOINT_DURABILITY=turn): aput e aput_writes ficam em memória e aflush(), chamado no
+    fim do turno, grava só o último checkpoint (com as writes pendentes dele) numa única transação. O pai gravado é o
+    checkpoint carregado no início do turno, então o Postgres fica com um checkpoint por turno em vez de um por
+    super-step. Se o processo cair antes do aflush(), o turno inteiro se perde.
+    Uma instância por turno, sobre uma conexão (não um pool); aget_tuple enxerga o checkpoint ainda em memória.
+    """
+
+    def __init__(self, conn: Any, pipe: Any = None, serde: Any = None):
+        if not isinstance(conn, AsyncConnection):
+            raise ValueError("CoalescingAsyncPostgresSaver precisa de uma conexão (não um pool) para gravar o turno numa transação.")
+        super().__init__(conn=conn, pipe=pipe, serde=serde)
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        pending = self._pending.get(self._thread_key(config))
+        if pending is None or get_checkpoint_id(config) not in (None, pending["checkpoint"]["id"]):
+            return await super().aget_tuple(config)
+        parent_config = pending["parent_config"]
+        return CheckpointTuple(
+            config=pending["config"],
+            checkpoint=pending["checkpoint"],
+            metadata=pending["metadata"],
+            parent_config=parent_config if get_checkpoint_id(parent_config) else None,
+            pending_writes=[(task_id, channel, value) for task_id, _, writes in pending["writes"] for channel, value in writes],
+        )
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: Any) -> RunnableConfig:
+        thread_id, checkpoint_ns = key = self._thread_key(config)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = {"parent_config": config, "channels": set(), "puts": 0, "dropped_writes": 0}
+        else:
+            pending["dropped_writes"] += len(pending["writes"])
+        next_config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+        pending.update(config=next_config, checkpoint=checkpoint, metadata=metadata, writes=[])
+        pending["channels"].update(new_versions)
+        pending["puts"] += 1
+        return next_config
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        pending = self._pending.get(self._thread_key(config))
+        if pending is None:
+            await super().aput_writes(config, writes, task_id, task_path)
+        elif get_checkpoint_id(config) == pending["checkpoint"]["id"]:
+            pending["writes"].append((task_id, task_path, list(writes)))
+        else:
+            # Writes de um super-step que já virou checkpoint em memória: o estado delas já está no último checkpoint.
+            pending["dropped_writes"] += 1
+
+    async def aflush(self) -> None:
+        """Grava o último checkpoint de cada thread do turno numa transação; sem nada pendente não faz nada."""
+        pending_threads, self._pending = self._pending, {}
+        for pending in pending_threads.values():
+            checkpoint = pending["checkpoint"]
+            new_versions = {
+                channel: checkpoint["channel_versions"][channel]
+                for channel in pending["channels"]
+                if channel in checkpoint["channel_versions"]
+            }
+            try:
+                with observe_duration(CHECKPOINT_OPERATION_DURATION, operation="flush"), tracer.start_as_current_span("checkpoint.flush"):
+                    # Fora do autocommit (conexões do pool) a transação da conexão já engloba o turno e é confirmada
+                    # na devolução ao pool; um savepoint aqui só acrescentaria round trips.
+                    async with self.conn.transaction() if self.conn.autocommit else contextlib.nullcontext():
+                        await super().aput(pending["parent_config"], checkpoint, pending["metadata"], new_versions)
+                        for task_id, task_path, writes in pending["writes"]:
+                            await super().aput_writes(pending["config"], writes, task_id, task_path)
+                        await self._send_queued_writes()
+            except Exception:
+                # O aput já registrou o checkpoint para o cache de sessões, mas ele não foi gravado.
+                if self._session_updates is not None:
+                    self._session_updates.invalidate(self._thread_key(pending["config"]))
+                raise
+            CHECKPOINT_COALESCED_WRITES.labels(kind="put").inc(pending["puts"] - 1)
+            CHECKPOINT_COALESCED_WRITES.labels(kind="put_writes").inc(pending["dropped_writes"])
+
+
+def create_checkpointer(conn: Any) -> InstrumentedAsyncPostgresSaver:
+    """Checkpointer de um turno conforme CHECKPOINT_DURABILITY."""
+    if settings.CHECKPOINT_DURABILITY == "turn":
+        return CoalescingAsyncPostgresSaver(conn=conn)
+    return InstrumentedAsyncPostgresSaver(conn=conn)
+
+
+async def flush_checkpointer(checkpointer: Any) -> None:
+    """Fim do turno: grava o que os checkpointers da aplicação ainda têm em memória; nos outros não faz nada."""
+    if isinstance(checkpointer, InstrumentedAsyncPostgresSaver):
+        await checkpointer.aflush()
+
+
+async def commit_checkpointer(checkpointer: Any) -> None:
+    """Depois do turno: confirma a transação e atualiza o cache de sessões (acommit); nos outros não faz nada."""
+    if isinstance(checkpointer, InstrumentedAsyncPostgresSaver):
+        await checkpointer.acommit()
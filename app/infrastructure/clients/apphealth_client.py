@@ -0,0 +1,68 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.infrastructure.metrics import APPHEALTH_REQUEST_DURATION, apphealth_endpoint_label, observe_duration
+from app.infrastructure.tracing import http_client_span, inject_trace_headers, record_http_response
+
+logger = logging.getLogger(__name__)
+
+
+class AppHealthClient:
+    """
+    Cliente HTTP da API AppHealth usado pelos nós de agendamento.
+    Centraliza a URL base (APPHEALTH_API_BASE_URL), o token e uma Session com keep-alive compartilhada entre as threads.
+    Os métodos retornam o `requests.Response` e propagam as exceções de `requests`, como as chamadas diretas faziam.
+    A latência de cada requisição vai para o histograma healthai_apphealth_request_duration_seconds e cada
+    requisição vira um span CLIENT no trace do turno.
+    """
+
+    def __init__(self, base_url: str, api_token: Optional[str], pool_maxsize: int = 32):
+        self.base_url = base_url.rstrip("/")
+        self.default_headers = {"Authorization": f"{api_token}", "Content-Type": "application/json"}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        logger.info(f"AppHealthClient inicializado para {self.base_url}")
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _request(self, method: str, path: str, headers: Dict[str, str], **kwargs: Any) -> requests.Response:
+        endpoint = apphealth_endpoint_label(path)
+        url = self.url(path)
+        with observe_duration(APPHEALTH_REQUEST_DURATION, method=method, endpoint=endpoint, status="") as labels, \
+                http_client_span("apphealth", method, url, route=endpoint) as span:
+            response = self.session.request(method, url, headers=inject_trace_headers(headers), **kwargs)
+            labels["status"] = str(response.status_code)
+            record_http_response(span, response.status_code)
+            return response
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> requests.Response:
+        return self._request("GET", path, params=params, headers=headers or self.default_headers, timeout=timeout)
+
+    def post(self, path: str, json: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, timeout: float = 20) -> requests.Response:
+        return self._request("POST", path, json=json, headers=headers or self.default_headers, timeout=timeout)
+
+
+_apphealth_client: Optional[AppHealthClient] = None
+_apphealth_client_lock = threading.Lock()
+
+
+def get_apphealth_client() -> AppHealthClient:
+    """Retorna o cliente AppHealth do processo (criado sob demanda a partir do Settings)."""
+    global _apphealth_client
+    if _apphealth_client is None:
+        with _apphealth_client_lock:
+            if _apphealth_client is None:
+                _apphealth_client = AppHealthClient(
+                    base_url=settings.APPHEALTH_API_BASE_URL,
+                    api_token=settings.APPHEALTH_API_TOKEN,
+                    pool_maxsize=settings.APPHEALTH_HTTP_POOL_MAXSIZE,
+                )
+    return _apphealth_client
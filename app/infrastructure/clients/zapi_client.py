@@ -4,6 +4,8 @@ import os
 import json
 from typing import Optional, Dict, Any
 
+from app.infrastructure.tracing import http_client_span, inject_trace_headers, record_http_response
+
 logger = logging.getLogger(__name__)
 
 class ZapiClient:
@@ -56,25 +58,29 @@ class ZapiClient:
         
         payload_json = json.dumps(n8n_payload)
         
-        logger.info(f"N8N_CLIENT: Enviando mensagem para webhook N8N. Destinatário original: {to_phone}. Texto: '{message_text[:50]}...'. URL: {self.n8n_webhook_url}")
-        logger.debug(f"N8N_CLIENT: Payload: {payload_json}")
-        logger.debug(f"N8N_CLIENT: Headers: {self.n8n_headers}")
+        logger.info("N8N_CLIENT: Enviando mensagem para webhook N8N. Destinatário original: %s. Texto: '%s...'. URL: %s", to_phone, message_text[:50], self.n8n_webhook_url)
+        logger.debug("N8N_CLIENT: Payload: %s", payload_json)
+        logger.debug("N8N_CLIENT: Headers: %s", self.n8n_headers)
 
         async with httpx.AsyncClient(timeout=30.0) as client:
             try:
-                response = await client.post(
-                    self.n8n_webhook_url, 
-                    content=payload_json,
-                    headers=self.n8n_headers
-                )
+                # O span da resposta fica no mesmo trace da mensagem recebida; o traceparent segue para o n8n.
+                with http_client_span("n8n", "POST", self.n8n_webhook_url) as span:
+                    span.set_attribute("zapi.reply_to_message_id", original_received_message_id or "")
+                    response = await client.post(
+                        self.n8n_webhook_url, 
+                        content=payload_json,
+                        headers=inject_trace_headers(self.n8n_headers)
+                    )
+                    record_http_response(span, response.status_code)
                 response.raise_for_status() 
                 
                 
                 response_content = response.text
-                logger.info(f"N8N_CLIENT: Mensagem enviada com sucesso para o webhook N8N. Status: {response.status_code}. Resposta: {response_content[:200]}")
+                logger.info("N8N_CLIENT: Mensagem enviada com sucesso para o webhook N8N. Status: %s. Resposta: %s", response.status_code, response_content[:200])
                 return {"status_code": response.status_code, "response_body": response_content}
             except httpx.HTTPStatusError as e:
-                logger.error(f"N8N_CLIENT: Erro HTTP ao enviar mensagem para webhook N8N. Status: {e.response.status_code}. Detalhes: {e.response.text}", exc_info=True)
+                logger.error("N8N_CLIENT: Erro HTTP ao enviar mensagem para webhook N8N. Status: %s. Detalhes: %s", e.response.status_code, e.response.text, exc_info=True)
                 error_details = {"error": "HTTPStatusError", "status_code": e.response.status_code, "request_payload": n8n_payload}
                 try:
                     error_details["response_body"] = e.response.json()
@@ -82,8 +88,8 @@ class ZapiClient:
                     error_details["response_body"] = e.response.text
                 return error_details
             except httpx.RequestError as e:
-                logger.error(f"N8N_CLIENT: Erro de requisição ao enviar mensagem para webhook N8N (URL: {e.request.url}): {str(e)}", exc_info=True)
+                logger.error("N8N_CLIENT: Erro de requisição ao enviar mensagem para webhook N8N (URL: %s): %s", e.request.url, str(e), exc_info=True)
                 return {"error": "RequestError", "details": str(e), "request_payload": n8n_payload}
             except Exception as e:
-                logger.error(f"N8N_CLIENT: Erro inesperado ao enviar mensagem para webhook N8N: {str(e)}", exc_info=True)
+                logger.error("N8N_CLIENT: Erro inesperado ao enviar mensagem para webhook N8N: %s", str(e), exc_info=True)
                 return {"error": "UnexpectedError", "details": str(e), "request_payload": n8n_payload}
\ No newline at end of file
@@ -0,0 +1,56 @@
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def postgres_conninfo(mask_password: bool = False) -> Optional[str]:
+    """String de conexão montada a partir de POSTGRES_*, ou None se usuário, senha ou banco não estiverem definidos."""
+    if not (settings.POSTGRES_USER and settings.POSTGRES_PASSWORD and settings.POSTGRES_DB):
+        return None
+    password = "********" if mask_password else quote(settings.POSTGRES_PASSWORD, safe="")
+    return (
+        f"postgresql://{quote(settings.POSTGRES_USER, safe='')}:{password}"
+        f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+    )
+
+
+def connection_kwargs() -> Dict[str, Any]:
+    """Parâmetros de cada conexão do pool: prepare_threshold e statement_timeout (enviado no startup da sessão)."""
+    kwargs: Dict[str, Any] = {"prepare_threshold": settings.POSTGRES_PREPARE_THRESHOLD}
+    if settings.POSTGRES_STATEMENT_TIMEOUT_MS is not None:
+        kwargs["options"] = f"-c statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT_MS}"
+    return kwargs
+
+
+def create_db_pool(conninfo: str) -> AsyncConnectionPool:
+    """AsyncConnectionPool do worker com tamanho, esperas, reciclagem e verificação vindos de Settings (abrir com `async with`)."""
+    logger.info(
+        "Pool do Postgres: min=%s max=%s timeout=%ss max_waiting=%s max_idle=%ss max_lifetime=%ss check=%s statement_timeout=%sms",
+        settings.POSTGRES_POOL_MIN_SIZE,
+        settings.POSTGRES_POOL_MAX_SIZE,
+        settings.POSTGRES_POOL_TIMEOUT_SECONDS,
+        settings.POSTGRES_POOL_MAX_WAITING,
+        settings.POSTGRES_POOL_MAX_IDLE_SECONDS,
+        settings.POSTGRES_POOL_MAX_LIFETIME_SECONDS,
+        settings.POSTGRES_POOL_CHECK,
+        settings.POSTGRES_STATEMENT_TIMEOUT_MS,
+    )
+    return AsyncConnectionPool(
+        conninfo=conninfo,
+        min_size=settings.POSTGRES_POOL_MIN_SIZE,
+        max_size=settings.POSTGRES_POOL_MAX_SIZE,
+        timeout=settings.POSTGRES_POOL_TIMEOUT_SECONDS,
+        max_waiting=settings.POSTGRES_POOL_MAX_WAITING,
+        max_idle=settings.POSTGRES_POOL_MAX_IDLE_SECONDS,
+        max_lifetime=settings.POSTGRES_POOL_MAX_LIFETIME_SECONDS,
+        check=AsyncConnectionPool.check_connection if settings.POSTGRES_POOL_CHECK == "checkout" else None,
+        kwargs=connection_kwargs(),
+        name="healthai",
+        open=False,
+    )
@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+from app.application.prompts.prompt_identification import UNKNOWN_TEMPLATE, get_template_matcher
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FakeLLMError(Exception):
+    """Erro simulado pelo FakeChatModel (LLM_FAKE_ERROR_RATE)."""
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+# --- Regras determinísticas por template (modo "rules") ---
+
+def _has_any(text: str, words: List[str]) -> bool:
+    normalized = _normalize(text)
+    return any(word in normalized for word in words)
+
+
+def _pick_from_list(user_value: str, options: List[str]) -> Optional[str]:
+    """Escolhe uma opção pelo número ("2", "segunda"), pelo texto exato ou por sobreposição de palavras."""
+    options = [o.strip() for o in options if o.strip()]
+    normalized = _normalize(user_value)
+    ordinals = ["primeir", "segund", "terceir", "quart", "quint", "sext", "setim", "oitav", "non", "decim"]
+    number = re.search(r"\b(\d{1,2})\b", normalized)
+    if number and not re.search(r"\d{1,2}[:h]\d{2}|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}", normalized):
+        index = int(number.group(1)) - 1
+        if 0 <= index < len(options):
+            return options[index]
+    for i, ordinal in enumerate(ordinals[: len(options)]):
+        if ordinal in normalized:
+            return options[i]
+    for option in options:
+        if _normalize(option) in normalized or normalized in _normalize(option):
+            return option
+    time_match = re.search(r"\b(\d{1,2})[:h](\d{2})\b", normalized)
+    if time_match:
+        wanted = f"{int(time_match.group(1)):02d}:{time_match.group(2)}"
+        if wanted in options:
+            return wanted
+    user_words = {w for w in normalized.split() if len(w) > 2 and w not in {"dra", "dr.", "doutor", "doutora", "com"}}
+    scored = [(len(user_words & set(_normalize(o).split())), o) for o in options]
+    scored = [s for s in scored if s[0] > 0]
+    if len(scored) == 1 or (scored and sorted(scored, reverse=True)[0][0] > sorted(scored, reverse=True)[1][0]):
+        return max(scored)[1]
+    return None
+
+
+def _rule_categorization(v: Dict[str, str]) -> str:
+    query = v.get("user_query", "")
+    if _has_any(query, ["cancel", "desmarc"]):
+        return "Cancelar Agendamento"
+    if _has_any(query, ["remarc", "mudar", "trocar", "alterar"]):
+        return "Atualizar Agendamento"
+    if _has_any(query, ["minha consulta", "meu agendamento", "consultar"]):
+        return "Consultar Agendamento"
+    if _has_any(query, ["agend", "marcar", "consulta", "horario"]):
+        return "Criar Agendamento"
+    if _has_any(query, ["endereco", "onde fica", "funcionamento", "telefone", "convenio"]):
+        return "Informações Unidade"
+    if re.search(r"\b(oi+|ola)\b", _normalize(query)) or _has_any(query, ["bom dia", "boa tarde", "boa noite", "obrigad", "tchau", "ate logo", "valeu"]):
+        return "Saudação ou Despedida"
+    return "Fora do Escopo"
+
+
+def _rule_professional_preference(v: Dict[str, str]) -> str:
+    response = v.get("user_response", "")
+    name = re.search(r"\b((?:Dr|Dra|Doutor|Doutora)\.?\s+[\wÀ-ú]+(?:\s+[\wÀ-ú]+)*)", response)
+    if name:
+        result = {"preference_type": "SPECIFIC_NAME_PROVIDED", "extracted_professional_name": name.group(1)}
+    elif _has_any(response, ["indiq", "indica", "qualquer", "tanto faz", "opcoes", "recomend"]):
+        result = {"preference_type": "RECOMMENDATION", "extracted_professional_name": None}
+    elif _has_any(response, ["escolher", "especifico", "nomear"]):
+        result = {"preference_type": "SPECIFIC_NAME_TO_PROVIDE_LATER", "extracted_professional_name": None}
+    else:
+        result = {"preference_type": "AMBIGUOUS_OR_NEGATIVE", "extracted_professional_name": None}
+    return json.dumps(result, ensure_ascii=False)
+
+
+def _rule_validate_specialty(v: Dict[str, str]) -> str:
+    value = v.get("user_input_specialty", "")
+    if _has_any(value, ["quais", "liste", "opcoes", "lista"]):
+        return "LISTAR_ESPECIALIDADES"
+    words = value.strip().split()
+    if not words or len(words) > 4 or _has_any(value, ["nao sei", "qualquer", "doendo", "doi", "marcar"]):
+        return "ENTRADA_INVALIDA_NAO_EH_ESPECIALIDADE"
+    return value.strip().title()
+
+
+def _rule_match_list(value_key: str, list_key: str) -> Callable[[Dict[str, str]], str]:
+    def rule(v: Dict[str, str]) -> str:
+        choice = _pick_from_list(v.get(value_key, ""), v.get(list_key, "").split(","))
+        return choice or "NENHUMA_CORRESPONDENCIA"
+    return rule
+
+
+def _rule_chosen_option(v: Dict[str, str]) -> str:
+    options_str = v.get("date_options_internal_list_str") or v.get("time_options_internal_list_str") or ""
+    choice = _pick_from_list(v.get("user_response", ""), options_str.split(","))
+    return choice or "NENHUMA_CORRESPONDENCIA_OU_AMBIGUA"
+
+
+def _rule_final_confirmation(v: Dict[str, str]) -> str:
+    response = v.get("user_response", "")
+    if _has_any(response, ["cancel", "nao"]):
+        return "CANCELLED"
+    if _has_any(response, ["sim", "pode", "confirm", "ok", "isso"]):
+        return "CONFIRMED"
+    return "AMBIGUOUS"
+
+
+def _rule_extract_full_name(v: Dict[str, str]) -> str:
+    message = v.get("user_message", "").strip()
+    message = re.sub(r"(?i)^(meu nome (e|é)|sou (o|a)?|me chamo|pode me chamar de)\s+", "", message).strip(" .!")
+    words = message.split()
+    if "?" in message or not 2 <= len(words) <= 6 or not all(re.fullmatch(r"[\wÀ-ú.]+", w) for w in words):
+        return "NOME_NAO_IDENTIFICADO"
+    return " ".join(w.capitalize() for w in words)
+
+
+def _rule_check_cancellation(v: Dict[str, str]) -> str:
+    return "SIM" if _has_any(v.get("user_message", ""), ["cancel", "nao quero mais", "parar", "deixa pra la", "mudei de ideia"]) else "NAO"
+
+
+def _rule_fallback_choice(v: Dict[str, str]) -> str:
+    response = v.get("user_response", "")
+    if _has_any(response, ["cancel", "ultima"]):
+        return "CANCEL_SCHEDULING"
+    if _has_any(response, ["especialidade", "segunda"]):
+        return "GO_TO_SPECIALTY"
+    if _has_any(response, ["tentar", "de novo", "novamente", "primeira"]) or response.strip() == "1":
+        return "RETRY_PREVIOUS_STEP"
+    return "AMBIGUOUS_OR_UNAFFILIATED"
+
+
+def _rule_unknown(v: Dict[str, str]) -> str:
+    """Prompts montados dentro dos nós (ex.: classificação de turno) e textos livres não registrados."""
+    prompt = v.get("prompt", "")
+    if '"MANHA", "TARDE", ou "INVALIDO"' in prompt:
+        found = re.search(r'Resposta do usuário: "(.*?)"\s*Categoria:', prompt, re.DOTALL)
+        response = found.group(1) if found else ""
+        if _has_any(response, ["manha"]):
+            return "MANHA"
+        if _has_any(response, ["tarde"]):
+            return "TARDE"
+        return "INVALIDO"
+    # Prompts de apresentação montados nos nós trazem a lista numerada de opções; ela é repetida na resposta.
+    options = re.findall(r"^\s*(\d+\.\s.+)$", prompt, re.MULTILINE)
+    if options:
+        return "Encontrei estas opções:\n" + "\n".join(o.strip() for o in options) + "\nQual você prefere?"
+    return "Certo! Como posso ajudar a seguir?"
+
+
+_RULES: Dict[str, Callable[[Dict[str, str]], str]] = {
+    "CATEGORIZATION": _rule_categorization,
+    "GREETING_FAREWELL": lambda v: "Olá! Sou o assistente virtual da clínica. Como posso ajudar?",
+    "REQUEST_FULL_NAME": lambda v: "Para iniciarmos o agendamento, poderia me informar seu nome completo?",
+    "REQUEST_SPECIALTY": lambda v: f"{v.get('user_name', '')}, para qual especialidade você gostaria de agendar?",
+    "REQUEST_PROFESSIONAL_PREFERENCE": lambda v: (
+        f"Para {v.get('user_specialty', 'a especialidade')}, você gostaria de escolher um profissional específico "
+        "ou prefere que eu indique os disponíveis?"
+    ),
+    "CLASSIFY_PROFESSIONAL_PREFERENCE": _rule_professional_preference,
+    "REQUEST_SPECIFIC_PROFESSIONAL_NAME": lambda v: "Por favor, informe o nome completo do profissional desejado.",
+    "REQUEST_DATE_TIME": lambda v: "Qual data e horário você teria preferência?",
+    "REQUEST_TURN_PREFERENCE": lambda v: f"{v.get('user_name', '')}, você prefere o período da MANHÃ ou da TARDE?",
+    "VALIDATE_SPECIALTY": _rule_validate_specialty,
+    "MATCH_OFFICIAL_SPECIALTY": _rule_match_list("normalized_user_input_specialty", "official_specialties_list_str"),
+    "MATCH_SPECIFIC_PROFESSIONAL_NAME": _rule_match_list("user_typed_name", "professional_names_from_api_list_str"),
+    "VALIDATE_CHOSEN_DATE": _rule_chosen_option,
+    "PRESENT_AVAILABLE_TIMES": lambda v: (
+        f"Certo, {v.get('user_name', '')}, para {v.get('professional_name', '')} no dia {v.get('chosen_date', '')} "
+        f"encontrei estes horários:\n{v.get('available_times_list_str', '')}\nQual você prefere?"
+    ),
+    "VALIDATE_CHOSEN_TIME": _rule_chosen_option,
+    "FINAL_SCHEDULING_CONFIRMATION": lambda v: (
+        f"Ok, {v.get('user_name', '')}, seu agendamento para {v.get('chosen_specialty', '')} com "
+        f"{v.get('chosen_professional_name', '')} está pré-agendado para {v.get('chosen_date_display', '')} "
+        f"às {v.get('chosen_time', '')}. Podemos confirmar?"
+    ),
+    "VALIDATE_FINAL_CONFIRMATION": _rule_final_confirmation,
+    "EXTRACT_FULL_NAME": _rule_extract_full_name,
+    "CHECK_CANCELLATION": _rule_check_cancellation,
+    "SCHEDULING_SUCCESS_MESSAGE": lambda v: (
+        f"Tudo certo, {v.get('user_name', '')}! Seu agendamento está confirmado. "
+        f"O número de confirmação é {v.get('agendamento_id_api', '')}."
+    ),
+    "VALIDATE_FALLBACK_CHOICE": _rule_fallback_choice,
+    UNKNOWN_TEMPLATE: _rule_unknown,
+}
+
+
+def recording_key(template_name: str, variables: Dict[str, str]) -> str:
+    """Chave estável de uma gravação: template + hash das variáveis."""
+    payload = json.dumps(variables, sort_keys=True, ensure_ascii=False)
+    return f"{template_name}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def load_recordings(path: str) -> Dict[str, str]:
+    """
+    Lê gravações em JSONL: {"template": ..., "variables": {...}, "response": ...}.
+    Sem "variables", a resposta vale para qualquer chamada do template.
+    """
+    recordings: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("variables") is None:
+                recordings[record["template"]] = record["response"]
+            else:
+                recordings[recording_key(record["template"], record["variables"])] = record["response"]
+    return recordings
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Substituto determinístico do ChatOpenAI para testes de carga e benchmarks sem rede.
+    - mode "rules": respostas geradas por regras por template de conversation_prompts.
+    - mode "recorded": respostas de um JSONL gravado (RecordingChatModel), caindo nas regras quando não há gravação.
+    Latência simulada ("fixed", "uniform" ou "lognormal") e taxa de erro são configuráveis.
+    """
+
+    mode: str = "rules"
+    recordings: Dict[str, str] = {}
+    latency_distribution: str = "lognormal"
+    latency_ms: float = 600.0
+    latency_jitter: float = 0.5
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+    matcher: Any = None
+    rng: Any = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        if self.matcher is None:
+            self.matcher = get_template_matcher()
+        if self.rng is None:
+            self.rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "latency_distribution": self.latency_distribution, "latency_ms": self.latency_ms}
+
+    def sample_latency_seconds(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_distribution == "fixed":
+            latency_ms = self.latency_ms
+        elif self.latency_distribution == "uniform":
+            latency_ms = self.rng.uniform(self.latency_ms * (1 - self.latency_jitter), self.latency_ms * (1 + self.latency_jitter))
+        else:
+            # latency_ms é a mediana; latency_jitter é o sigma do log (0.5 ~ p99 3.2x a mediana).
+            latency_ms = self.rng.lognormvariate(0.0, self.latency_jitter) * self.latency_ms
+        return max(latency_ms, 0.0) / 1000.0
+
+    def respond(self, messages: List[BaseMessage]) -> Tuple[str, str]:
+        """Retorna (nome do template reconhecido, resposta)."""
+        template_name, variables = self.matcher.match(messages)
+        if self.mode == "recorded":
+            response = self.recordings.get(recording_key(template_name, variables)) or self.recordings.get(template_name)
+            if response is not None:
+                return template_name, response
+        return template_name, _RULES.get(template_name, _rule_unknown)(variables)
+
+    def _build_result(self, messages: List[BaseMessage], template_name: str, content: str) -> ChatResult:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4 + 4 * len(messages)
+        output_tokens = max(1, len(content) // 4)
+        message = AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+            response_metadata={"model_name": "fake-chat", "template": template_name},
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}},
+        )
+
+    def _should_fail(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.sample_latency_seconds())
+        if self._should_fail():
+            raise FakeLLMError("Erro simulado pelo FakeChatModel.")
+        template_name, content = self.respond(messages)
+        return self._build_result(messages, template_name, content)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.sample_latency_seconds())
+        if self._should_fail():
+            raise FakeLLMError("Erro simulado pelo FakeChatModel.")
+        template_name, content = self.respond(messages)
+        return self._build_result(messages, template_name, content)
+
+
+class RecordingChatModel(BaseChatModel):
+    """Encapsula o modelo real e grava (template, variáveis, resposta) no JSONL lido pelo modo "recorded"."""
+
+    inner: BaseChatModel
+    path: str
+    matcher: Any = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"recording-{self.inner._llm_type}"
+
+    def _record(self, messages: List[BaseMessage], result: ChatResult) -> None:
+        template_name, variables = (self.matcher or get_template_matcher()).match(messages)
+        record = {"template": template_name, "variables": variables, "response": result.generations[0].message.content}
+        with _recording_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._record(messages, result)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._record(messages, result)
+        return result
+
+
+_recording_lock = threading.Lock()
+_recordings_cache: Dict[str, Dict[str, str]] = {}
+
+
+def build_fake_chat_model(seed_offset: int = 0) -> FakeChatModel:
+    """Cria o FakeChatModel a partir das configurações LLM_FAKE_* do Settings."""
+    recordings: Dict[str, str] = {}
+    if settings.LLM_FAKE_MODE == "recorded":
+        if not settings.LLM_FAKE_RECORDINGS_PATH:
+            raise ValueError("LLM_FAKE_MODE=recorded exige LLM_FAKE_RECORDINGS_PATH.")
+        if settings.LLM_FAKE_RECORDINGS_PATH not in _recordings_cache:
+            _recordings_cache[settings.LLM_FAKE_RECORDINGS_PATH] = load_recordings(settings.LLM_FAKE_RECORDINGS_PATH)
+        recordings = _recordings_cache[settings.LLM_FAKE_RECORDINGS_PATH]
+    return FakeChatModel(
+        mode=settings.LLM_FAKE_MODE,
+        recordings=recordings,
+        latency_distribution=settings.LLM_FAKE_LATENCY_DISTRIBUTION,
+        latency_ms=settings.LLM_FAKE_LATENCY_MS,
+        latency_jitter=settings.LLM_FAKE_LATENCY_JITTER,
+        error_rate=settings.LLM_FAKE_ERROR_RATE,
+        seed=None if settings.LLM_FAKE_SEED is None else settings.LLM_FAKE_SEED + seed_offset,
+    )
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import CheckpointTuple, copy_checkpoint
+
+from app.core.config import settings
+
+ThreadKey = Tuple[str, str]  # (thread_id, checkpoint_ns)
+
+
+def _copy_tuple(checkpoint_tuple: CheckpointTuple) -> CheckpointTuple:
+    # O loop do LangGraph altera channel_versions/versions_seen do checkpoint carregado: cada leitura recebe uma cópia.
+    return checkpoint_tuple._replace(
+        checkpoint=copy_checkpoint(checkpoint_tuple.checkpoint),
+        metadata=dict(checkpoint_tuple.metadata),
+        pending_writes=list(checkpoint_tuple.pending_writes or []),
+    )
+
+
+class HotSessionCache:
+    """
+    LRU em processo com o último checkpoint de cada thread, alimentado pelas leituras e escritas do checkpointer
+    depois do commit do turno (PendingSessionUpdates). O worker que atendeu o telefone há pouco não precisa recarregar o estado do Postgres no turno
+    seguinte; a validação da versão (HOT_SESSION_CACHE_VALIDATION) fica a cargo do checkpointer.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[ThreadKey, CheckpointTuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: ThreadKey) -> Optional[CheckpointTuple]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            self._entries.move_to_end(key)
+        return _copy_tuple(cached)
+
+    def put(self, key: ThreadKey, checkpoint_tuple: CheckpointTuple) -> None:
+        stored = _copy_tuple(checkpoint_tuple)
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add_writes(self, key: ThreadKey, checkpoint_id: str, task_id: str, writes: Sequence[Tuple[str, Any]]) -> None:
+        """Anexa writes pendentes ao checkpoint em cache, se ele ainda for o `checkpoint_id` delas."""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.checkpoint["id"] == checkpoint_id:
+                cached.pending_writes.extend((task_id, channel, value) for channel, value in writes)
+
+    def invalidate(self, key: ThreadKey) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PendingSessionUpdates:
+    """
+    Atualizações do cache feitas pelo checkpointer durante um turno. Ficam aqui até a transação do turno ser
+    confirmada (publish); se ela for desfeita, discard() tira as threads do turno do cache. Assim o cache nunca guarda
+    um checkpoint que não chegou ao Postgres. Uma instância por checkpointer (por turno), usada num só event loop.
+    """
+
+    def __init__(self, cache: HotSessionCache):
+        self.cache = cache
+        # None marca a thread para sair do cache na publicação.
+        self._entries: Dict[ThreadKey, Optional[CheckpointTuple]] = {}
+
+    def lookup(self, key: ThreadKey) -> Tuple[bool, Optional[CheckpointTuple]]:
+        """(a thread foi alterada no turno, último checkpoint dela no turno ou None se precisar ler do banco)."""
+        if key not in self._entries:
+            return False, None
+        staged = self._entries[key]
+        return True, _copy_tuple(staged) if staged is not None else None
+
+    def put(self, key: ThreadKey, checkpoint_tuple: CheckpointTuple) -> None:
+        self._entries[key] = _copy_tuple(checkpoint_tuple)
+
+    def add_writes(self, key: ThreadKey, checkpoint_id: str, task_id: str, writes: Sequence[Tuple[str, Any]]) -> None:
+        """Anexa writes ao checkpoint do turno (ou ao do cache, copiado para o turno) se ele for o `checkpoint_id` delas."""
+        staged = self._entries[key] if key in self._entries else self.cache.get(key)
+        if staged is not None and staged.checkpoint["id"] == checkpoint_id:
+            staged.pending_writes.extend((task_id, channel, value) for channel, value in writes)
+            self._entries[key] = staged
+
+    def invalidate(self, key: ThreadKey) -> None:
+        self._entries[key] = None
+
+    def publish(self) -> None:
+        """Transação confirmada: leva os checkpoints do turno para o cache."""
+        entries, self._entries = self._entries, {}
+        for key, checkpoint_tuple in entries.items():
+            if checkpoint_tuple is None:
+                self.cache.invalidate(key)
+            else:
+                self.cache.put(key, checkpoint_tuple)
+
+    def discard(self) -> None:
+        """Transação desfeita: as threads do turno saem do cache."""
+        entries, self._entries = self._entries, {}
+        for key in entries:
+            self.cache.invalidate(key)
+
+
+_hot_session_cache: Optional[HotSessionCache] = None
+_hot_session_cache_lock = threading.Lock()
+
+
+def get_hot_session_cache() -> Optional[HotSessionCache]:
+    """Cache de sessões do worker, ou None com HOT_SESSION_CACHE_ENABLED desligado."""
+    global _hot_session_cache
+    if not settings.HOT_SESSION_CACHE_ENABLED:
+        return None
+    if _hot_session_cache is None:
+        with _hot_session_cache_lock:
+            if _hot_session_cache is None:
+                _hot_session_cache = HotSessionCache(settings.HOT_SESSION_CACHE_MAX_ENTRIES)
+    return _hot_session_cache
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.application.prompts.prompt_identification import template_from_metadata
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CREATE_USAGE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_token_usage (
+    usage_date date NOT NULL,
+    session_id text NOT NULL,
+    node text NOT NULL,
+    prompt_template text NOT NULL,
+    model text NOT NULL,
+    calls bigint NOT NULL DEFAULT 0,
+    prompt_tokens bigint NOT NULL DEFAULT 0,
+    completion_tokens bigint NOT NULL DEFAULT 0,
+    latency_ms_total double precision NOT NULL DEFAULT 0,
+    cost_usd numeric(14, 6) NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (usage_date, session_id, node, prompt_template, model)
+)
+"""
+
+UPSERT_USAGE_SQL = """
+INSERT INTO llm_token_usage AS u
+    (usage_date, session_id, node, prompt_template, model, calls, prompt_tokens, completion_tokens, latency_ms_total, cost_usd)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (usage_date, session_id, node, prompt_template, model) DO UPDATE SET
+    calls = u.calls + EXCLUDED.calls,
+    prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+    completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+    latency_ms_total = u.latency_ms_total + EXCLUDED.latency_ms_total,
+    cost_usd = u.cost_usd + EXCLUDED.cost_usd,
+    updated_at = now()
+"""
+
+# Colunas aceitas no agrupamento do resumo (whitelist: o valor entra no SQL).
+SUMMARY_GROUP_COLUMNS = {
+    "node": "node",
+    "template": "prompt_template",
+    "session": "session_id",
+    "model": "model",
+    "day": "usage_date",
+}
+
+
+class LLMBudgetExceededError(Exception):
+    """Levantada (LLM_TURN_BUDGET_MODE=raise) quando um turno passa do limite de chamadas ou de tokens."""
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Custo pelo LLM_PRICING (USD por 1M tokens). Nomes com sufixo de versão usam o prefixo mais longo conhecido."""
+    pricing = settings.LLM_PRICING.get(model)
+    if pricing is None:
+        candidates = [name for name in settings.LLM_PRICING if model.startswith(name)]
+        if not candidates:
+            return 0.0
+        pricing = settings.LLM_PRICING[max(candidates, key=len)]
+    return (prompt_tokens * pricing.get("input", 0.0) + completion_tokens * pricing.get("output", 0.0)) / 1_000_000
+
+
+@dataclass
+class _UsageAggregate:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms_total: float = 0.0
+    cost_usd: float = 0.0
+
+
+class LLMUsageAccountant:
+    """
+    Agrega o uso de LLM em memória por (dia, sessão, nó, template, modelo) e grava periodicamente na
+    tabela llm_token_usage com upsert incremental, sem custo de banco no caminho da chamada.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[date, str, str, str, str], _UsageAggregate] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, node: str, template: str, model: str, prompt_tokens: int, completion_tokens: int, latency_ms: float) -> None:
+        key = (date.today(), session_id, node, template, model)
+        with self._lock:
+            aggregate = self._pending.setdefault(key, _UsageAggregate())
+            aggregate.calls += 1
+            aggregate.prompt_tokens += prompt_tokens
+            aggregate.completion_tokens += completion_tokens
+            aggregate.latency_ms_total += latency_ms
+            aggregate.cost_usd += estimate_cost_usd(model, prompt_tokens, completion_tokens)
+
+    def _drain(self) -> Dict[Tuple[date, str, str, str, str], _UsageAggregate]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending: Dict[Tuple[date, str, str, str, str], _UsageAggregate]) -> None:
+        with self._lock:
+            for key, aggregate in pending.items():
+                current = self._pending.setdefault(key, _UsageAggregate())
+                current.calls += aggregate.calls
+                current.prompt_tokens += aggregate.prompt_tokens
+                current.completion_tokens += aggregate.completion_tokens
+                current.latency_ms_total += aggregate.latency_ms_total
+                current.cost_usd += aggregate.cost_usd
+
+    @staticmethod
+    async def setup(conn: Any) -> None:
+        await conn.execute(CREATE_USAGE_TABLE_SQL)
+
+    async def flush(self, db_pool: Any) -> int:
+        """Grava o que está pendente; em caso de erro os valores voltam para a memória. Retorna as linhas gravadas."""
+        pending = self._drain()
+        if not pending:
+            return 0
+        rows = [
+            (*key, a.calls, a.prompt_tokens, a.completion_tokens, a.latency_ms_total, round(a.cost_usd, 6))
+            for key, a in pending.items()
+        ]
+        try:
+            async with db_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(UPSERT_USAGE_SQL, rows)
+        except Exception:
+            self._restore(pending)
+            raise
+        return len(rows)
+
+    @staticmethod
+    async def summary(db_pool: Any, group_by: str = "node", days: int = 1, limit: int = 50) -> List[Dict[str, Any]]:
+        column = SUMMARY_GROUP_COLUMNS[group_by]
+        query = f"""
+            SELECT {column} AS key,
+                   sum(calls) AS calls,
+                   sum(prompt_tokens) AS prompt_tokens,
+                   sum(completion_tokens) AS completion_tokens,
+                   sum(cost_usd) AS cost_usd,
+                   sum(latency_ms_total) / nullif(sum(calls), 0) AS avg_latency_ms
+            FROM llm_token_usage
+            WHERE usage_date > current_date - %s
+            GROUP BY 1
+            ORDER BY sum(prompt_tokens) + sum(completion_tokens) DESC
+            LIMIT %s
+        """
+        async with db_pool.connection() as conn:
+            cursor = await conn.execute(query, (days, limit))
+            rows = await cursor.fetchall()
+        return [
+            {
+                group_by: str(key),
+                "calls": int(calls),
+                "prompt_tokens": int(prompt_tokens),
+                "completion_tokens": int(completion_tokens),
+                "cost_usd": float(cost_usd),
+                "avg_latency_ms": round(float(avg_latency_ms or 0.0), 1),
+            }
+            for key, calls, prompt_tokens, completion_tokens, cost_usd, avg_latency_ms in rows
+        ]
+
+
+def _usage_from_result(response: LLMResult) -> Tuple[int, int, Optional[str]]:
+    """(prompt_tokens, completion_tokens, modelo) da resposta, pelo usage_metadata da mensagem ou pelo llm_output."""
+    generation = response.generations[0][0] if response.generations and response.generations[0] else None
+    message = getattr(generation, "message", None)
+    usage = getattr(message, "usage_metadata", None) or {}
+    llm_output = response.llm_output or {}
+    if usage:
+        prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        token_usage = llm_output.get("token_usage") or {}
+        prompt_tokens, completion_tokens = token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+    model = (getattr(message, "response_metadata", None) or {}).get("model_name") or llm_output.get("model_name")
+    return int(prompt_tokens or 0), int(completion_tokens or 0), model
+
+
+class TokenAccountingCallbackHandler(BaseCallbackHandler):
+    """
+    Callback de um turno: registra tokens e latência de cada chamada ao LLM no LLMUsageAccountant, com a sessão
+    (thread_id), o nó (langgraph_node) e o template marcado na chamada (prompt_config), e soma o uso do turno para o orçamento.
+    """
+
+    run_inline = True
+
+    def __init__(self, session_id: str, accountant: Optional[LLMUsageAccountant] = None):
+        self.session_id = session_id
+        self.accountant = accountant or get_llm_usage_accountant()
+        self.turn_calls = 0
+        self.turn_tokens = 0
+        self._started: Dict[UUID, Tuple[float, str, str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id=None, tags=None, metadata=None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        template = template_from_metadata(metadata)
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), metadata.get("langgraph_node", "-"), template, metadata.get("ls_model_name"))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        start, node, template, ls_model_name = started
+        prompt_tokens, completion_tokens, model = _usage_from_result(response)
+        model = model or ls_model_name or "unknown"
+        with self._lock:
+            self.turn_calls += 1
+            self.turn_tokens += prompt_tokens + completion_tokens
+        self.accountant.record(
+            self.session_id, node, template, model, prompt_tokens, completion_tokens, (time.perf_counter() - start) * 1000
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started.pop(run_id, None)
+
+    def check_turn_budget(self) -> None:
+        """Compara o uso do turno com LLM_TURN_MAX_CALLS/LLM_TURN_MAX_TOKENS; registra ou levanta conforme o modo."""
+        violations = []
+        if settings.LLM_TURN_MAX_CALLS is not None and self.turn_calls > settings.LLM_TURN_MAX_CALLS:
+            violations.append(f"{self.turn_calls} chamadas (limite {settings.LLM_TURN_MAX_CALLS})")
+        if settings.LLM_TURN_MAX_TOKENS is not None and self.turn_tokens > settings.LLM_TURN_MAX_TOKENS:
+            violations.append(f"{self.turn_tokens} tokens (limite {settings.LLM_TURN_MAX_TOKENS})")
+        if not violations:
+            return
+        message = f"Orçamento de LLM do turno excedido na sessão {self.session_id}: {', '.join(violations)}"
+        if settings.LLM_TURN_BUDGET_MODE == "raise":
+            raise LLMBudgetExceededError(message)
+        logger.warning(message)
+
+
+_llm_usage_accountant: Optional[LLMUsageAccountant] = None
+_llm_usage_accountant_lock = threading.Lock()
+
+
+def get_llm_usage_accountant() -> LLMUsageAccountant:
+    global _llm_usage_accountant
+    if _llm_usage_accountant is None:
+        with _llm_usage_accountant_lock:
+            if _llm_usage_accountant is None:
+                _llm_usage_accountant = LLMUsageAccountant()
+    return _llm_usage_accountant
+
+
+async def run_usage_flusher(db_pool: Any, interval_seconds: float) -> None:
+    """Tarefa do lifespan: grava o uso agregado a cada `interval_seconds` e uma última vez ao ser cancelada."""
+    accountant = get_llm_usage_accountant()
+    try:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await accountant.flush(db_pool)
+            except Exception as e:
+                logger.error(f"Falha ao gravar o uso de LLM em llm_token_usage: {e}")
+    except asyncio.CancelledError:
+        try:
+            await accountant.flush(db_pool)
+        except Exception as e:
+            logger.error(f"Falha ao gravar o uso de LLM pendente no encerramento: {e}")
+        raise
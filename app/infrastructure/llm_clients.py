@@ -1,23 +1,104 @@
+from typing import Any, Dict, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 from app.core.config import settings
+from app.application.prompts.conversation_prompts import BATCHABLE_CLASSIFICATION_PROMPTS
+from app.infrastructure.fake_llm import RecordingChatModel, build_fake_chat_model
+from app.infrastructure.llm_batching import MicroBatchingChatModel, get_template_batcher
+from app.infrastructure.llm_gateway import GatedChatModel, get_llm_gateway
+from app.infrastructure.llm_latency import LatencyAdaptiveChatModel, get_latency_tracker
 
-_llm_client_cache: ChatOpenAI | None = None
+_llm_client_cache: Dict[str, BaseChatModel] = {}
+_node_llm_client_cache: Dict[str, BaseChatModel] = {}
 
-def get_llm_client() -> ChatOpenAI:
+def get_llm_client(profile: str = "default") -> BaseChatModel:
     """
-    Retorna uma instância configurada do ChatOpenAI.
-    Utiliza um cache simples para retornar a mesma instância se já criada.
+    Retorna uma instância configurada do ChatOpenAI para o perfil informado (ver Settings.LLM_PROFILES),
+    encapsulada pelo LLM Gateway (limite de concorrência, rate limit de requisições/tokens e fila com prioridade).
+    Com LLM_BACKEND="fake", o ChatOpenAI é substituído pelo FakeChatModel (sem rede).
+    Utiliza um cache simples para retornar a mesma instância por perfil se já criada.
     """
-    global _llm_client_cache
-    if _llm_client_cache is None:
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY não está configurada nas variáveis de ambiente ou no arquivo .env.")
-        
-        _llm_client_cache = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model=settings.OPENAI_MODEL_NAME,
-            temperature=settings.OPENAI_TEMPERATURE
-            
+    if profile not in _llm_client_cache:
+        if profile not in settings.LLM_PROFILES:
+            raise ValueError(f"Perfil de LLM '{profile}' não está definido em LLM_PROFILES.")
+
+        profile_config = settings.LLM_PROFILES[profile]
+        if settings.LLM_BACKEND == "fake":
+            chat_model = build_fake_chat_model(seed_offset=len(_llm_client_cache))
+        else:
+            if not settings.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY não está configurada nas variáveis de ambiente ou no arquivo .env.")
+            chat_model = ChatOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                model=profile_config.model,
+                temperature=profile_config.temperature,
+                max_tokens=profile_config.max_tokens,
+                timeout=profile_config.timeout,
+            )
+            if settings.LLM_RECORD_PATH:
+                chat_model = RecordingChatModel(inner=chat_model, path=settings.LLM_RECORD_PATH)
+        _llm_client_cache[profile] = GatedChatModel(
+            inner=chat_model,
+            gateway=get_llm_gateway(),
+            priority=profile_config.priority or settings.LLM_DEFAULT_PRIORITY,
+            estimated_completion_tokens=settings.LLM_ESTIMATED_COMPLETION_TOKENS,
         )
-    return _llm_client_cache
+    return _llm_client_cache[profile]
+
+def get_llm_profile_for_node(node_name: str, role: Optional[str] = None) -> str:
+    """
+    Resolve o perfil de LLM de um nó do grafo a partir de Settings.LLM_NODE_PROFILES.
+    Com `role` (ex.: "classifier"), procura primeiro a chave "<nó>.<role>".
+    """
+    if role:
+        return settings.LLM_NODE_PROFILES.get(f"{node_name}.{role}", get_llm_profile_for_node(node_name))
+    return settings.LLM_NODE_PROFILES.get(node_name, "default")
 
+def _get_node_setting(mapping: Dict[str, Any], node_name: str, role: Optional[str], default: Any = None) -> Any:
+    if role and f"{node_name}.{role}" in mapping:
+        return mapping[f"{node_name}.{role}"]
+    return mapping.get(node_name, default)
+
+def _maybe_batching(client: BaseChatModel, node_key: str, profile: str) -> BaseChatModel:
+    """Encapsula o cliente no micro-batching se o nó estiver em LLM_BATCHING_NODES e o recurso estiver habilitado."""
+    template_name = settings.LLM_BATCHING_NODES.get(node_key)
+    if not settings.LLM_BATCHING_ENABLED or not template_name:
+        return client
+    template, variable, labels = BATCHABLE_CLASSIFICATION_PROMPTS[template_name]
+    batcher = get_template_batcher(
+        template_name,
+        template,
+        variable,
+        labels,
+        window_seconds=settings.LLM_BATCH_WINDOW_MS / 1000.0,
+        max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+        max_tokens_per_item=settings.LLM_PROFILES[profile].max_tokens or 32,
+    )
+    return MicroBatchingChatModel(inner=client, batcher=batcher)
+
+def get_node_llm_client(node_name: str, role: Optional[str] = None) -> BaseChatModel:
+    """
+    Retorna o cliente de LLM roteado para o nó (e papel, se informado), com o SLO de latência do nó:
+    prazo por chamada, retry único no perfil LLM_FALLBACK_PROFILE e resposta determinística (LLM_CANNED_RESPONSES).
+    """
+    node_key = f"{node_name}.{role}" if role else node_name
+    if node_key not in _node_llm_client_cache:
+        profile = get_llm_profile_for_node(node_name, role)
+        fallback_profile = settings.LLM_FALLBACK_PROFILE
+        fallback_model = get_llm_client(fallback_profile) if fallback_profile and fallback_profile != profile else None
+        _node_llm_client_cache[node_key] = LatencyAdaptiveChatModel(
+            inner=_maybe_batching(get_llm_client(profile=profile), node_key, profile),
+            node_key=node_key,
+            deadline_seconds=_get_node_setting(
+                settings.LLM_NODE_DEADLINE_SECONDS, node_name, role, settings.LLM_DEFAULT_DEADLINE_SECONDS
+            ),
+            fallback_model=fallback_model,
+            fallback_deadline_seconds=settings.LLM_FALLBACK_DEADLINE_SECONDS,
+            canned_response=_get_node_setting(settings.LLM_CANNED_RESPONSES, node_name, role),
+            degraded_p95_ratio=settings.LLM_DEGRADED_P95_RATIO,
+            degraded_min_samples=settings.LLM_DEGRADED_MIN_SAMPLES,
+            degraded_cooldown_seconds=settings.LLM_DEGRADED_COOLDOWN_SECONDS,
+            tracker=get_latency_tracker(),
+        )
+    return _node_llm_client_cache[node_key]
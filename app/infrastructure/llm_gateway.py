@@ -0,0 +1,502 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import ConfigDict
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lanes de prioridade: valores menores são atendidos primeiro.
+PRIORITY_LANES: Dict[str, int] = {
+    "interactive": 0,
+    "normal": 1,
+    "background": 2,
+}
+
+
+# Quem acompanha a chamada no contexto dela (ex.: o prazo do LatencyAdaptiveChatModel): o GatedChatModel chama
+# listener.queued() ao entrar na fila do gateway e listener.admitted() ao receber a vaga.
+_admission_listener: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("llm_admission_listener", default=None)
+
+
+def set_admission_listener(listener: Optional[Any]) -> contextvars.Token:
+    return _admission_listener.set(listener)
+
+
+def reset_admission_listener(token: contextvars.Token) -> None:
+    _admission_listener.reset(token)
+
+
+def get_admission_listener() -> Optional[Any]:
+    return _admission_listener.get()
+
+
+class LLMGatewayTimeoutError(Exception):
+    """Levantada quando uma chamada ao LLM espera na fila mais do que o permitido."""
+
+
+class TokenBucket:
+    """
+    Token bucket local (por processo) e thread-safe.
+    `capacity` é o máximo acumulável e `refill_per_second` a taxa de reposição.
+    """
+
+    def __init__(self, name: str, capacity: float, refill_per_second: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        Tenta consumir `amount` tokens.
+        Retorna 0.0 se conseguiu, ou o tempo estimado (em segundos) até haver saldo suficiente.
+        """
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.refill_per_second
+
+    def adjust(self, delta: float) -> None:
+        """Devolve (delta > 0) ou debita (delta < 0) tokens após a reconciliação do uso real."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+CREATE_BUCKETS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_rate_limit_buckets (
+    name TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+INSERT_BUCKET_SQL = """
+INSERT INTO llm_rate_limit_buckets (name, tokens, updated_at)
+VALUES (%(name)s, %(capacity)s, now())
+ON CONFLICT (name) DO NOTHING;
+"""
+
+TAKE_FROM_BUCKET_SQL = """
+WITH current_bucket AS (
+    SELECT name,
+           LEAST(%(capacity)s, tokens + %(rate)s * EXTRACT(EPOCH FROM (now() - updated_at))) AS level
+      FROM llm_rate_limit_buckets
+     WHERE name = %(name)s
+       FOR UPDATE
+)
+UPDATE llm_rate_limit_buckets b
+   SET tokens = CASE WHEN current_bucket.level >= %(amount)s
+                     THEN current_bucket.level - %(amount)s
+                     ELSE current_bucket.level END,
+       updated_at = now()
+  FROM current_bucket
+ WHERE b.name = current_bucket.name
+RETURNING current_bucket.level;
+"""
+
+ADJUST_BUCKET_SQL = """
+UPDATE llm_rate_limit_buckets
+   SET tokens = LEAST(%(capacity)s, tokens + %(rate)s * EXTRACT(EPOCH FROM (now() - updated_at)) + %(delta)s),
+       updated_at = now()
+ WHERE name = %(name)s;
+"""
+
+
+class PostgresTokenBucket(TokenBucket):
+    """
+    Token bucket coordenado entre processos/réplicas via uma linha no Postgres.
+    O refill e o consumo são feitos atomicamente em um único UPDATE.
+    Em caso de falha no banco, degrada para o bucket local do processo.
+    """
+
+    def __init__(self, name: str, capacity: float, refill_per_second: float, conninfo: str):
+        super().__init__(name, capacity, refill_per_second)
+        self._conninfo = conninfo
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _params(self, **extra: Any) -> Dict[str, Any]:
+        return {"name": self.name, "capacity": self.capacity, "rate": self.refill_per_second, **extra}
+
+    def _get_connection(self):
+        import psycopg
+
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg.connect(self._conninfo, autocommit=True)
+            self._conn.execute(CREATE_BUCKETS_TABLE_SQL)
+            self._conn.execute(INSERT_BUCKET_SQL, self._params())
+        return self._conn
+
+    def try_acquire(self, amount: float) -> float:
+        amount = min(float(amount), self.capacity)
+        try:
+            with self._conn_lock:
+                row = self._get_connection().execute(TAKE_FROM_BUCKET_SQL, self._params(amount=amount)).fetchone()
+        except Exception as e:
+            logger.warning("LLM Gateway: falha ao consultar bucket '%s' no Postgres, usando bucket local: %s", self.name, e)
+            self._conn = None
+            return super().try_acquire(amount)
+
+        level = float(row[0]) if row else self.capacity
+        if level >= amount:
+            return 0.0
+        return (amount - level) / self.refill_per_second
+
+    def adjust(self, delta: float) -> None:
+        try:
+            with self._conn_lock:
+                self._get_connection().execute(ADJUST_BUCKET_SQL, self._params(delta=delta))
+        except Exception as e:
+            logger.warning("LLM Gateway: falha ao ajustar bucket '%s' no Postgres: %s", self.name, e)
+            self._conn = None
+            super().adjust(delta)
+
+
+@dataclass
+class GatewayTicket:
+    priority: str
+    estimated_tokens: int
+    queued_at: float
+    admitted_at: float = 0.0
+
+    @property
+    def wait_seconds(self) -> float:
+        return self.admitted_at - self.queued_at
+
+
+@dataclass
+class _LaneStats:
+    admitted: int = 0
+    timeouts: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    waiting: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "waiting": self.waiting,
+            "total_wait_seconds": round(self.total_wait_seconds, 4),
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+            "avg_wait_seconds": round(self.total_wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+        }
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    ticket: GatewayTicket = field(compare=False)
+    # Acorda quem espera (threading.Event.set ou set_result da future no loop dela); False se não há mais quem acordar.
+    wake: Callable[[], bool] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+
+
+def _wake_future(loop: asyncio.AbstractEventLoop, future: "asyncio.Future[None]") -> bool:
+    def _set() -> None:
+        if not future.done():
+            future.set_result(None)
+
+    try:
+        loop.call_soon_threadsafe(_set)
+    except RuntimeError:  # loop já fechado: o waiter não existe mais
+        return False
+    return True
+
+
+class LLMGateway:
+    """
+    Controla o acesso ao provedor de LLM:
+    - no máximo `max_in_flight` chamadas simultâneas por processo;
+    - token buckets de requisições/minuto e tokens/minuto (locais ou no Postgres);
+    - fila com lanes de prioridade (FIFO dentro da mesma lane);
+    - métricas de tempo de fila por lane.
+    Em sobrecarga, as chamadas esperam na fila em vez de falhar com 429.
+
+    Chamadas síncronas (threads) e assíncronas dividem a mesma fila: a vaga é entregue ao primeiro da fila sob um
+    lock curto e quem espera é acordado pelo seu próprio mecanismo (Event ou future do event loop), sem thread extra
+    por chamada assíncrona. Os token buckets (que podem ir ao Postgres) são consumidos fora do lock, já com a vaga.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        request_bucket: TokenBucket,
+        token_bucket: TokenBucket,
+        queue_timeout_seconds: float,
+    ):
+        self.max_in_flight = max_in_flight
+        self.request_bucket = request_bucket
+        self.token_bucket = token_bucket
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._rate_limited_waits = 0
+        self._lane_stats: Dict[str, _LaneStats] = {lane: _LaneStats() for lane in PRIORITY_LANES}
+
+    def _take_budget(self, estimated_tokens: int) -> float:
+        """Consome 1 requisição e `estimated_tokens` tokens. Retorna o tempo de espera se faltar saldo."""
+        wait = self.request_bucket.try_acquire(1)
+        if wait > 0:
+            return wait
+        wait = self.token_bucket.try_acquire(estimated_tokens)
+        if wait > 0:
+            self.request_bucket.adjust(1)
+            return wait
+        return 0.0
+
+    def _grant_locked(self) -> None:
+        """Entrega as vagas livres aos primeiros da fila (chamado com self._lock)."""
+        while self._waiters and self._in_flight < self.max_in_flight:
+            waiter = heapq.heappop(self._waiters)
+            self._lane_stats[waiter.ticket.priority].waiting -= 1
+            self._in_flight += 1
+            waiter.granted = True
+            if not waiter.wake():
+                self._in_flight -= 1
+
+    def _enqueue(self, estimated_tokens: int, priority: str, wake: Callable[[], bool]) -> _Waiter:
+        if priority not in PRIORITY_LANES:
+            logger.warning("LLM Gateway: prioridade desconhecida '%s', usando 'normal'.", priority)
+            priority = "normal"
+        ticket = GatewayTicket(priority=priority, estimated_tokens=estimated_tokens, queued_at=time.monotonic())
+        waiter = _Waiter(PRIORITY_LANES[priority], next(self._seq), ticket, wake)
+        with self._lock:
+            heapq.heappush(self._waiters, waiter)
+            self._lane_stats[priority].waiting += 1
+            self._grant_locked()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool) -> None:
+        """Desiste da fila (timeout ou cancelamento): tira o waiter do heap ou devolve a vaga já entregue a ele."""
+        with self._lock:
+            if waiter.granted:
+                self._in_flight -= 1
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._lane_stats[waiter.ticket.priority].waiting -= 1
+            if timed_out:
+                self._lane_stats[waiter.ticket.priority].timeouts += 1
+            self._grant_locked()
+
+    def _timeout_error(self, priority: str) -> LLMGatewayTimeoutError:
+        return LLMGatewayTimeoutError(f"Chamada ao LLM excedeu {self.queue_timeout_seconds}s na fila do gateway (lane '{priority}').")
+
+    def _admitted(self, ticket: GatewayTicket) -> GatewayTicket:
+        ticket.admitted_at = time.monotonic()
+        with self._lock:
+            lane_stats = self._lane_stats[ticket.priority]
+            lane_stats.admitted += 1
+            lane_stats.total_wait_seconds += ticket.wait_seconds
+            lane_stats.max_wait_seconds = max(lane_stats.max_wait_seconds, ticket.wait_seconds)
+        if ticket.wait_seconds > 1.0:
+            logger.info("LLM Gateway: chamada (lane '%s') esperou %.2fs na fila.", ticket.priority, ticket.wait_seconds)
+        return ticket
+
+    def acquire(self, estimated_tokens: int, priority: str = "interactive") -> GatewayTicket:
+        """Bloqueia até a chamada poder ser feita. Levanta LLMGatewayTimeoutError se exceder o timeout de fila."""
+        event = threading.Event()
+        waiter = self._enqueue(estimated_tokens, priority, lambda: event.set() or True)
+        deadline = waiter.ticket.queued_at + self.queue_timeout_seconds
+        try:
+            if not event.wait(timeout=max(deadline - time.monotonic(), 0.0)):
+                raise self._timeout_error(waiter.ticket.priority)
+            while True:
+                budget_wait = self._take_budget(estimated_tokens)
+                if budget_wait <= 0:
+                    return self._admitted(waiter.ticket)
+                with self._lock:
+                    self._rate_limited_waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timeout_error(waiter.ticket.priority)
+                time.sleep(min(budget_wait, remaining))
+        except BaseException as e:
+            # Corrida: a vaga pode ter sido entregue logo depois do timeout do wait; _abandon devolve nesse caso.
+            self._abandon(waiter, timed_out=isinstance(e, LLMGatewayTimeoutError))
+            raise
+
+    async def aacquire(self, estimated_tokens: int, priority: str = "interactive") -> GatewayTicket:
+        """
+        Versão assíncrona de `acquire`, nativa do event loop. Cancelar quem espera (ex.: o prazo do
+        _call_with_deadline) tira a chamada da fila ou devolve a vaga, se ela já tinha sido entregue.
+        """
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        waiter = self._enqueue(estimated_tokens, priority, lambda: _wake_future(loop, future))
+        deadline = waiter.ticket.queued_at + self.queue_timeout_seconds
+        try:
+            try:
+                await asyncio.wait_for(future, timeout=max(deadline - time.monotonic(), 0.0))
+            except asyncio.TimeoutError:
+                raise self._timeout_error(waiter.ticket.priority) from None
+            while True:
+                if isinstance(self.request_bucket, PostgresTokenBucket) or isinstance(self.token_bucket, PostgresTokenBucket):
+                    budget_wait = await asyncio.to_thread(self._take_budget, estimated_tokens)
+                else:
+                    budget_wait = self._take_budget(estimated_tokens)
+                if budget_wait <= 0:
+                    return self._admitted(waiter.ticket)
+                with self._lock:
+                    self._rate_limited_waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timeout_error(waiter.ticket.priority)
+                await asyncio.sleep(min(budget_wait, remaining))
+        except BaseException as e:
+            self._abandon(waiter, timed_out=isinstance(e, LLMGatewayTimeoutError))
+            raise
+
+    def release(self, ticket: GatewayTicket, actual_tokens: Optional[int] = None) -> None:
+        """Libera a vaga de execução e reconcilia o bucket de tokens com o uso real, se conhecido."""
+        if actual_tokens is not None:
+            delta = ticket.estimated_tokens - actual_tokens
+            if delta:
+                self.token_bucket.adjust(delta)
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": len(self._waiters),
+                "rate_limited_waits": self._rate_limited_waits,
+                "lanes": {lane: stats.as_dict() for lane, stats in self._lane_stats.items()},
+            }
+
+
+def estimate_prompt_tokens(messages: List[BaseMessage]) -> int:
+    """Estimativa barata (~4 caracteres por token) usada apenas para o rate limit."""
+    total_chars = sum(len(m.content) if isinstance(m.content, str) else len(str(m.content)) for m in messages)
+    return total_chars // 4 + 4 * len(messages)
+
+
+def _actual_tokens(result: ChatResult) -> Optional[int]:
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    if token_usage.get("total_tokens"):
+        return int(token_usage["total_tokens"])
+    usage_metadata = getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+    if usage_metadata:
+        return int(usage_metadata.get("total_tokens", 0))
+    return None
+
+
+class GatedChatModel(BaseChatModel):
+    """
+    Chat model que encapsula outro chat model e passa todas as chamadas pelo LLMGateway.
+    Compatível com `invoke` e com chains (`prompt | llm_client`) usados pelos nós.
+    """
+
+    inner: BaseChatModel
+    gateway: Any
+    priority: str = "interactive"
+    estimated_completion_tokens: int = 256
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gated-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"inner": self.inner._identifying_params, "priority": self.priority}
+
+    def _estimate(self, messages: List[BaseMessage]) -> int:
+        completion_tokens = getattr(self.inner, "max_tokens", None) or self.estimated_completion_tokens
+        return estimate_prompt_tokens(messages) + completion_tokens
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        listener = _admission_listener.get()
+        if listener is not None:
+            listener.queued()
+        ticket = self.gateway.acquire(self._estimate(messages), self.priority)
+        if listener is not None:
+            listener.admitted()
+        actual_tokens = None
+        try:
+            result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            actual_tokens = _actual_tokens(result)
+            return result
+        finally:
+            self.gateway.release(ticket, actual_tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        listener = _admission_listener.get()
+        if listener is not None:
+            listener.queued()
+        ticket = await self.gateway.aacquire(self._estimate(messages), self.priority)
+        if listener is not None:
+            listener.admitted()
+        actual_tokens = None
+        try:
+            result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            actual_tokens = _actual_tokens(result)
+            return result
+        finally:
+            self.gateway.release(ticket, actual_tokens)
+
+
+_llm_gateway: Optional[LLMGateway] = None
+_llm_gateway_lock = threading.Lock()
+
+
+def _build_bucket(name: str, per_minute: int) -> TokenBucket:
+    refill_per_second = per_minute / 60.0
+    if settings.LLM_RATE_LIMIT_BACKEND == "postgres":
+        if settings.LLM_RATE_LIMIT_DATABASE_URL:
+            return PostgresTokenBucket(name, per_minute, refill_per_second, settings.LLM_RATE_LIMIT_DATABASE_URL)
+        logger.warning("LLM Gateway: LLM_RATE_LIMIT_BACKEND=postgres, mas LLM_RATE_LIMIT_DATABASE_URL não está definida. Usando bucket local.")
+    return TokenBucket(name, per_minute, refill_per_second)
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Retorna o gateway de LLM do processo (criado sob demanda a partir do Settings)."""
+    global _llm_gateway
+    if _llm_gateway is None:
+        with _llm_gateway_lock:
+            if _llm_gateway is None:
+                _llm_gateway = LLMGateway(
+                    max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+                    request_bucket=_build_bucket("llm:requests", settings.LLM_REQUESTS_PER_MINUTE),
+                    token_bucket=_build_bucket("llm:tokens", settings.LLM_TOKENS_PER_MINUTE),
+                    queue_timeout_seconds=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+                )
+                logger.info(
+                    f"LLM Gateway inicializado: max_in_flight={settings.LLM_MAX_IN_FLIGHT}, "
+                    f"rpm={settings.LLM_REQUESTS_PER_MINUTE}, tpm={settings.LLM_TOKENS_PER_MINUTE}, "
+                    f"backend={settings.LLM_RATE_LIMIT_BACKEND}"
+                )
+    return _llm_gateway
@@ -0,0 +1,299 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from opentelemetry.trace import SpanKind
+from pydantic import ConfigDict
+
+from app.core.config import settings
+from app.infrastructure.llm_gateway import reset_admission_listener, set_admission_listener
+from app.infrastructure.metrics import observe_llm_call
+from app.infrastructure.tracing import record_llm_result, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class LLMDeadlineExceededError(Exception):
+    """Levantada quando a chamada ao LLM não termina dentro do prazo do nó."""
+
+
+class LatencyTracker:
+    """
+    Janela deslizante de latências por chave (nó do grafo), thread-safe.
+    Também guarda até quando uma chave fica em modo degradado (indo direto ao modelo rápido).
+    """
+
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self._samples: Dict[str, Deque[float]] = {}
+        self._degraded_until: Dict[str, float] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency_seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window_size))
+            samples.append(latency_seconds)
+
+    def percentile(self, key: str, pct: float = 0.95) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct * (len(samples) - 1))))
+        return samples[index]
+
+    def sample_count(self, key: str) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def incr(self, key: str, counter: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(key, {})
+            counters[counter] = counters.get(counter, 0) + 1
+
+    def mark_degraded(self, key: str, cooldown_seconds: float) -> None:
+        # A janela é zerada para que, após o cooldown, o p95 reflita apenas as novas sondagens ao modelo principal.
+        with self._lock:
+            self._degraded_until[key] = time.monotonic() + cooldown_seconds
+            self._samples.pop(key, None)
+
+    def is_degraded(self, key: str) -> bool:
+        with self._lock:
+            return self._degraded_until.get(key, 0.0) > time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._samples.keys() | self._counters.keys())
+        return {
+            key: {
+                "samples": self.sample_count(key),
+                "p50_seconds": self.percentile(key, 0.50),
+                "p95_seconds": self.percentile(key, 0.95),
+                "degraded": self.is_degraded(key),
+                **self._counters.get(key, {}),
+            }
+            for key in keys
+        }
+
+
+_latency_tracker = LatencyTracker(window_size=settings.LLM_LATENCY_WINDOW)
+
+# Threads usadas para impor o prazo em chamadas síncronas (os nós rodam em threads do executor do LangGraph).
+# Uma chamada que estoura o prazo já foi admitida pelo gateway (já está no provedor) e segue até o timeout HTTP do
+# cliente; o total dessas chamadas fica limitado por LLM_MAX_IN_FLIGHT.
+_deadline_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-deadline")
+
+
+class _DeadlineClock:
+    """
+    Relógio do prazo de uma chamada. O tempo na fila do LLMGateway não conta: se a chamada entrar na fila
+    (listener.queued()), o prazo começa quando ela é admitida (listener.admitted()); sem gateway, começa já.
+    """
+
+    def __init__(self, deadline_seconds: float):
+        self.deadline_seconds = deadline_seconds
+        self.started_at = time.monotonic()
+        self._queued = False
+        self._admitted_at: Optional[float] = None
+
+    def queued(self) -> None:
+        self._queued = True
+
+    def admitted(self) -> None:
+        if self._admitted_at is None:
+            self._admitted_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        """Tempo desde o início do prazo (0 enquanto a chamada espera na fila)."""
+        if self._queued and self._admitted_at is None:
+            return 0.0
+        return time.monotonic() - (self._admitted_at if self._queued else self.started_at)
+
+    def next_timeout(self) -> float:
+        """Quanto esperar antes de olhar de novo: o que falta do prazo, ou um prazo inteiro enquanto está na fila."""
+        if self._queued and self._admitted_at is None:
+            return self.deadline_seconds
+        return max(self.deadline_seconds - self.elapsed(), 0.0)
+
+    def expired(self) -> bool:
+        return not (self._queued and self._admitted_at is None) and self.elapsed() >= self.deadline_seconds
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _latency_tracker
+
+
+class LatencyAdaptiveChatModel(BaseChatModel):
+    """
+    Chat model que aplica um prazo (SLO) por chamada ao modelo principal de um nó.
+    - Acompanha o p95 de latência do nó numa janela deslizante.
+    - Se a chamada estoura o prazo ou falha, tenta uma vez o modelo rápido (`fallback_model`).
+    - Se o modelo rápido também falhar, devolve a resposta determinística do nó (`canned_response`), quando existir.
+    - Quando o p95 do nó passa do limite, o nó entra em modo degradado por `degraded_cooldown_seconds`
+      e vai direto ao modelo rápido, sem pagar o prazo do modelo principal a cada turno.
+    """
+
+    inner: BaseChatModel
+    node_key: str
+    deadline_seconds: float
+    fallback_model: Optional[BaseChatModel] = None
+    fallback_deadline_seconds: Optional[float] = None
+    canned_response: Optional[str] = None
+    degraded_p95_ratio: float = 0.8
+    degraded_min_samples: int = 20
+    degraded_cooldown_seconds: float = 30.0
+    tracker: Any = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"latency-adaptive-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"inner": self.inner._identifying_params, "node": self.node_key, "deadline_seconds": self.deadline_seconds}
+
+    def _get_tracker(self) -> LatencyTracker:
+        return self.tracker or _latency_tracker
+
+    def _after_primary_call(self, latency_seconds: float) -> None:
+        tracker = self._get_tracker()
+        tracker.record(self.node_key, latency_seconds)
+        if tracker.sample_count(self.node_key) < self.degraded_min_samples:
+            return
+        p95 = tracker.percentile(self.node_key)
+        if p95 is not None and p95 >= self.degraded_p95_ratio * self.deadline_seconds:
+            logger.warning(
+                f"LLM SLO: p95 do nó '{self.node_key}' em {p95:.2f}s (prazo {self.deadline_seconds:.2f}s). "
+                f"Usando o modelo rápido por {self.degraded_cooldown_seconds:.0f}s."
+            )
+            tracker.mark_degraded(self.node_key, self.degraded_cooldown_seconds)
+
+    @staticmethod
+    def _failed_call_latency(clock: _DeadlineClock, error: Exception) -> float:
+        # Só o prazo estourado conta como latência "do prazo"; outros erros entram com o tempo que realmente levaram.
+        if isinstance(error, LLMDeadlineExceededError):
+            return max(clock.elapsed(), clock.deadline_seconds)
+        return clock.elapsed()
+
+    def _canned_result(self, error: Exception) -> ChatResult:
+        if self.canned_response is None:
+            raise error
+        self._get_tracker().incr(self.node_key, "canned_responses")
+        logger.warning(f"LLM SLO: nó '{self.node_key}' usando resposta determinística '{self.canned_response}' ({error}).")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.canned_response))])
+
+    @staticmethod
+    def _call_with_deadline(model: BaseChatModel, clock: _DeadlineClock, messages, stop, run_manager, **kwargs) -> ChatResult:
+        ctx = contextvars.copy_context()
+        ctx.run(set_admission_listener, clock)
+        future = _deadline_executor.submit(ctx.run, model._generate, messages, stop=stop, run_manager=run_manager, **kwargs)
+        while True:
+            try:
+                return future.result(timeout=clock.next_timeout())
+            except FutureTimeoutError:
+                if clock.expired():
+                    future.cancel()
+                    raise LLMDeadlineExceededError(f"sem resposta em {clock.deadline_seconds:.2f}s")
+
+    @staticmethod
+    async def _acall_with_deadline(model: BaseChatModel, clock: _DeadlineClock, messages, stop, run_manager, **kwargs) -> ChatResult:
+        token = set_admission_listener(clock)
+        try:
+            task = asyncio.create_task(model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+        finally:
+            reset_admission_listener(token)
+        try:
+            while True:
+                await asyncio.wait({task}, timeout=clock.next_timeout())
+                if task.done():
+                    return task.result()
+                if clock.expired():
+                    raise LLMDeadlineExceededError(f"sem resposta em {clock.deadline_seconds:.2f}s")
+        finally:
+            # Prazo estourado ou quem chamou foi cancelado: cancelar a tarefa devolve a vaga do gateway.
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        with tracer.start_as_current_span("llm.call", kind=SpanKind.CLIENT, attributes={"langgraph.node": self.node_key}) as span:
+            start = time.perf_counter()
+            result, outcome = None, "error"
+            try:
+                result, outcome = self._generate_with_slo(messages, stop, run_manager, **kwargs)
+                return result
+            finally:
+                template = observe_llm_call(run_manager, time.perf_counter() - start, outcome)
+                record_llm_result(span, template, outcome, result)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        with tracer.start_as_current_span("llm.call", kind=SpanKind.CLIENT, attributes={"langgraph.node": self.node_key}) as span:
+            start = time.perf_counter()
+            result, outcome = None, "error"
+            try:
+                result, outcome = await self._agenerate_with_slo(messages, stop, run_manager, **kwargs)
+                return result
+            finally:
+                template = observe_llm_call(run_manager, time.perf_counter() - start, outcome)
+                record_llm_result(span, template, outcome, result)
+
+    def _generate_with_slo(self, messages, stop, run_manager, **kwargs) -> Tuple[ChatResult, str]:
+        """Retorna o resultado e por onde ele veio ("primary", "fallback" ou "canned")."""
+        tracker = self._get_tracker()
+        # Em modo degradado, o modelo principal só é sondado depois do cooldown (is_degraded volta a False).
+        if self.fallback_model is None or not tracker.is_degraded(self.node_key):
+            clock = _DeadlineClock(self.deadline_seconds)
+            try:
+                result = self._call_with_deadline(self.inner, clock, messages, stop, run_manager, **kwargs)
+                self._after_primary_call(clock.elapsed())
+                return result, "primary"
+            except Exception as e:
+                self._after_primary_call(self._failed_call_latency(clock, e))
+                tracker.incr(self.node_key, "primary_failures")
+                logger.warning(f"LLM SLO: modelo principal do nó '{self.node_key}' falhou: {type(e).__name__}: {e}")
+                if self.fallback_model is None:
+                    return self._canned_result(e), "canned"
+        try:
+            tracker.incr(self.node_key, "fallback_calls")
+            fallback_clock = _DeadlineClock(self.fallback_deadline_seconds or self.deadline_seconds)
+            return self._call_with_deadline(self.fallback_model, fallback_clock, messages, stop, run_manager, **kwargs), "fallback"
+        except Exception as e:
+            tracker.incr(self.node_key, "fallback_failures")
+            logger.warning(f"LLM SLO: modelo rápido do nó '{self.node_key}' falhou: {type(e).__name__}: {e}")
+            return self._canned_result(e), "canned"
+
+    async def _agenerate_with_slo(self, messages, stop, run_manager, **kwargs) -> Tuple[ChatResult, str]:
+        tracker = self._get_tracker()
+        if self.fallback_model is None or not tracker.is_degraded(self.node_key):
+            clock = _DeadlineClock(self.deadline_seconds)
+            try:
+                result = await self._acall_with_deadline(self.inner, clock, messages, stop, run_manager, **kwargs)
+                self._after_primary_call(clock.elapsed())
+                return result, "primary"
+            except Exception as e:
+                self._after_primary_call(self._failed_call_latency(clock, e))
+                tracker.incr(self.node_key, "primary_failures")
+                logger.warning(f"LLM SLO: modelo principal do nó '{self.node_key}' falhou: {type(e).__name__}: {e}")
+                if self.fallback_model is None:
+                    return self._canned_result(e), "canned"
+        try:
+            tracker.incr(self.node_key, "fallback_calls")
+            fallback_clock = _DeadlineClock(self.fallback_deadline_seconds or self.deadline_seconds)
+            result = await self._acall_with_deadline(self.fallback_model, fallback_clock, messages, stop, run_manager, **kwargs)
+            return result, "fallback"
+        except Exception as e:
+            tracker.incr(self.node_key, "fallback_failures")
+            logger.warning(f"LLM SLO: modelo rápido do nó '{self.node_key}' falhou: {type(e).__name__}: {e}")
+            return self._canned_result(e), "canned"
+
@@ -0,0 +1,242 @@
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app.application.prompts.prompt_identification import template_from_metadata
+
+logger = logging.getLogger(__name__)
+
+# Buckets em segundos: do sub-milissegundo (nós sem I/O, checkpoints) até os turnos mais lentos com LLM.
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 12.0, 20.0, 30.0, 60.0)
+WIDE_BUCKETS = FAST_BUCKETS + (5.0, 10.0, 20.0, 30.0, 60.0)
+
+GRAPH_TURN_DURATION = Histogram(
+    "healthai_graph_turn_duration_seconds",
+    "Duração de um turno do grafo principal (da entrada da mensagem ao estado final).",
+    ["outcome"],
+    buckets=SLOW_BUCKETS,
+)
+GRAPH_NODE_DURATION = Histogram(
+    "healthai_graph_node_duration_seconds",
+    "Duração de cada nó do grafo principal, pelo nome usado em get_main_conversation_graph_definition.",
+    ["node"],
+    buckets=WIDE_BUCKETS,
+)
+LLM_CALL_DURATION = Histogram(
+    "healthai_llm_call_duration_seconds",
+    "Latência das chamadas ao LLM vista pelo nó (fila do gateway e fallback incluídos), por template de prompt.",
+    ["template", "outcome"],
+    buckets=SLOW_BUCKETS,
+)
+APPHEALTH_REQUEST_DURATION = Histogram(
+    "healthai_apphealth_request_duration_seconds",
+    "Latência das requisições à API AppHealth por endpoint.",
+    ["method", "endpoint", "status"],
+    buckets=WIDE_BUCKETS,
+)
+CHECKPOINT_OPERATION_DURATION = Histogram(
+    "healthai_checkpoint_operation_duration_seconds",
+    "Tempo das leituras e escritas do checkpointer do LangGraph.",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_WAIT = Histogram(
+    "healthai_db_pool_wait_seconds",
+    "Espera para obter uma conexão do AsyncConnectionPool.",
+    buckets=WIDE_BUCKETS,
+)
+HISTORY_COMPACTION_BYTES_SAVED = Histogram(
+    "healthai_history_compaction_bytes_saved",
+    "Bytes serializados a menos no canal de mensagens do checkpoint a cada compactação do histórico.",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+SESSIONS_EXPIRED = Counter(
+    "healthai_sessions_expired",
+    "Sessões cujo estado foi reiniciado por inatividade (SESSION_IDLE_TTL_MINUTES).",
+)
+CHECKPOINT_RETENTION_DELETED_ROWS = Counter(
+    "healthai_checkpoint_retention_deleted_rows",
+    "Linhas apagadas pela retenção das tabelas do checkpointer.",
+    ["table"],
+)
+CHECKPOINT_COALESCED_WRITES = Counter(
+    "healthai_checkpoint_coalesced_writes",
+    "Escritas do checkpointer absorvidas em memória pela durabilidade por turno (CHECKPOINT_DURABILITY=turn).",
+    ["kind"],
+)
+HOT_SESSION_CACHE_LOOKUPS = Counter(
+    "healthai_hot_session_cache_lookups",
+    "Leituras do último checkpoint pelo cache de sessões do worker (hit, stale ou miss).",
+    ["result"],
+)
+SESSION_LOCK_ACQUISITIONS = Counter(
+    "healthai_session_lock_acquisitions",
+    "Advisory locks por thread tomados no início do turno: immediate (livre), waited (outro turno do mesmo thread em andamento) ou timeout.",
+    ["result"],
+)
+SESSION_LOCK_WAIT = Histogram(
+    "healthai_session_lock_wait_seconds",
+    "Espera pelo advisory lock do thread quando outro turno do mesmo telefone está em andamento (sem conexão do pool).",
+    buckets=WIDE_BUCKETS,
+)
+INBOUND_QUEUE_DEPTH = Gauge(
+    "healthai_inbound_queue_depth",
+    "Mensagens recebidas pelo webhook e ainda não processadas (aguardando ou em processamento).",
+)
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    "healthai_outbound_queue_depth",
+    "Respostas do assistente em envio para o n8n/Z-API.",
+)
+
+_NUMERIC_PATH_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def apphealth_endpoint_label(path: str) -> str:
+    """Normaliza o path para o label (ex.: agenda/profissionais/123/horarios -> agenda/profissionais/{id}/horarios)."""
+    return _NUMERIC_PATH_SEGMENT.sub("/{id}", "/" + path.strip("/")).lstrip("/")
+
+
+@contextmanager
+def observe_duration(histogram: Histogram, **labels: str) -> Iterator[Dict[str, str]]:
+    """
+    Mede o bloco e registra no histograma. Os labels podem ser ajustados dentro do bloco
+    (ex.: `status` só é conhecido depois da resposta); em exceção, labels ainda vazios viram "error".
+    """
+    labels_holder = dict(labels)
+    start = time.perf_counter()
+    try:
+        yield labels_holder
+    except BaseException:
+        for key, value in labels_holder.items():
+            if not value:
+                labels_holder[key] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if labels_holder:
+            histogram.labels(**labels_holder).observe(elapsed)
+        else:
+            histogram.observe(elapsed)
+
+
+def observe_llm_call(run_manager: Any, elapsed_seconds: float, outcome: str) -> str:
+    """Registra a latência da chamada no histograma do template marcado na run (prompt_config) e retorna o template."""
+    template = template_from_metadata(getattr(run_manager, "metadata", None))
+    LLM_CALL_DURATION.labels(template=template, outcome=outcome).observe(elapsed_seconds)
+    return template
+
+
+class GraphNodeMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback do LangChain que mede cada nó do grafo. O LangGraph abre uma run por nó com `name` igual ao
+    nome do nó e `metadata["langgraph_node"]`; runs internas (chains, LLM, roteadores) são ignoradas.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id=None, tags=None, metadata=None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # O roteador condicional com o mesmo nome do nó roda dentro da run do nó: não conta como outro nó.
+        if node and kwargs.get("name") == node and parent_run_id not in self._started:
+            with self._lock:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            GRAPH_NODE_DURATION.labels(node=node).observe(time.perf_counter() - start)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+
+_graph_node_metrics_handler = GraphNodeMetricsCallbackHandler()
+
+
+def get_graph_node_metrics_handler() -> GraphNodeMetricsCallbackHandler:
+    return _graph_node_metrics_handler
+
+
+class RuntimeStatsCollector(Collector):
+    """Expõe no scrape o estado atual do pool de conexões do Postgres e do gateway de LLM."""
+
+    def __init__(self, db_pool: Optional[Any] = None):
+        self.db_pool = db_pool
+
+    def collect(self):
+        if self.db_pool is not None:
+            stats = self.db_pool.get_stats()
+            for key, description in (
+                ("pool_size", "Conexões abertas no pool."),
+                ("pool_available", "Conexões livres no pool."),
+                ("requests_waiting", "Requisições aguardando uma conexão do pool."),
+            ):
+                yield GaugeMetricFamily(f"healthai_db_{key}", description, value=stats.get(key, 0))
+            yield GaugeMetricFamily("healthai_db_pool_max_size", "Tamanho máximo do pool.", value=self.db_pool.max_size)
+            yield GaugeMetricFamily("healthai_db_pool_min_size", "Tamanho mínimo do pool.", value=self.db_pool.min_size)
+            yield GaugeMetricFamily(
+                "healthai_db_pool_in_use", "Conexões emprestadas no momento.", value=stats.get("pool_size", 0) - stats.get("pool_available", 0)
+            )
+            # Contadores acumulados do psycopg_pool desde a abertura do pool (ou desde o último pop_stats)
+            for key, description in (
+                ("requests_num", "Pedidos de conexão ao pool."),
+                ("requests_queued", "Pedidos de conexão que precisaram esperar na fila do pool."),
+                ("requests_errors", "Pedidos de conexão que falharam (PoolTimeout, fila cheia, pool fechado)."),
+                ("returns_bad", "Conexões devolvidas ao pool em estado inválido."),
+                ("connections_num", "Conexões abertas com o servidor."),
+                ("connections_errors", "Falhas ao abrir conexão com o servidor."),
+                ("connections_lost", "Conexões descartadas na verificação (POSTGRES_POOL_CHECK)."),
+            ):
+                yield CounterMetricFamily(f"healthai_db_pool_{key}", description, value=stats.get(key, 0))
+            for key, description in (
+                ("requests_wait_ms", "Tempo total de espera na fila do pool."),
+                ("usage_ms", "Tempo total de uso das conexões emprestadas."),
+            ):
+                yield CounterMetricFamily(
+                    f"healthai_db_pool_{key[:-3]}_seconds", description, value=stats.get(key, 0) / 1000.0
+                )
+
+        from app.infrastructure.llm_gateway import get_llm_gateway
+
+        gateway_stats = get_llm_gateway().get_stats()
+        yield GaugeMetricFamily("healthai_llm_in_flight", "Chamadas ao LLM em andamento no gateway.", value=gateway_stats["in_flight"])
+        yield GaugeMetricFamily("healthai_llm_queue_depth", "Chamadas ao LLM aguardando vaga no gateway.", value=gateway_stats["queued"])
+
+
+_runtime_collector: Optional[RuntimeStatsCollector] = None
+_runtime_collector_lock = threading.Lock()
+
+
+def register_runtime_collector(db_pool: Optional[Any]) -> None:
+    """Registra (ou atualiza) o coletor do pool/gateway; chamado pelo lifespan depois de criar o pool."""
+    global _runtime_collector
+    with _runtime_collector_lock:
+        if _runtime_collector is None:
+            _runtime_collector = RuntimeStatsCollector(db_pool)
+            REGISTRY.register(_runtime_collector)
+        else:
+            _runtime_collector.db_pool = db_pool
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Conteúdo e content-type do endpoint /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+
+
+class ProfessionalCatalogCache:
+    """
+    Cache em processo (LRU com TTL) de id -> nome dos profissionais devolvidos pela API AppHealth.
+    O estado do grafo guarda só os ids apresentados ao usuário; os nomes são resolvidos aqui no turno seguinte.
+    Uma entrada ausente ou vencida (outro worker, restart) é resolvida consultando a API de novo.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_many(self, professionals: Iterable[Dict[str, Any]]) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for professional in professionals:
+                professional_id, name = professional.get("id"), professional.get("nome")
+                if professional_id is None or not name:
+                    continue
+                self._entries[professional_id] = (name, expires_at)
+                self._entries.move_to_end(professional_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def names_for(self, professional_ids: Iterable[int]) -> Dict[int, str]:
+        """Nomes dos ids ainda válidos no cache; os ausentes ou vencidos ficam de fora do resultado."""
+        now = time.monotonic()
+        names: Dict[int, str] = {}
+        with self._lock:
+            for professional_id in professional_ids:
+                entry = self._entries.get(professional_id)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[professional_id]
+                    continue
+                self._entries.move_to_end(professional_id)
+                names[professional_id] = entry[0]
+        return names
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_professional_catalog: Optional[ProfessionalCatalogCache] = None
+_professional_catalog_lock = threading.Lock()
+
+
+def get_professional_catalog() -> ProfessionalCatalogCache:
+    global _professional_catalog
+    if _professional_catalog is None:
+        with _professional_catalog_lock:
+            if _professional_catalog is None:
+                _professional_catalog = ProfessionalCatalogCache(
+                    settings.PROFESSIONAL_CATALOG_TTL_SECONDS, settings.PROFESSIONAL_CATALOG_MAX_ENTRIES
+                )
+    return _professional_catalog
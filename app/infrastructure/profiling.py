@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Frames de espera que não interessam no flamegraph (event loop ocioso, threads paradas em locks/filas).
+_IDLE_FUNCTIONS = {"select", "poll", "wait", "sleep", "_wait_for_tstate_lock"}
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Já existe um profiling ou snapshot de memória em andamento neste worker."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem em Python puro: a cada `interval` um thread lê `sys._current_frames()` e acumula as pilhas
+    de todos os threads no formato "collapsed" (uma linha `thread;f1;f2;... contagem`), aceito por flamegraph.pl,
+    speedscope e inferno. Cobre o event loop (nós async, checkpointer) e os threads do executor onde rodam os nós sync.
+    """
+
+    def __init__(self, interval_seconds: float = 0.005, include_idle: bool = False):
+        self.interval_seconds = interval_seconds
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def _sample(self, own_thread_id: int, thread_names: Dict[int, str]) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            if not self.include_idle and frame.f_code.co_name in _IDLE_FUNCTIONS:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self, duration_seconds: float) -> "SamplingProfiler":
+        own_thread_id = threading.get_ident()
+        deadline = time.monotonic() + duration_seconds
+        while time.monotonic() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+            self._sample(own_thread_id, thread_names)
+            self.samples += 1
+            time.sleep(self.interval_seconds)
+        return self
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+async def profile_worker(duration_seconds: float, interval_seconds: float, include_idle: bool = False) -> SamplingProfiler:
+    """Amostra este worker por `duration_seconds` num thread próprio, sem bloquear o event loop."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Já existe um profiling em andamento neste worker.")
+    try:
+        logger.info("Profiling por amostragem iniciado: %.1fs, intervalo %.1fms", duration_seconds, interval_seconds * 1000)
+        profiler = SamplingProfiler(interval_seconds, include_idle)
+        return await asyncio.to_thread(profiler.run, duration_seconds)
+    finally:
+        _profile_lock.release()
+
+
+async def memory_growth(duration_seconds: float, top: int = 30, group_by: str = "lineno", frames: int = 10) -> Dict[str, Any]:
+    """
+    Diferença entre dois snapshots do tracemalloc tirados com `duration_seconds` de intervalo: mostra onde a memória
+    cresceu (estado de sessões, grafos compilados, caches). Se o tracemalloc não estava ativo, é ligado só durante a janela.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Já existe um profiling em andamento neste worker.")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(duration_seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+    snapshot_filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    stats = after.filter_traces(snapshot_filters).compare_to(before.filter_traces(snapshot_filters), group_by)
+    return {
+        "duration_seconds": duration_seconds,
+        "group_by": group_by,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "total_size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "top": [
+            {
+                "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:top]
+        ],
+    }
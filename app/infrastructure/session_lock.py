@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.config import settings
+from app.infrastructure.metrics import DB_POOL_WAIT, SESSION_LOCK_ACQUISITIONS, SESSION_LOCK_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Primeira chave da forma (int4, int4) do advisory lock; a segunda é hashtext(thread_id). Não colide com o lock de
+# chave única (bigint) da retenção, que fica em outro espaço de chaves do Postgres.
+SESSION_LOCK_NAMESPACE = 0x4EA1
+
+TRY_LOCK_SQL = "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))"
+
+# Intervalo entre tentativas quando o thread está com outro worker: começa curto e dobra até o teto.
+RETRY_INITIAL_DELAY_SECONDS = 0.05
+RETRY_MAX_DELAY_SECONDS = 1.0
+
+
+class SessionLockTimeout(Exception):
+    """O thread ficou ocupado por outro turno por mais de SESSION_LOCK_TIMEOUT_SECONDS."""
+
+
+class _LocalSessionLocks:
+    """
+    Um asyncio.Lock por thread com turno em andamento ou na fila neste worker. Turnos do mesmo telefone no mesmo
+    worker esperam aqui, sem conexão do pool; a entrada some quando ninguém mais usa o thread.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, List[Any]] = {}  # thread_id -> [asyncio.Lock, turnos usando]
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str, timeout: float) -> AsyncIterator[bool]:
+        """Segura o lock local do thread por até `timeout` segundos; devolve True se precisou esperar."""
+        entry = self._locks.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            lock = entry[0]
+            contended = lock.locked()
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout)
+            except TimeoutError:
+                SESSION_LOCK_ACQUISITIONS.labels(result="timeout").inc()
+                SESSION_LOCK_WAIT.observe(timeout)
+                raise SessionLockTimeout(f"Thread {thread_id} ocupado neste worker por mais de {timeout:.1f}s.") from None
+            try:
+                yield contended
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[thread_id]
+
+
+_local_locks = _LocalSessionLocks()
+
+
+async def _try_session_lock(conn: Any, thread_id: str) -> bool:
+    if conn.autocommit:
+        raise RuntimeError("O lock da sessão precisa de uma conexão fora de autocommit (o lock dura a transação do turno).")
+    cursor = await conn.execute(TRY_LOCK_SQL, (SESSION_LOCK_NAMESPACE, thread_id))
+    return bool((await cursor.fetchone())[0])
+
+
+@asynccontextmanager
+async def session_connection(db_pool: Any, thread_id: str) -> AsyncIterator[Any]:
+    """
+    Conexão do pool para o turno do thread, com o advisory lock transacional da sessão já tomado quando
+    SESSION_LOCK_ENABLED (sem ele, só o checkout).
+
+    O lock vale até o fim da transação da conexão, ou seja, até ela voltar ao pool (que faz o commit) no fim do
+    turno. Ninguém espera segurando conexão: turnos do mesmo thread neste worker fazem fila num lock local antes
+    do checkout, e quando o thread está com outro worker a conexão volta ao pool e a tentativa
+    (pg_try_advisory_xact_lock, um round trip) se repete com backoff. Passado SESSION_LOCK_TIMEOUT_SECONDS,
+    levanta SessionLockTimeout.
+    """
+    if not settings.SESSION_LOCK_ENABLED:
+        pool_wait_started = time.perf_counter()
+        async with db_pool.connection() as conn:
+            DB_POOL_WAIT.observe(time.perf_counter() - pool_wait_started)
+            yield conn
+        return
+
+    timeout = settings.SESSION_LOCK_TIMEOUT_SECONDS
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    async with _local_locks.hold(thread_id, timeout) as waited:
+        delay = RETRY_INITIAL_DELAY_SECONDS
+        while True:
+            pool_wait_started = time.perf_counter()
+            async with db_pool.connection() as conn:
+                DB_POOL_WAIT.observe(time.perf_counter() - pool_wait_started)
+                if await _try_session_lock(conn, thread_id):
+                    SESSION_LOCK_ACQUISITIONS.labels(result="waited" if waited else "immediate").inc()
+                    if waited:
+                        SESSION_LOCK_WAIT.observe(time.perf_counter() - started)
+                    yield conn
+                    return
+            if not waited:
+                logger.info("Thread %s em uso por outro worker; tentando o lock da sessão de novo por até %.1fs.", thread_id, timeout)
+                waited = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                SESSION_LOCK_ACQUISITIONS.labels(result="timeout").inc()
+                SESSION_LOCK_WAIT.observe(time.perf_counter() - started)
+                raise SessionLockTimeout(f"Lock do thread {thread_id} não obtido em {timeout:.1f}s.")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, RETRY_MAX_DELAY_SECONDS)
@@ -0,0 +1,179 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.application.prompts.prompt_identification import template_from_metadata
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Gravador do turno em andamento; o LangGraph copia o contexto para as tasks e threads dos nós,
+# então as chamadas HTTP feitas dentro dos nós encontram o gravador do seu turno.
+current_turn_recorder: ContextVar[Optional["TurnRecorder"]] = ContextVar("current_turn_recorder", default=None)
+
+
+class TurnRecorder(BaseCallbackHandler):
+    """
+    Callback de um turno que anota a sequência de nós, as chamadas ao LLM e as chamadas HTTP com seus tempos
+    (offset desde o início do turno e duração, em ms). Só vira registro no SlowTurnStore se o turno passar do limite;
+    o template do prompt só é identificado nesse caso.
+    """
+
+    run_inline = True
+
+    def __init__(self, session_id: str, user_text: str):
+        self.session_id = session_id
+        self.input_length = len(user_text or "")
+        self.started_at = time.perf_counter()
+        self.step_before: Optional[str] = None
+        self.nodes: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.http_calls: List[Dict[str, Any]] = []
+        self._open_nodes: Dict[UUID, Tuple[str, float]] = {}
+        self._open_llm: Dict[UUID, Tuple[str, float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _offset_ms(self, at: float) -> float:
+        return round((at - self.started_at) * 1000, 1)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id=None, tags=None, metadata=None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # O roteador condicional com o mesmo nome do nó roda dentro da run do nó: não conta como outro nó.
+        if node and kwargs.get("name") == node and parent_run_id not in self._open_nodes:
+            with self._lock:
+                self._open_nodes[run_id] = (node, time.perf_counter())
+
+    def _finish_node(self, run_id: UUID, outcome: str) -> None:
+        with self._lock:
+            started = self._open_nodes.pop(run_id, None)
+            if started is not None:
+                node, start = started
+                self.nodes.append({
+                    "node": node,
+                    "start_ms": self._offset_ms(start),
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "outcome": outcome,
+                })
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_node(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_node(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id=None, tags=None, metadata=None, **kwargs: Any) -> None:
+        with self._lock:
+            self._open_llm[run_id] = ((metadata or {}).get("langgraph_node", "-"), time.perf_counter(), template_from_metadata(metadata))
+
+    def _finish_llm(self, run_id: UUID, outcome: str) -> None:
+        with self._lock:
+            started = self._open_llm.pop(run_id, None)
+            if started is not None:
+                node, start, template = started
+                self.llm_calls.append({
+                    "node": node,
+                    "template": template,
+                    "start_ms": self._offset_ms(start),
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "outcome": outcome,
+                })
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_llm(run_id, "ok")
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_llm(run_id, "error")
+
+    def record_http_call(self, service: str, method: str, route: str, started: float, outcome: str) -> None:
+        with self._lock:
+            self.http_calls.append({
+                "service": service,
+                "method": method,
+                "route": route,
+                "start_ms": self._offset_ms(started),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "outcome": outcome,
+            })
+
+    def build_record(self, duration_seconds: float, step_after: Optional[str], outcome: str) -> Dict[str, Any]:
+        return {
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "session_id": self.session_id,
+            "duration_ms": round(duration_seconds * 1000, 1),
+            "outcome": outcome,
+            "input_length": self.input_length,
+            "scheduling_step_before": self.step_before,
+            "scheduling_step_after": step_after,
+            "nodes": sorted(self.nodes, key=lambda n: n["start_ms"]),
+            "llm_calls": sorted(self.llm_calls, key=lambda c: c["start_ms"]),
+            "http_calls": sorted(self.http_calls, key=lambda c: c["start_ms"]),
+        }
+
+
+def record_turn_http_call(service: str, method: str, route: str, started: float, outcome: str) -> None:
+    """Anota a chamada HTTP no gravador do turno atual, se houver."""
+    recorder = current_turn_recorder.get()
+    if recorder is not None:
+        recorder.record_http_call(service, method, route, started, outcome)
+
+
+class SlowTurnStore:
+    """Guarda os `max_records` turnos mais lentos do worker (min-heap por duração: o mais rápido sai primeiro)."""
+
+    def __init__(self, max_records: int):
+        self.max_records = max_records
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        entry = (record["duration_ms"], next(self._counter), record)
+        with self._lock:
+            if len(self._heap) < self.max_records:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def worst(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = heapq.nlargest(limit, self._heap)
+        return [record for _, _, record in entries]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+_slow_turn_store: Optional[SlowTurnStore] = None
+_slow_turn_store_lock = threading.Lock()
+
+
+def get_slow_turn_store() -> SlowTurnStore:
+    global _slow_turn_store
+    if _slow_turn_store is None:
+        with _slow_turn_store_lock:
+            if _slow_turn_store is None:
+                _slow_turn_store = SlowTurnStore(settings.SLOW_TURN_MAX_RECORDS)
+    return _slow_turn_store
+
+
+def finish_turn(recorder: TurnRecorder, step_after: Optional[str], outcome: str) -> None:
+    """Fecha o turno: se passou de SLOW_TURN_THRESHOLD_SECONDS, grava o detalhamento no SlowTurnStore."""
+    duration = time.perf_counter() - recorder.started_at
+    if duration < settings.SLOW_TURN_THRESHOLD_SECONDS:
+        return
+    record = recorder.build_record(duration, step_after, outcome)
+    get_slow_turn_store().add(record)
+    logger.warning(
+        "Turno lento (%.0fms) na sessão %s: %d nós, %d chamadas ao LLM, %d chamadas HTTP, passo %s -> %s",
+        record["duration_ms"], recorder.session_id, len(record["nodes"]), len(record["llm_calls"]),
+        len(record["http_calls"]), record["scheduling_step_before"], step_after,
+    )
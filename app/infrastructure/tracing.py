@@ -0,0 +1,166 @@
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+from langchain_core.outputs import ChatResult
+from langgraph.graph import StateGraph
+from opentelemetry import propagate, trace
+from opentelemetry.trace import Span, SpanKind
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Sem init_tracing() o provider global é o no-op do OpenTelemetry: os spans abaixo não custam quase nada.
+tracer = trace.get_tracer("healthai")
+
+_tracing_initialized = False
+_tracing_lock = threading.Lock()
+
+
+def _build_exporter() -> Any:
+    if settings.TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            raise RuntimeError("TRACING_EXPORTER=otlp exige o pacote opentelemetry-exporter-otlp-proto-http.") from e
+        return OTLPSpanExporter()  # endpoint/headers via OTEL_EXPORTER_OTLP_* (padrão http://localhost:4318)
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if settings.TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    # Um span por linha (JSONL), fácil de inspecionar com jq ou importar num collector.
+    return ConsoleSpanExporter(
+        out=open(settings.TRACING_FILE_PATH, "a", encoding="utf-8"),
+        formatter=lambda span: span.to_json(indent=None) + "\n",
+    )
+
+
+def init_tracing() -> bool:
+    """Instala o TracerProvider do processo conforme TRACING_*; chamado no lifespan. Retorna se o tracing está ativo."""
+    global _tracing_initialized
+    if not settings.TRACING_ENABLED:
+        return False
+    with _tracing_lock:
+        if _tracing_initialized:
+            return True
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+            sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+        )
+        provider.add_span_processor(BatchSpanProcessor(_build_exporter()))
+        trace.set_tracer_provider(provider)
+        _tracing_initialized = True
+        logger.info(f"Tracing inicializado: exporter={settings.TRACING_EXPORTER}, sample_ratio={settings.TRACING_SAMPLE_RATIO}")
+        return True
+
+
+def shutdown_tracing() -> None:
+    """Exporta os spans pendentes; chamado no encerramento do lifespan."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def inject_trace_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Cópia dos headers com o `traceparent` do span atual, para o serviço chamado continuar o mesmo trace."""
+    carrier = dict(headers or {})
+    propagate.inject(carrier)
+    return carrier
+
+
+@contextmanager
+def http_client_span(service: str, method: str, url: str, route: Optional[str] = None) -> Iterator[Span]:
+    """
+    Span CLIENT de uma chamada HTTP de saída. Só o host e o path (ou a rota normalizada) entram nos atributos:
+    a query string pode conter o telefone do paciente. A chamada também é anotada no gravador de turnos lentos.
+    """
+    from app.infrastructure.slow_turns import record_turn_http_call
+
+    parsed = urlparse(url)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.start_as_current_span(
+            f"{service} {method} {route or parsed.path}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "peer.service": service,
+                "http.request.method": method,
+                "server.address": parsed.hostname or "",
+                "url.path": parsed.path,
+            },
+        ) as span:
+            yield span
+            outcome = "ok"
+    finally:
+        record_turn_http_call(service, method, route or parsed.path, started, outcome)
+
+
+def record_http_response(span: Span, status_code: int) -> None:
+    span.set_attribute("http.response.status_code", status_code)
+    if status_code >= 500:
+        span.set_status(trace.Status(trace.StatusCode.ERROR))
+
+
+def record_llm_result(span: Span, template: str, outcome: str, result: Optional[ChatResult]) -> None:
+    """Atributos do span de uma chamada ao LLM: template, origem da resposta e tokens (quando o provedor informa)."""
+    span.set_attribute("llm.prompt_template", template)
+    span.set_attribute("llm.outcome", outcome)
+    if result is None or not result.generations:
+        return
+    message = result.generations[0].message
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        token_usage = (result.llm_output or {}).get("token_usage") or {}
+        usage = {
+            "input_tokens": token_usage.get("prompt_tokens"),
+            "output_tokens": token_usage.get("completion_tokens"),
+            "total_tokens": token_usage.get("total_tokens"),
+        }
+    for key in ("input_tokens", "output_tokens", "total_tokens"):
+        if usage.get(key) is not None:
+            span.set_attribute(f"llm.usage.{key}", int(usage[key]))
+    model_name = (message.response_metadata or {}).get("model_name") or (result.llm_output or {}).get("model_name")
+    if model_name:
+        span.set_attribute("llm.model", model_name)
+
+
+def traced_node(node_name: str, action: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Envolve a função de um nó num span "graph.node <nome>" que fica como span atual durante a execução,
+    para que LLM, HTTP e demais chamadas feitas pelo nó apareçam como filhos dele. Preserva sync/async.
+    """
+    attributes = {"langgraph.node": node_name}
+
+    if inspect.iscoroutinefunction(action):
+        async def traced_async_node(state):
+            with tracer.start_as_current_span(f"graph.node {node_name}", attributes=attributes):
+                return await action(state)
+
+        return traced_async_node
+
+    def traced_sync_node(state):
+        with tracer.start_as_current_span(f"graph.node {node_name}", attributes=attributes):
+            return action(state)
+
+    return traced_sync_node
+
+
+class TracedStateGraph(StateGraph):
+    """StateGraph cujos nós adicionados por nome são envolvidos por `traced_node`."""
+
+    def add_node(self, node, action=None, **kwargs):
+        if isinstance(node, str) and action is not None:
+            action = traced_node(node, action)
+        return super().add_node(node, action, **kwargs)
@@ -0,0 +1,91 @@
+import logging
+import secrets
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.infrastructure.llm_accounting import get_llm_usage_accountant
+from app.infrastructure.profiling import ProfilerBusyError, memory_growth, profile_worker
+from app.infrastructure.slow_turns import get_slow_turn_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Protege os endpoints administrativos com o header X-Admin-Token (ADMIN_API_TOKEN)."""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=503, detail="Endpoints administrativos desabilitados (ADMIN_API_TOKEN não configurado).")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Token administrativo inválido.")
+
+
+@router.get("/llm-usage", dependencies=[Depends(require_admin_token)])
+async def llm_usage_summary(
+    request: Request,
+    group_by: Literal["node", "template", "session", "model", "day"] = "node",
+    days: int = Query(default=1, ge=1, le=90),
+    limit: int = Query(default=50, ge=1, le=500),
+):
+    """Tokens, custo estimado e latência média das chamadas ao LLM nos últimos `days` dias, agrupados por `group_by`."""
+    db_pool = getattr(request.app.state, "db_pool", None)
+    if db_pool is None:
+        raise HTTPException(status_code=503, detail="Pool de conexões com o banco indisponível.")
+
+    accountant = get_llm_usage_accountant()
+    try:
+        await accountant.flush(db_pool)
+        rows = await accountant.summary(db_pool, group_by=group_by, days=days, limit=limit)
+    except Exception as e:
+        logger.error(f"Erro ao consultar o uso de LLM: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro ao consultar o uso de LLM.")
+
+    return {
+        "group_by": group_by,
+        "days": days,
+        "total_cost_usd": round(sum(row["cost_usd"] for row in rows), 6),
+        "rows": rows,
+    }
+
+
+@router.get("/profile", dependencies=[Depends(require_admin_token)], response_class=PlainTextResponse)
+async def profile_live_worker(
+    seconds: float = Query(default=10.0, gt=0),
+    interval_ms: float = Query(default=5.0, ge=1.0, le=1000.0),
+    include_idle: bool = False,
+):
+    """
+    Amostra as pilhas deste worker (event loop e threads do executor) por `seconds` e devolve no formato
+    collapsed (flamegraph.pl, speedscope, inferno). Cada chamada cai num único worker do uvicorn/gunicorn.
+    """
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds deve ser no máximo {settings.PROFILING_MAX_SECONDS}.")
+    try:
+        profiler = await profile_worker(seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.collapsed(), headers={"X-Profile-Samples": str(profiler.samples)})
+
+
+@router.get("/memory-growth", dependencies=[Depends(require_admin_token)])
+async def memory_growth_snapshot(
+    seconds: float = Query(default=30.0, gt=0),
+    top: int = Query(default=30, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+):
+    """Diff de snapshots do tracemalloc com `seconds` de intervalo: onde a memória deste worker cresceu na janela."""
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds deve ser no máximo {settings.PROFILING_MAX_SECONDS}.")
+    try:
+        return await memory_growth(seconds, top=top, group_by=group_by, frames=settings.TRACEMALLOC_FRAMES)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/slow-turns", dependencies=[Depends(require_admin_token)])
+async def list_slow_turns(limit: int = Query(default=20, ge=1, le=500)):
+    """Turnos acima de SLOW_TURN_THRESHOLD_SECONDS neste worker, do mais lento para o mais rápido, com nós, LLM e HTTP."""
+    turns = get_slow_turn_store().worst(limit)
+    return {"threshold_seconds": settings.SLOW_TURN_THRESHOLD_SECONDS, "count": len(turns), "turns": turns}
@@ -7,6 +7,7 @@ from app.interfaces.models.whatsapp_payload import WhatsAppWebhookPayload
 from app.application.workflows.main_conversation_flow import arun_main_conversation_flow
 from app.infrastructure.clients.whatsapp_client import WhatsAppClient
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from app.infrastructure.checkpointer import get_checkpoint_serde
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -41,7 +42,7 @@ async def process_incoming_whatsapp_message(
 
                     logger.debug(f"Conexão obtida do pool para session_id: {session_id}")
                     
-                    checkpointer = AsyncPostgresSaver(conn=conn)
+                    checkpointer = AsyncPostgresSaver(conn=conn, serde=get_checkpoint_serde())
                     
                     agent_response_text = await arun_main_conversation_flow(
                         user_text=user_text,
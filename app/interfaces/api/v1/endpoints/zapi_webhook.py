@@ -1,29 +1,90 @@
 import logging
+from typing import Optional
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from psycopg_pool import AsyncConnectionPool
+from psycopg_pool import AsyncConnectionPool, PoolTimeout, TooManyRequests
+from opentelemetry import trace
+from opentelemetry.trace import Span, SpanKind
 from pydantic import ValidationError
 
+from app.core.logging_config import summarize_state
 from app.interfaces.models.zapi_payload import ZapiReceivedMessagePayload
 from app.application.workflows.main_conversation_flow import arun_main_conversation_flow
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from app.infrastructure.checkpointer import commit_checkpointer, create_checkpointer
 from app.infrastructure.clients.zapi_client import ZapiClient
+from app.infrastructure.metrics import INBOUND_QUEUE_DEPTH, OUTBOUND_QUEUE_DEPTH
+from app.infrastructure.session_lock import SessionLockTimeout, session_connection
+from app.infrastructure.tracing import tracer
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+SESSION_BUSY_REPLY = (
+    "Ainda estou processando sua mensagem anterior e não consegui ler esta. "
+    "Por favor, envie-a novamente em alguns instantes."
+)
+
+
+def start_message_span(payload: ZapiReceivedMessagePayload) -> Span:
+    """Span raiz do trace de uma mensagem Z-API: vai do recebimento no webhook até o envio da resposta."""
+    return tracer.start_span(
+        "zapi.message",
+        kind=SpanKind.SERVER,
+        attributes={
+            "zapi.message_id": payload.message_id or "",
+            "zapi.phone_suffix": (payload.phone or "")[-4:],
+            "zapi.from_me": bool(payload.from_me),
+            "zapi.is_group": bool(payload.is_group),
+        },
+    )
+
+
 async def process_incoming_zapi_message(
+    payload: ZapiReceivedMessagePayload, 
+    db_pool: AsyncConnectionPool,
+    message_span: Optional[Span] = None,
+):
+    with trace.use_span(message_span or start_message_span(payload), end_on_exit=True):
+        await _process_incoming_zapi_message(payload, db_pool)
+
+
+async def _send_reply(phone: str, text: str, original_message_id: Optional[str]) -> None:
+    try:
+        logger.debug("ZAPI_WEBHOOK: Tentando instanciar ZapiClient...")
+        zapi_client = ZapiClient() 
+        logger.debug("ZAPI_WEBHOOK: ZapiClient instanciado. Enviando mensagem...")
+        
+        OUTBOUND_QUEUE_DEPTH.inc()
+        try:
+            response_status = await zapi_client.send_text_message(
+                to_phone=phone, 
+                message_text=text,
+                original_received_message_id=original_message_id 
+            )
+        finally:
+            OUTBOUND_QUEUE_DEPTH.dec()
+        logger.info("ZAPI_WEBHOOK: Status do envio da resposta via Z-API: %s", response_status)
+        if isinstance(response_status, dict) and response_status.get("error"):
+            logger.error("ZAPI_WEBHOOK: Falha ao enviar mensagem via Z-API. Detalhes: %s", response_status.get('details'))
+
+    except ValueError as e:
+        logger.error("ZAPI_WEBHOOK: Falha ao inicializar ZapiClient (credenciais ZAPI ausentes?): %s", e)
+    except Exception as e: 
+        logger.error("ZAPI_WEBHOOK: Erro inesperado ao tentar enviar resposta via ZapiClient: %s", e, exc_info=True)
+
+
+async def _process_incoming_zapi_message(
     payload: ZapiReceivedMessagePayload, 
     db_pool: AsyncConnectionPool 
 ):
     try:
-        logger.info(f"ZAPI_WEBHOOK: Payload Z-API validado com sucesso. Message ID: {payload.message_id}")
+        logger.info("ZAPI_WEBHOOK: Payload Z-API validado com sucesso. Message ID: %s", payload.message_id)
 
         if payload.from_me:
-            logger.info(f"ZAPI_WEBHOOK: Mensagem de {payload.phone} (ID: {payload.message_id}) é 'fromMe'. Ignorando.")
+            logger.info("ZAPI_WEBHOOK: Mensagem de %s (ID: %s) é 'fromMe'. Ignorando.", payload.phone, payload.message_id)
             return
 
         if payload.is_group:
-            logger.info(f"ZAPI_WEBHOOK: Mensagem de {payload.phone} (ID: {payload.message_id}) é de grupo. Ignorando por enquanto.")
+            logger.info("ZAPI_WEBHOOK: Mensagem de %s (ID: %s) é de grupo. Ignorando por enquanto.", payload.phone, payload.message_id)
             return
 
         user_text = None
@@ -31,23 +92,23 @@ async def process_incoming_zapi_message(
             user_text = payload.text.message
         
         if not user_text:
-            logger.info(f"ZAPI_WEBHOOK: Mensagem de {payload.phone} (ID: {payload.message_id}) não contém texto ou o campo esperado está vazio. Ignorando.")
+            logger.info("ZAPI_WEBHOOK: Mensagem de %s (ID: %s) não contém texto ou o campo esperado está vazio. Ignorando.", payload.phone, payload.message_id)
             return
 
         session_id = payload.phone
         user_phone_number = payload.phone
         
-        logger.info(f"ZAPI_WEBHOOK: Processando mensagem (ID Z-API: {payload.message_id}) de {session_id} (Telefone: {user_phone_number}) : '{user_text}'")
-        logger.info(f"ZAPI_WEBHOOK: Direcionando para arun_scheduling_flow para session_id: {session_id}")
+        logger.info("ZAPI_WEBHOOK: Processando mensagem (ID Z-API: %s) de %s (Telefone: %s) : '%s'", payload.message_id, session_id, user_phone_number, user_text)
+        logger.info("ZAPI_WEBHOOK: Direcionando para arun_scheduling_flow para session_id: %s", session_id)
 
         agent_response_text = None
-        async with db_pool.connection() as conn:
+        async with session_connection(db_pool, session_id) as conn:
             if conn is None:
-                logger.error(f"ZAPI_WEBHOOK: ERRO CRÍTICO: Falha ao obter conexão do db_pool para session_id: {session_id}.")
+                logger.error("ZAPI_WEBHOOK: ERRO CRÍTICO: Falha ao obter conexão do db_pool para session_id: %s.", session_id)
                 return 
             
-            logger.debug(f"ZAPI_WEBHOOK: Conexão obtida do pool para session_id: {session_id}")
-            checkpointer = AsyncPostgresSaver(conn=conn)
+            logger.debug("ZAPI_WEBHOOK: Conexão obtida do pool para session_id: %s", session_id)
+            checkpointer = create_checkpointer(conn)
             
             agent_response_text = await arun_main_conversation_flow(
                 user_text=user_text,
@@ -55,35 +116,35 @@ async def process_incoming_zapi_message(
                 checkpointer=checkpointer,
                 user_phone=user_phone_number
             )
+            # Confirma o turno ainda com a conexão em mãos: o cache de sessões só recebe checkpoints já gravados.
+            await commit_checkpointer(checkpointer)
 
         if agent_response_text:
-            logger.info(f"ZAPI_WEBHOOK: Resposta da IA para {session_id}: {agent_response_text}")
+            logger.info("ZAPI_WEBHOOK: Resposta da IA para %s: %s", session_id, agent_response_text)
             
-            try:
-                logger.debug("ZAPI_WEBHOOK: Tentando instanciar ZapiClient...")
-                zapi_client = ZapiClient() 
-                logger.debug("ZAPI_WEBHOOK: ZapiClient instanciado. Enviando mensagem...")
-                
-                response_status = await zapi_client.send_text_message(
-                    to_phone=session_id, 
-                    message_text=agent_response_text,
-                    original_received_message_id=payload.message_id 
-                )
-                logger.info(f"ZAPI_WEBHOOK: Status do envio da resposta via Z-API: {response_status}")
-                if isinstance(response_status, dict) and response_status.get("error"):
-                    logger.error(f"ZAPI_WEBHOOK: Falha ao enviar mensagem via Z-API. Detalhes: {response_status.get('details')}")
-
-            except ValueError as e:
-                logger.error(f"ZAPI_WEBHOOK: Falha ao inicializar ZapiClient (credenciais ZAPI ausentes?): {e}")
-            except Exception as e: 
-                logger.error(f"ZAPI_WEBHOOK: Erro inesperado ao tentar enviar resposta via ZapiClient: {e}", exc_info=True)
+            await _send_reply(session_id, agent_response_text, payload.message_id)
         else:
-            logger.warning(f"ZAPI_WEBHOOK: Nenhuma resposta do agente para a mensagem Z-API de {session_id}")
+            logger.warning("ZAPI_WEBHOOK: Nenhuma resposta do agente para a mensagem Z-API de %s", session_id)
 
+    except SessionLockTimeout as e:
+        # O turno anterior do mesmo telefone não terminou no prazo: a mensagem não entra na conversa e o paciente
+        # é avisado para reenviá-la, em vez de ficar sem resposta.
+        logger.error("ZAPI_WEBHOOK: Mensagem %s não processada: %s", payload.message_id, e)
+        await _send_reply(payload.phone, SESSION_BUSY_REPLY, payload.message_id)
+    except (PoolTimeout, TooManyRequests) as e:
+        # Pool esgotado: conexões todas emprestadas por mais de POSTGRES_POOL_TIMEOUT_SECONDS ou fila cheia
+        stats = db_pool.get_stats()
+        logger.error(
+            "ZAPI_WEBHOOK: Pool do Postgres esgotado para a mensagem %s (%s: %s). size=%s available=%s waiting=%s max=%s",
+            payload.message_id, type(e).__name__, e,
+            stats.get("pool_size"), stats.get("pool_available"), stats.get("requests_waiting"), db_pool.max_size,
+        )
     except ValidationError as ve:
-        logger.error(f"ZAPI_WEBHOOK: Erro de validação Pydantic no payload Z-API: {ve.errors()}", exc_info=True)
+        logger.error("ZAPI_WEBHOOK: Erro de validação Pydantic no payload Z-API: %s", ve.errors(), exc_info=True)
     except Exception as e:
-        logger.error(f"ZAPI_WEBHOOK: Erro inesperado no processamento da mensagem Z-API: {e}", exc_info=True)
+        logger.error("ZAPI_WEBHOOK: Erro inesperado no processamento da mensagem Z-API: %s", e, exc_info=True)
+    finally:
+        INBOUND_QUEUE_DEPTH.dec()
 
 
 @router.post("/zapi", summary="Webhook para receber mensagens da Z-API")
@@ -93,7 +154,7 @@ async def zapi_on_message_received_webhook(
     background_tasks: BackgroundTasks
 ):
     logger.info("ZAPI_WEBHOOK: Recebido payload POST no endpoint /zapi.")
-    logger.debug(f"ZAPI_WEBHOOK: RAW Payload Recebido: {payload_dict}")
+    logger.debug("ZAPI_WEBHOOK: RAW Payload Recebido: %s", summarize_state(payload_dict))
     
     try:
         payload = ZapiReceivedMessagePayload.model_validate(payload_dict)
@@ -103,14 +164,15 @@ async def zapi_on_message_received_webhook(
             logger.error("ZAPI_WEBHOOK: CRITICAL: db_pool não encontrado em request.app.state.")
             raise HTTPException(status_code=500, detail="Configuração interna do servidor incorreta (DB Pool).")
 
-        background_tasks.add_task(process_incoming_zapi_message, payload, db_pool_from_state)
+        background_tasks.add_task(process_incoming_zapi_message, payload, db_pool_from_state, start_message_span(payload))
+        INBOUND_QUEUE_DEPTH.inc()
         
         logger.info("ZAPI_WEBHOOK: Tarefa de processamento Z-API adicionada ao background. Retornando 200 OK.")
         return {"status": "zapi_webhook_payload_received_for_processing"}
 
     except ValidationError as ve:
-        logger.error(f"ZAPI_WEBHOOK: Erro de validação Pydantic no payload Z-API: {ve.errors()}", exc_info=True)
+        logger.error("ZAPI_WEBHOOK: Erro de validação Pydantic no payload Z-API: %s", ve.errors(), exc_info=True)
         raise HTTPException(status_code=422, detail=f"Payload Z-API inválido: {ve.errors()}")
     except Exception as e:
-        logger.error(f"ZAPI_WEBHOOK: Erro inesperado ao receber webhook Z-API: {e}", exc_info=True)
+        logger.error("ZAPI_WEBHOOK: Erro inesperado ao receber webhook Z-API: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Erro interno do servidor ao processar webhook Z-API.")
@@ -3,44 +3,45 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from app.core.logging_config import setup_logging
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
-import os
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
 from typing import Optional
 
-from psycopg_pool import AsyncConnectionPool
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 
+from app.core.config import settings
+from app.infrastructure.checkpoint_retention import run_retention_loop
+from app.infrastructure.db_pool import create_db_pool, postgres_conninfo
+from app.infrastructure.llm_accounting import LLMUsageAccountant, run_usage_flusher
+from app.infrastructure.metrics import register_runtime_collector, render_metrics
+from app.infrastructure.tracing import init_tracing, shutdown_tracing
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Iniciando aplicação e ciclo de vida (lifespan)...")
-    db_user = os.getenv("POSTGRES_USER")
-    db_password = os.getenv("POSTGRES_PASSWORD")
-    db_host = os.getenv("POSTGRES_HOST", "localhost")
-    db_port = os.getenv("POSTGRES_PORT", "5432")
-    db_name = os.getenv("POSTGRES_DB")
-
-    logger.debug(f"Lifespan: Lidas variáveis do BD: DB_USER='{db_user}', DB_PASSWORD='{'*' * len(db_password) if db_password else 'None'}', DB_HOST='{db_host}', DB_PORT='{db_port}', DB_NAME='{db_name}'")
-
-    if db_user and db_password and db_host and db_port and db_name:
-        conninfo_str_lifespan = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        logger.info(f"Lifespan: String de conexão para o pool: {conninfo_str_lifespan.replace(db_password, '********') if db_password else conninfo_str_lifespan}")
-        
+    init_tracing()
+    conninfo = postgres_conninfo()
+
+    if conninfo:
+        logger.info("Lifespan: String de conexão para o pool: %s", postgres_conninfo(mask_password=True))
+
         try:
-            async with AsyncConnectionPool(
-                conninfo=conninfo_str_lifespan,
-                min_size=1,
-                max_size=5
-            ) as pool:
+            async with create_db_pool(conninfo) as pool:
                 app.state.db_pool = pool
+                register_runtime_collector(pool)
                 logger.info("Lifespan: AsyncConnectionPool criado e armazenado em app.state.db_pool.")
 
                 logger.info("Lifespan: Tentando executar AsyncPostgresSaver.setup()...")
                 async with pool.connection() as setup_conn:
                     await setup_conn.set_autocommit(True)
+                    # As migrações (CREATE INDEX CONCURRENTLY) não devem cair no POSTGRES_STATEMENT_TIMEOUT_MS.
+                    await setup_conn.execute("SET statement_timeout = 0")
                     try:
                         checkpointer_for_setup = AsyncPostgresSaver(conn=setup_conn)
                         await checkpointer_for_setup.setup()
@@ -48,14 +49,34 @@ async def lifespan(app: FastAPI):
                     except Exception as setup_exc:
                         logger.error(f"Lifespan: Erro durante AsyncPostgresSaver.setup(): {setup_exc}", exc_info=True)
                         raise RuntimeError(f"Falha crítica no setup do checkpointer: {setup_exc}") from setup_exc
-
-                yield
+                    if settings.LLM_USAGE_ACCOUNTING_ENABLED:
+                        await LLMUsageAccountant.setup(setup_conn)
+                        logger.info("Lifespan: Tabela llm_token_usage verificada.")
+                    await setup_conn.execute("RESET statement_timeout")
+                    await setup_conn.set_autocommit(False)  # volta ao pool como as demais (turno numa transação)
+
+                background_tasks = []
+                if settings.LLM_USAGE_ACCOUNTING_ENABLED:
+                    background_tasks.append(asyncio.create_task(run_usage_flusher(pool, settings.LLM_USAGE_FLUSH_SECONDS)))
+                if settings.CHECKPOINT_RETENTION_ENABLED:
+                    background_tasks.append(asyncio.create_task(run_retention_loop(pool, settings.CHECKPOINT_RETENTION_INTERVAL_SECONDS)))
+                    logger.info("Lifespan: Retenção de checkpoints agendada.")
+                try:
+                    yield
+                finally:
+                    for task in background_tasks:
+                        task.cancel()
+                    for task in background_tasks:
+                        try:
+                            await task
+                        except asyncio.CancelledError:
+                            pass
 
         except Exception as pool_exc:
             logger.error(f"Lifespan: Erro CRÍTICO ao criar ou abrir AsyncConnectionPool: {pool_exc}", exc_info=True)
             raise RuntimeError(f"Falha ao inicializar o pool de conexões: {pool_exc}") from pool_exc
     else:
-        logger.error("Lifespan: Variáveis de ambiente para o banco de dados estão ausentes ou incompletas. Pool de conexões NÃO será criado. O Checkpointer setup NÃO será executado.")
+        logger.error("Lifespan: POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_DB ausentes ou incompletas. Pool de conexões NÃO será criado. O Checkpointer setup NÃO será executado.")
         yield
 
     logger.info("Encerrando aplicação e ciclo de vida (lifespan)...")
@@ -63,9 +84,10 @@ async def lifespan(app: FastAPI):
         logger.info("Lifespan: Fechando AsyncConnectionPool...")
         await app.state.db_pool.close()
         logger.info("Lifespan: AsyncConnectionPool fechado.")
+    shutdown_tracing()
 
 
-from app.interfaces.api.v1.endpoints import whatsapp_webhook, zapi_webhook
+from app.interfaces.api.v1.endpoints import admin, whatsapp_webhook, zapi_webhook
 
 app = FastAPI(
     title="HealthAI Assistant API",
@@ -78,6 +100,11 @@ app = FastAPI(
 async def read_root():
     return {"message": "HealthAI Assistant API is running!"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # app.include_router(
 #     whatsapp_webhook.router,
 #     prefix="/api/v1/webhooks",
@@ -85,6 +112,7 @@ async def read_root():
 # )
 
 app.include_router(zapi_webhook.router, prefix="/api/v1/webhooks", tags=["WhatsApp Z-API"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 
 # if __name__ == "__main__":
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
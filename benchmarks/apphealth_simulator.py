@@ -0,0 +1,316 @@
+"""
+Simulador local da API AppHealth (api-vizi) para testes de carga do fluxo de agendamento.
+
+Gera catálogos sintéticos (especialidades, profissionais e agendas densas) de forma determinística a partir
+de uma seed, mantém os horários agendados consistentes (um horário agendado some de /horarios e um segundo
+POST para o mesmo horário recebe 409) e injeta latência, erros 5xx e timeouts.
+
+Uso:
+    python -m benchmarks.apphealth_simulator --port 9090 --specialties 300 --professionals 3000 \\
+        --latency-ms 80 --error-rate 0.01 --timeout-rate 0.005
+
+E aponte a aplicação para ele:
+    APPHEALTH_API_BASE_URL=http://localhost:9090/api-vizi
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import logging
+import random
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+BASE_SPECIALTIES = [
+    "Cardiologia", "Dermatologia", "Pediatria", "Ortopedia e Traumatologia", "Clínico Geral", "Ginecologia",
+    "Gastroenterologia", "Neurologia", "Oftalmologia", "Otorrinolaringologia", "Psiquiatria", "Urologia",
+    "Endocrinologia", "Reumatologia", "Pneumologia", "Nefrologia", "Oncologia", "Hematologia", "Infectologia",
+    "Geriatria", "Angiologia", "Mastologia", "Nutrologia", "Alergia e Imunologia", "Medicina do Esporte",
+    "Proctologia", "Cirurgia Geral", "Cirurgia Plástica", "Fisioterapia", "Psicologia", "Nutrição", "Fonoaudiologia",
+]
+SPECIALTY_QUALIFIERS = [
+    "Pediátrica", "Clínica", "Cirúrgica", "Intervencionista", "Geriátrica", "do Adolescente", "Preventiva",
+    "Funcional", "Oncológica", "Esportiva", "Hospitalar", "Ambulatorial",
+]
+FIRST_NAMES = [
+    "Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João", "Karina",
+    "Lucas", "Mariana", "Nicolas", "Olívia", "Paulo", "Renata", "Sérgio", "Tatiana", "Vinícius", "Juliana", "Rafael",
+    "Camila", "Gustavo", "Letícia", "Marcelo", "Patrícia", "Rodrigo", "Beatriz", "Thiago",
+]
+LAST_NAMES = [
+    "Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Ferreira", "Almeida", "Carvalho", "Gomes",
+    "Martins", "Rocha", "Ribeiro", "Barbosa", "Araújo", "Mendes", "Cardoso", "Teixeira", "Moreira", "Nascimento",
+    "Freitas", "Cavalcanti", "Monteiro", "Azevedo", "Campos", "Vieira", "Pinto", "Duarte", "Farias",
+]
+
+
+@dataclass
+class FaultConfig:
+    """Injeção de falhas aplicada a cada requisição da API (exceto /_sim)."""
+    latency_ms: float = 50.0
+    latency_sigma: float = 0.4  # sigma do log; 0 = latência fixa
+    error_rate: float = 0.0  # fração de respostas 5xx
+    timeout_rate: float = 0.0  # fração de requisições que ficam penduradas por timeout_seconds
+    timeout_seconds: float = 30.0
+
+
+@dataclass
+class SimulatorConfig:
+    specialties: int = 300
+    professionals: int = 3000
+    days_ahead: int = 60
+    slot_minutes: int = 30
+    occupancy: float = 0.35  # fração de horários já ocupados na agenda gerada
+    seed: int = 42
+    faults: FaultConfig = field(default_factory=FaultConfig)
+
+
+class SyntheticCatalog:
+    """Catálogo e agenda sintéticos. A agenda de cada (profissional, data) é derivada por hash da seed."""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        rng = random.Random(config.seed)
+
+        names = list(BASE_SPECIALTIES)
+        for qualifier, base in itertools.product(SPECIALTY_QUALIFIERS, BASE_SPECIALTIES):
+            if len(names) >= config.specialties:
+                break
+            names.append(f"{base} {qualifier}")
+        names += [f"Especialidade {i:04d}" for i in range(len(names), config.specialties)]
+        self.specialties = [{"id": 1000 + i, "especialidade": name} for i, name in enumerate(names[: config.specialties])]
+
+        self.professionals: List[Dict[str, Any]] = []
+        self.professionals_by_specialty: Dict[int, List[Dict[str, Any]]] = {s["id"]: [] for s in self.specialties}
+        for i in range(config.professionals):
+            # As especialidades base concentram mais profissionais, como em um catálogo real.
+            pool = self.specialties[: len(BASE_SPECIALTIES)] if rng.random() < 0.6 else self.specialties
+            specialty = rng.choice(pool)
+            professional = {
+                "id": 50000 + i,
+                "nome": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "status": True,
+                "especialidades": [{"id": specialty["id"], "especialidade": specialty["especialidade"]}],
+            }
+            self.professionals.append(professional)
+            self.professionals_by_specialty[specialty["id"]].append(professional)
+        self.professionals_by_id = {p["id"]: p for p in self.professionals}
+
+        self._booked: Set[Tuple[int, str, str]] = set()
+        self._appointments: Dict[int, Dict[str, Any]] = {}
+        self._next_appointment_id = itertools.count(900000)
+        self._lock = threading.Lock()
+
+    def _hash_fraction(self, *parts: Any) -> float:
+        digest = hashlib.blake2b(":".join(str(p) for p in (self.config.seed, *parts)).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64
+
+    def generated_slots(self, professional_id: int, day: date) -> List[Tuple[str, str]]:
+        """Horários (horaInicio, horaFim) da agenda gerada, antes de remover os agendados via API."""
+        if day < date.today() or day > date.today() + timedelta(days=self.config.days_ahead) or day.weekday() == 6:
+            return []
+        works_day = self._hash_fraction(professional_id, "dia", day.weekday()) < (0.3 if day.weekday() == 5 else 0.75)
+        if not works_day:
+            return []
+        shift = self._hash_fraction(professional_id, "turno", day.weekday())
+        windows = [(8, 12)] if shift < 0.15 else [(13, 18)] if shift < 0.3 else [(8, 12), (13, 18)]
+        not_before = datetime.now() if day == date.today() else None
+        slots = []
+        step = timedelta(minutes=self.config.slot_minutes)
+        for start_hour, end_hour in windows:
+            current = datetime.combine(day, datetime.min.time()).replace(hour=start_hour)
+            end = current.replace(hour=end_hour)
+            while current + step <= end:
+                in_future = not_before is None or current > not_before
+                if in_future and self._hash_fraction(professional_id, day.isoformat(), current.strftime("%H:%M")) >= self.config.occupancy:
+                    slots.append((current.strftime("%H:%M:%S"), (current + step).strftime("%H:%M:%S")))
+                current += step
+        return slots
+
+    def free_slots(self, professional_id: int, day: date) -> List[Dict[str, str]]:
+        day_str = day.isoformat()
+        with self._lock:
+            return [
+                {"horaInicio": start, "horaFim": end}
+                for start, end in self.generated_slots(professional_id, day)
+                if (professional_id, day_str, start) not in self._booked
+            ]
+
+    def available_dates(self, professional_id: int, month: int, year: int) -> List[Dict[str, str]]:
+        day = date(year, month, 1)
+        result = []
+        while day.month == month:
+            if self.free_slots(professional_id, day):
+                result.append({"data": day.isoformat()})
+            day += timedelta(days=1)
+        return result
+
+    def book(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            professional_id = int(payload["profissionalSaude"]["id"])
+            day_str = payload["data"]
+            start = payload["horaInicio"]
+            day = date.fromisoformat(day_str)
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Payload de agendamento inválido: {e}")
+        if professional_id not in self.professionals_by_id:
+            raise HTTPException(status_code=404, detail="Profissional não encontrado.")
+        if start not in {s for s, _ in self.generated_slots(professional_id, day)}:
+            raise HTTPException(status_code=422, detail="Horário fora da agenda do profissional.")
+        with self._lock:
+            key = (professional_id, day_str, start)
+            if key in self._booked:
+                raise HTTPException(status_code=409, detail="Horário já agendado.")
+            self._booked.add(key)
+            appointment = {**payload, "id": next(self._next_appointment_id), "situacao": payload.get("situacao", "AGENDADO")}
+            self._appointments[appointment["id"]] = appointment
+            return appointment
+
+    def reset_bookings(self) -> int:
+        with self._lock:
+            count = len(self._booked)
+            self._booked.clear()
+            self._appointments.clear()
+            return count
+
+    @property
+    def booked_count(self) -> int:
+        with self._lock:
+            return len(self._booked)
+
+
+def create_app(config: Optional[SimulatorConfig] = None) -> FastAPI:
+    """Cria o app do simulador (também usado em processo pelos benchmarks)."""
+    config = config or SimulatorConfig()
+    catalog = SyntheticCatalog(config)
+    rng = random.Random(config.seed + 1)
+    stats: Counter = Counter()
+    app = FastAPI(title="AppHealth API Simulator")
+    app.state.catalog = catalog
+    app.state.config = config
+    app.state.stats = stats
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_sim"):
+            return await call_next(request)
+        faults = config.faults
+        route = request.url.path.split("/api-vizi/", 1)[-1].split("/")[0]
+        stats[f"requests:{route}"] += 1
+        if faults.latency_ms > 0:
+            latency = faults.latency_ms * (rng.lognormvariate(0.0, faults.latency_sigma) if faults.latency_sigma > 0 else 1.0)
+            await asyncio.sleep(latency / 1000.0)
+        draw = rng.random()
+        if draw < faults.timeout_rate:
+            stats["injected_timeouts"] += 1
+            await asyncio.sleep(faults.timeout_seconds)
+        elif draw < faults.timeout_rate + faults.error_rate:
+            stats["injected_errors"] += 1
+            return JSONResponse(status_code=rng.choice([500, 502, 503]), content={"message": "Erro simulado"})
+        return await call_next(request)
+
+    @app.get("/api-vizi/especialidades")
+    async def list_specialties():
+        return catalog.specialties
+
+    @app.get("/api-vizi/profissionais")
+    async def list_professionals(especialidadeId: Optional[int] = None, status: Optional[str] = None):
+        if especialidadeId is None:
+            return catalog.professionals
+        return catalog.professionals_by_specialty.get(especialidadeId, [])
+
+    @app.get("/api-vizi/agenda/profissionais/{professional_id}/datas")
+    async def list_dates(professional_id: int, mes: int, ano: int):
+        if professional_id not in catalog.professionals_by_id:
+            raise HTTPException(status_code=404, detail="Profissional não encontrado.")
+        return catalog.available_dates(professional_id, mes, ano)
+
+    @app.get("/api-vizi/agenda/profissionais/{professional_id}/horarios")
+    async def list_times(professional_id: int, data: str):
+        if professional_id not in catalog.professionals_by_id:
+            raise HTTPException(status_code=404, detail="Profissional não encontrado.")
+        try:
+            day = date.fromisoformat(data)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Data inválida, use AAAA-MM-DD.")
+        return catalog.free_slots(professional_id, day)
+
+    @app.post("/api-vizi/agendamentos", status_code=201)
+    async def create_appointment(request: Request):
+        appointment = catalog.book(await request.json())
+        stats["bookings"] += 1
+        return appointment
+
+    @app.get("/_sim/stats")
+    async def sim_stats():
+        return {
+            "config": asdict(config),
+            "booked_slots": catalog.booked_count,
+            "counters": dict(stats),
+        }
+
+    @app.put("/_sim/faults")
+    async def update_faults(request: Request):
+        """Altera latência/erros em tempo de execução (ex.: degradar a API no meio de um teste de carga)."""
+        for key, value in (await request.json()).items():
+            if hasattr(config.faults, key):
+                setattr(config.faults, key, float(value))
+        return asdict(config.faults)
+
+    @app.post("/_sim/reset")
+    async def reset():
+        stats.clear()
+        return {"cleared_bookings": catalog.reset_bookings()}
+
+    return app
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> Tuple[argparse.Namespace, SimulatorConfig]:
+    parser = argparse.ArgumentParser(description="Simulador local da API AppHealth.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--specialties", type=int, default=300)
+    parser.add_argument("--professionals", type=int, default=3000)
+    parser.add_argument("--days-ahead", type=int, default=60)
+    parser.add_argument("--slot-minutes", type=int, default=30)
+    parser.add_argument("--occupancy", type=float, default=0.35)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    config = SimulatorConfig(
+        specialties=args.specialties,
+        professionals=args.professionals,
+        days_ahead=args.days_ahead,
+        slot_minutes=args.slot_minutes,
+        occupancy=args.occupancy,
+        seed=args.seed,
+        faults=FaultConfig(
+            latency_ms=args.latency_ms,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            timeout_rate=args.timeout_rate,
+            timeout_seconds=args.timeout_seconds,
+        ),
+    )
+    return args, config
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    cli_args, sim_config = _parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Simulador AppHealth: {sim_config.specialties} especialidades, {sim_config.professionals} profissionais, faults={asdict(sim_config.faults)}")
+    uvicorn.run(create_app(sim_config), host=cli_args.host, port=cli_args.port, log_level="warning")
@@ -0,0 +1,217 @@
+"""
+Benchmark de leitura (aget_tuple) e escrita (aput + aput_writes) de checkpoints à medida que as tabelas crescem,
+com as tabelas normais do AsyncPostgresSaver e particionadas por hash de thread_id (checkpoint_partitioning).
+
+Cada layout roda num schema próprio (search_path da conexão), apagado ao final. As tabelas crescem por níveis de
+--levels threads: um checkpoint real (estado de conversa com mensagens e listas apresentadas) é gravado pelo saver
+numa thread modelo e replicado em SQL para as demais threads, com --checkpoints-per-thread checkpoints, os blobs
+dos canais e as writes. Em cada nível medimos --samples leituras e escritas em threads sorteadas, como num turno.
+
+Uso:
+    python -m benchmarks.checkpoint_partition_benchmark --database-url postgresql://postgres@localhost:5432/postgres \\
+        [--levels 2000 20000 100000] [--partitions 16] [--output bench_partitions.json]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import latency_summary, save_json
+from benchmarks.node_microbench import configure_environment
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = ("plain", "hash")
+TEMPLATE_THREAD = "bench-template"
+GROW_CHUNK = 10000
+
+GROW_CHECKPOINTS_SQL = """
+INSERT INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata)
+SELECT 'bench-' || lpad(g::text, 9, '0'), t.checkpoint_ns,
+       left(t.checkpoint_id, 32) || lpad(k::text, 4, '0'),
+       CASE WHEN k > 1 THEN left(t.checkpoint_id, 32) || lpad((k - 1)::text, 4, '0') END,
+       t.type, t.checkpoint, t.metadata
+FROM checkpoints t, generate_series(%(start)s::int, %(stop)s::int) g, generate_series(1, %(per_thread)s::int) k
+WHERE t.thread_id = %(template)s
+"""
+GROW_BLOBS_SQL = """
+INSERT INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob)
+SELECT 'bench-' || lpad(g::text, 9, '0'), t.checkpoint_ns, t.channel, t.version, t.type, t.blob
+FROM checkpoint_blobs t, generate_series(%(start)s::int, %(stop)s::int) g
+WHERE t.thread_id = %(template)s
+"""
+GROW_WRITES_SQL = """
+INSERT INTO checkpoint_writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, blob)
+SELECT 'bench-' || lpad(g::text, 9, '0'), t.checkpoint_ns, left(t.checkpoint_id, 32) || lpad(k::text, 4, '0'),
+       t.task_id, t.task_path, t.idx, t.channel, t.type, t.blob
+FROM checkpoint_writes t, generate_series(%(start)s::int, %(stop)s::int) g, generate_series(1, %(per_thread)s::int) k
+WHERE t.thread_id = %(template)s
+"""
+
+
+def template_state(rng: random.Random) -> Dict[str, Any]:
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    messages = []
+    for turn in range(6):
+        messages.append(HumanMessage(content=f"Mensagem {turn} do paciente sobre o agendamento", id=str(uuid.uuid4())))
+        messages.append(AIMessage(content=f"Resposta {turn} do assistente com as opções disponíveis " * 3, id=str(uuid.uuid4())))
+    return {
+        "messages": messages,
+        "current_operation": "scheduling",
+        "extracted_scheduling_details": {"specialty": "Cardiologia", "date_preference": "2025-07-01", "time_preference": "manhã"},
+        "available_professionals_list": [rng.randint(1, 5000) for _ in range(5)],
+        "available_times_presented": [["08:00", "08:30"], ["09:00", "09:30"], ["10:00", "10:30"]],
+        "user_phone": "5511999999999",
+    }
+
+
+async def seed_template(saver: Any, state: Dict[str, Any]) -> None:
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    config = {"configurable": {"thread_id": TEMPLATE_THREAD, "checkpoint_ns": ""}}
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = dict(state)
+    checkpoint["channel_versions"] = {channel: saver.get_next_version(None, None) for channel in state}
+    saved = await saver.aput(config, checkpoint, {"source": "loop", "step": 0, "writes": {}, "parents": {}}, checkpoint["channel_versions"])
+    await saver.aput_writes(saved, [("messages", state["messages"][-1:]), ("current_operation", "scheduling")], task_id=str(uuid.uuid4()))
+
+
+async def grow(conn: Any, start: int, stop: int, per_thread: int) -> None:
+    for chunk_start in range(start, stop + 1, GROW_CHUNK):
+        params = {"start": chunk_start, "stop": min(stop, chunk_start + GROW_CHUNK - 1), "per_thread": per_thread, "template": TEMPLATE_THREAD}
+        for statement in (GROW_CHECKPOINTS_SQL, GROW_BLOBS_SQL, GROW_WRITES_SQL):
+            await conn.execute(statement, params)
+    await conn.execute("ANALYZE")
+
+
+async def measure(saver: Any, threads: int, samples: int, rng: random.Random) -> Dict[str, Any]:
+    """Um turno por amostra numa thread sorteada: aget_tuple e depois aput (canal de mensagens novo) + aput_writes."""
+    from langgraph.checkpoint.base import copy_checkpoint
+    from langgraph.checkpoint.base.id import uuid6
+
+    get_times: List[float] = []
+    put_times: List[float] = []
+    for _ in range(samples):
+        config = {"configurable": {"thread_id": f"bench-{rng.randint(1, threads):09d}", "checkpoint_ns": ""}}
+        started = time.perf_counter()
+        loaded = await saver.aget_tuple(config)
+        get_times.append(time.perf_counter() - started)
+
+        checkpoint = copy_checkpoint(loaded.checkpoint)
+        checkpoint["id"] = str(uuid6(clock_seq=-1))
+        new_version = saver.get_next_version(checkpoint["channel_versions"].get("messages"), None)
+        checkpoint["channel_versions"]["messages"] = new_version
+        started = time.perf_counter()
+        saved = await saver.aput(loaded.config, checkpoint, {"source": "loop", "step": 1, "writes": {}, "parents": {}}, {"messages": new_version})
+        await saver.aput_writes(saved, [("current_operation", "scheduling")], task_id=str(uuid.uuid4()))
+        put_times.append(time.perf_counter() - started)
+    return {"get": latency_summary(get_times), "put": latency_summary(put_times)}
+
+
+async def table_sizes(conn: Any) -> Dict[str, Any]:
+    sizes = {}
+    for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+        cursor = await conn.execute(f"SELECT count(*), pg_total_relation_size('{table}') + coalesce((SELECT sum(pg_total_relation_size(inhrelid)) FROM pg_inherits WHERE inhparent = '{table}'::regclass), 0)::bigint FROM {table}")
+        rows, total_bytes = await cursor.fetchone()
+        sizes[table] = {"rows": rows, "mb": round(total_bytes / 1048576, 1)}
+    return sizes
+
+
+async def run_layout(args: argparse.Namespace, layout: str) -> List[Dict[str, Any]]:
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg import AsyncConnection
+    from psycopg.rows import dict_row
+
+    from app.infrastructure.checkpoint_partitioning import migrate_to_hash_partitions
+
+    schema = f"bench_part_{uuid.uuid4().hex[:8]}_{layout}"
+    async with await AsyncConnection.connect(args.database_url, autocommit=True) as admin:
+        await admin.execute(f"CREATE SCHEMA {schema}")
+    rng = random.Random(args.seed)
+    results: List[Dict[str, Any]] = []
+    try:
+        options = f"-c search_path={schema}"
+        async with await AsyncConnection.connect(args.database_url, autocommit=True, options=options) as conn, \
+                await AsyncConnection.connect(args.database_url, autocommit=True, prepare_threshold=0, row_factory=dict_row, options=options) as saver_conn:
+            saver = AsyncPostgresSaver(conn=saver_conn)
+            await saver.setup()
+            if layout == "hash":
+                await migrate_to_hash_partitions(conn, args.partitions, drop_old=True)
+            await seed_template(saver, template_state(rng))
+
+            loaded = 0
+            for level in args.levels:
+                started = time.perf_counter()
+                await grow(conn, loaded + 1, level, args.checkpoints_per_thread)
+                load_seconds = time.perf_counter() - started
+                loaded = level
+                await measure(saver, level, min(args.samples, 20), rng)  # aquece cache e planos
+                latencies = await measure(saver, level, args.samples, rng)
+                results.append({"threads": level, "load_seconds": round(load_seconds, 1), "tables": await table_sizes(conn), **latencies})
+                logger.info("%s: %s threads medidas.", layout, level)
+    finally:
+        if not args.keep_schemas:
+            async with await AsyncConnection.connect(args.database_url, autocommit=True) as admin:
+                await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+    return results
+
+
+def print_report(results: Dict[str, List[Dict[str, Any]]]) -> None:
+    print(f"{'layout':<6} {'threads':>9} {'checkpoints':>12} {'MB':>8} {'get p50':>9} {'get p95':>9} {'put p50':>9} {'put p95':>9}")
+    for layout, levels in results.items():
+        for r in levels:
+            mb = round(sum(table["mb"] for table in r["tables"].values()), 1)
+            print(
+                f"{layout:<6} {r['threads']:>9} {r['tables']['checkpoints']['rows']:>12} {mb:>8} "
+                f"{r['get']['p50_ms']:>7}ms {r['get']['p95_ms']:>7}ms {r['put']['p50_ms']:>7}ms {r['put']['p95_ms']:>7}ms"
+            )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Latência de get/put de checkpoints com tabelas normais e particionadas por hash, por volume.")
+    parser.add_argument("--database-url", default="postgresql://postgres@localhost:5432/postgres")
+    parser.add_argument("--levels", type=int, nargs="+", default=[2000, 20000, 100000], help="Threads nas tabelas em cada medição (crescente).")
+    parser.add_argument("--checkpoints-per-thread", type=int, default=5)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--layouts", nargs="*", choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--samples", type=int, default=300, help="Turnos (get + put) medidos por nível.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-schemas", action="store_true", help="Não apaga os schemas do benchmark.")
+    parser.add_argument("--output", help="Salva o resultado em JSON.")
+    parser.add_argument("--log-level", default="INFO")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.levels != sorted(args.levels):
+        print("--levels deve ser crescente.", file=sys.stderr)
+        return 2
+    configure_environment()
+    logging.basicConfig(level=args.log_level.upper())
+
+    results = {layout: asyncio.run(run_layout(args, layout)) for layout in args.layouts}
+    output = {
+        "scenario": {
+            "levels": args.levels,
+            "checkpoints_per_thread": args.checkpoints_per_thread,
+            "partitions": args.partitions,
+            "samples": args.samples,
+            "python": sys.version.split()[0],
+        },
+        "layouts": results,
+    }
+    print_report(results)
+    if args.output:
+        save_json(args.output, output)
+        print(f"\nResultado salvo em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
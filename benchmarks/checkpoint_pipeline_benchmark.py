@@ -0,0 +1,267 @@
+"""
+Benchmark de round trips e latência do checkpointer por turno, com o Postgres "em outro host".
+
+Entre a aplicação e o Postgres fica um proxy TCP em processo que atrasa cada pacote em --rtt-ms/2 por sentido e
+conta os round trips (cada vez que o cliente volta a enviar depois de ter recebido resposta do servidor).
+As conversas do roteiro do benchmark ponta a ponta rodam direto em arun_main_conversation_flow, com o LLM falso
+sem latência e a API AppHealth simulada em processo, então o tempo do turno é praticamente o do checkpointer.
+
+Modos comparados (cada um com seu pool e suas threads):
+- default: uma sincronização por aput e por aput_writes, statements preparados só depois de 5 execuções
+  (o prepare_threshold padrão do psycopg);
+- prepared: o mesmo, com POSTGRES_PREPARE_THRESHOLD=0;
+- pipelined: prepared + CHECKPOINT_PIPELINE_WRITES (writes do super-step no pipeline do próximo aput).
+
+Uso:
+    python -m benchmarks.checkpoint_pipeline_benchmark --database-url postgresql://postgres@localhost:5432/postgres \\
+        [--rtt-ms 2] [--conversations 5] [--durability step] [--output bench_pipeline.json]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from unittest import mock
+from urllib.parse import urlparse, urlunparse
+
+from requests.adapters import HTTPAdapter
+
+from benchmarks.apphealth_simulator import SimulatorConfig, SyntheticCatalog
+from benchmarks.common import free_port, latency_summary, save_json
+from benchmarks.e2e_zapi_benchmark import SCHEDULING_SCRIPT, SCRIPT_SPECIALTIES
+from benchmarks.node_microbench import StubHTTP, configure_environment
+
+logger = logging.getLogger(__name__)
+
+MODES = {
+    "default": {"prepare_threshold": 5, "pipeline_writes": False},
+    "prepared": {"prepare_threshold": 0, "pipeline_writes": False},
+    "pipelined": {"prepare_threshold": 0, "pipeline_writes": True},
+}
+CHECKPOINT_OPERATIONS = ("get_tuple", "put", "put_writes", "flush")
+
+
+class LatencyProxy:
+    """Proxy TCP numa thread própria: atrasa cada pacote em `one_way_delay` e conta os round trips do cliente."""
+
+    def __init__(self, target_host: str, target_port: int, one_way_delay: float):
+        self.target_host = target_host
+        self.target_port = target_port
+        self.one_way_delay = one_way_delay
+        self.port = free_port()
+        self.round_trips = 0
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"bench-pg-proxy-{self.port}", daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, direction: List[str], side: str) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver() -> None:
+            while True:
+                due, data = await queue.get()
+                if data is None:
+                    writer.close()
+                    return
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+                writer.write(data)
+                await writer.drain()
+
+        delivery = asyncio.create_task(deliver())
+        try:
+            while data := await reader.read(65536):
+                if side == "client" and direction[0] != "client":
+                    self.round_trips += 1
+                direction[0] = side
+                queue.put_nowait((time.monotonic() + self.one_way_delay, data))
+        except ConnectionError:
+            pass
+        queue.put_nowait((0.0, None))
+        await delivery
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        server_reader, server_writer = await asyncio.open_connection(self.target_host, self.target_port)
+        direction = ["server"]
+        await asyncio.gather(
+            self._pump(client_reader, server_writer, direction, "client"),
+            self._pump(server_reader, client_writer, direction, "server"),
+            return_exceptions=True,
+        )
+
+    def start(self) -> "LatencyProxy":
+        self._thread.start()
+        self._ready.wait(10)
+        return self
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+
+def _checkpoint_seconds() -> float:
+    from prometheus_client import REGISTRY
+
+    return sum(
+        REGISTRY.get_sample_value("healthai_checkpoint_operation_duration_seconds_sum", {"operation": operation}) or 0.0
+        for operation in CHECKPOINT_OPERATIONS
+    )
+
+
+async def run_mode(args: argparse.Namespace, mode: str, proxy: LatencyProxy, conninfo: str, thread_prefix: str) -> Dict[str, Any]:
+    from psycopg_pool import AsyncConnectionPool
+
+    from app.application.workflows.main_conversation_flow import arun_main_conversation_flow
+    from app.core.config import settings
+    from app.infrastructure.checkpointer import commit_checkpointer, create_checkpointer
+
+    options = MODES[mode]
+    settings.CHECKPOINT_PIPELINE_WRITES = options["pipeline_writes"]
+    settings.CHECKPOINT_DURABILITY = args.durability
+    turn_latencies: List[float] = []
+    turn_round_trips: List[int] = []
+    turn_checkpoint_seconds: List[float] = []
+    apology_replies = 0
+
+    async with AsyncConnectionPool(conninfo=conninfo, min_size=1, max_size=1, kwargs={"prepare_threshold": options["prepare_threshold"]}) as pool:
+        for conversation in range(args.conversations):
+            phone = f"{thread_prefix}{mode}-{conversation:03d}"
+            rng = random.Random(f"{args.seed}:{conversation}")
+            for template in SCHEDULING_SCRIPT:
+                text = template.format(
+                    specialty=rng.choice(SCRIPT_SPECIALTIES),
+                    choice3=rng.randint(1, 3),
+                    choice5=rng.randint(1, 5),
+                    turn=rng.choice(["manhã", "tarde"]),
+                )
+                round_trips_before, checkpoint_before = proxy.round_trips, _checkpoint_seconds()
+                started = time.perf_counter()
+                async with pool.connection() as conn:
+                    checkpointer = create_checkpointer(conn)
+                    reply = await arun_main_conversation_flow(text, phone, checkpointer, user_phone=phone)
+                    await commit_checkpointer(checkpointer)
+                turn_latencies.append(time.perf_counter() - started)
+                turn_round_trips.append(proxy.round_trips - round_trips_before)
+                turn_checkpoint_seconds.append(_checkpoint_seconds() - checkpoint_before)
+                if reply and reply.startswith("Desculpe"):
+                    apology_replies += 1
+
+    turns = len(turn_latencies)
+    return {
+        "turns": turns,
+        "apology_replies": apology_replies,
+        "round_trips_per_turn": round(sum(turn_round_trips) / turns, 2) if turns else None,
+        "round_trips_max": max(turn_round_trips, default=None),
+        "turn_latency": latency_summary(turn_latencies),
+        "checkpoint_latency": latency_summary(turn_checkpoint_seconds),
+        **options,
+    }
+
+
+async def delete_threads(database_url: str, thread_prefix: str) -> None:
+    from psycopg import AsyncConnection
+
+    async with await AsyncConnection.connect(database_url, autocommit=True) as conn:
+        for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+            await conn.execute(f"DELETE FROM {table} WHERE thread_id LIKE %s", (f"{thread_prefix}%",))
+
+
+def proxied_conninfo(database_url: str, proxy_port: int) -> str:
+    url = urlparse(database_url)
+    credentials = url.netloc.rsplit("@", 1)[0] + "@" if "@" in url.netloc else ""
+    return urlunparse(url._replace(netloc=f"{credentials}127.0.0.1:{proxy_port}"))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg import AsyncConnection
+
+    async with await AsyncConnection.connect(args.database_url, autocommit=True) as conn:
+        await AsyncPostgresSaver(conn=conn).setup()
+
+    thread_prefix = f"bench-pipe-{uuid.uuid4().hex[:8]}-"
+    database = urlparse(args.database_url)
+    proxy = LatencyProxy(database.hostname or "localhost", database.port or 5432, args.rtt_ms / 2000.0).start()
+    conninfo = proxied_conninfo(args.database_url, proxy.port)
+    results: Dict[str, Any] = {}
+    try:
+        for mode in args.modes:
+            results[mode] = await run_mode(args, mode, proxy, conninfo, thread_prefix)
+    finally:
+        proxy.stop()
+        if not args.keep_checkpoints:
+            await delete_threads(args.database_url, thread_prefix)
+    return results
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    # ckpt: soma do tempo das operações do checkpointer no turno (as escritas em segundo plano se sobrepõem).
+    print(f"{'modo':<10} {'turnos':>6} {'rt/turno':>9} {'rt máx':>7} {'turno p50':>10} {'turno p95':>10} {'ckpt p50':>9} {'ckpt p95':>9}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<10} {r['turns']:>6} {r['round_trips_per_turn']:>9} {r['round_trips_max']:>7} "
+            f"{r['turn_latency']['p50_ms']:>8}ms {r['turn_latency']['p95_ms']:>8}ms "
+            f"{r['checkpoint_latency']['p50_ms']:>7}ms {r['checkpoint_latency']['p95_ms']:>7}ms"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Round trips e latência do checkpointer por turno, com RTT simulado até o Postgres.")
+    parser.add_argument("--database-url", default="postgresql://postgres@localhost:5432/postgres")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="RTT simulado entre a aplicação e o Postgres.")
+    parser.add_argument("--conversations", type=int, default=5, help="Conversas completas do roteiro por modo.")
+    parser.add_argument("--modes", nargs="*", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--durability", choices=["step", "turn"], default="step", help="CHECKPOINT_DURABILITY durante a medição.")
+    parser.add_argument("--specialties", type=int, default=300)
+    parser.add_argument("--professionals", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-checkpoints", action="store_true", help="Não apaga os checkpoints das conversas.")
+    parser.add_argument("--output", help="Salva o resultado em JSON.")
+    parser.add_argument("--log-level", default="CRITICAL", help="Nível de log da aplicação durante a execução.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_environment()
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+    os.environ.update({"LLM_FAKE_LATENCY_MS": "0", "LLM_FAKE_LATENCY_DISTRIBUTION": "fixed", "LLM_FAKE_SEED": str(args.seed)})
+
+    stub = StubHTTP(SyntheticCatalog(SimulatorConfig(specialties=args.specialties, professionals=args.professionals, seed=args.seed)))
+    with mock.patch.object(HTTPAdapter, "send", lambda adapter, request, **kwargs: stub.send(adapter, request, **kwargs)):
+        results = asyncio.run(run(args))
+
+    output = {
+        "scenario": {"rtt_ms": args.rtt_ms, "conversations": args.conversations, "durability": args.durability, "python": sys.version.split()[0]},
+        "modes": results,
+    }
+    print_report(results)
+    if args.output:
+        save_json(args.output, output)
+        print(f"\nResultado salvo em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Benchmark da serialização dos checkpoints: bytes por checkpoint e latência de put/get por serializador.
+
+Os estados vêm dos fixtures do micro-benchmark de nós (benchmarks.node_microbench), gravados percorrendo o caminho
+feliz do agendamento com os próprios nós, então o formato é o que o grafo grava. Para cada estado medimos:
+- bytes por checkpoint: soma dos blobs dos canais, como o AsyncPostgresSaver grava em checkpoint_blobs;
+- dumps/loads em memória de todos os canais;
+- o mesmo estado no formato antigo (profissionais e horários apresentados como dicts completos), para ver o ganho
+  do estado enxuto independente do serializador.
+
+Com --database-url, cada serializador também grava (aput com todos os canais em versão nova, o pior caso) e lê
+(aget_tuple) checkpoints no Postgres, em threads próprias apagadas ao final.
+
+Uso:
+    python -m benchmarks.checkpoint_serde_benchmark [--iterations 200] \\
+        [--database-url postgresql://postgres@localhost:5432/postgres] [--output bench_serde.json]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from requests.adapters import HTTPAdapter
+
+from benchmarks.apphealth_simulator import SimulatorConfig, SyntheticCatalog
+from benchmarks.common import latency_summary, save_json
+from benchmarks.node_microbench import NodeRunner, StubHTTP, build_counting_llm, configure_environment, record_fixtures
+
+logger = logging.getLogger(__name__)
+
+BENCH_THREAD_PREFIX = "bench-serde-"
+
+
+def build_serializers(min_bytes: int, level: int) -> Dict[str, Any]:
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    from app.infrastructure.checkpointer import CompressedJsonPlusSerializer
+
+    return {
+        "jsonplus": JsonPlusSerializer(),
+        "zlib": CompressedJsonPlusSerializer(min_bytes=min_bytes, level=level),
+    }
+
+
+def legacy_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """O estado como era gravado antes do enxugamento: listas apresentadas com os dicts completos."""
+    from app.application.workflows.main_conversation_flow import _presented_professionals, _presented_time_slots
+
+    legacy = dict(state)
+    if state.get("available_professionals_list"):
+        legacy["available_professionals_list"] = _presented_professionals(state)
+    if state.get("available_times_presented"):
+        legacy["available_times_presented"] = _presented_time_slots(state["available_times_presented"])
+    return legacy
+
+
+def checkpoint_bytes(serde: Any, state: Dict[str, Any]) -> int:
+    return sum(len(serde.dumps_typed(value)[1]) for value in state.values())
+
+
+def measure_in_memory(serde: Any, states: Dict[str, Dict[str, Any]], iterations: int) -> Dict[str, Any]:
+    dumps_times: List[float] = []
+    loads_times: List[float] = []
+    for _ in range(iterations):
+        for state in states.values():
+            started = time.perf_counter()
+            blobs = [serde.dumps_typed(value) for value in state.values()]
+            dumps_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            for blob in blobs:
+                serde.loads_typed(blob)
+            loads_times.append(time.perf_counter() - started)
+    return {"dumps": latency_summary(dumps_times), "loads": latency_summary(loads_times)}
+
+
+async def measure_postgres(database_url: str, serializers: Dict[str, Any], states: Dict[str, Dict[str, Any]], iterations: int) -> Dict[str, Any]:
+    """aput/aget_tuple no Postgres por serializador; cada checkpoint grava todos os canais do estado."""
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg import AsyncConnection
+    from psycopg.rows import dict_row
+
+    results: Dict[str, Any] = {}
+    run_id = uuid.uuid4().hex[:8]
+    async with await AsyncConnection.connect(database_url, autocommit=True, prepare_threshold=0, row_factory=dict_row) as conn:
+        await AsyncPostgresSaver(conn=conn).setup()
+        try:
+            for name, serde in serializers.items():
+                saver = AsyncPostgresSaver(conn=conn, serde=serde)
+                put_times: List[float] = []
+                get_times: List[float] = []
+                for i in range(iterations):
+                    for step, state in states.items():
+                        thread_config = {"configurable": {"thread_id": f"{BENCH_THREAD_PREFIX}{run_id}-{name}-{step}", "checkpoint_ns": ""}}
+                        checkpoint = empty_checkpoint()
+                        checkpoint["channel_values"] = dict(state)
+                        checkpoint["channel_versions"] = {channel: saver.get_next_version(None, None) for channel in state}
+                        started = time.perf_counter()
+                        await saver.aput(thread_config, checkpoint, {"source": "loop", "step": i, "writes": {}, "parents": {}}, checkpoint["channel_versions"])
+                        put_times.append(time.perf_counter() - started)
+                        started = time.perf_counter()
+                        await saver.aget_tuple(thread_config)
+                        get_times.append(time.perf_counter() - started)
+                results[name] = {"put": latency_summary(put_times), "get": latency_summary(get_times)}
+        finally:
+            pattern = f"{BENCH_THREAD_PREFIX}{run_id}-%"
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                await conn.execute(f"DELETE FROM {table} WHERE thread_id LIKE %s", (pattern,))
+    return results
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    serializers = list(results["serializers"])
+    print(f"{'estado':<52} {'antigo':>9} " + " ".join(f"{name:>9}" for name in serializers))
+    print("-" * (63 + 10 * len(serializers)))
+    for step, sizes in results["bytes_per_checkpoint"].items():
+        print(f"{step:<52} {sizes['legacy_jsonplus']:>9} " + " ".join(f"{sizes[name]:>9}" for name in serializers))
+    print()
+    for name, data in results["serializers"].items():
+        line = f"{name:<9} total={data['total_bytes']}B" + (f" (antigo {data['legacy_total_bytes']}B)" if "legacy_total_bytes" in data else "")
+        line += f"  dumps p50={data['dumps']['p50_ms']}ms  loads p50={data['loads']['p50_ms']}ms"
+        if "put" in data:
+            line += f"  put p50={data['put']['p50_ms']}ms p95={data['put']['p95_ms']}ms  get p50={data['get']['p50_ms']}ms p95={data['get']['p95_ms']}ms"
+        print(line)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bytes por checkpoint e latência de put/get por serializador.")
+    parser.add_argument("--iterations", type=int, default=200, help="Repetições por estado (em memória).")
+    parser.add_argument("--db-iterations", type=int, default=20, help="Repetições por estado no Postgres.")
+    parser.add_argument("--database-url", help="Postgres para medir aput/aget_tuple (opcional).")
+    parser.add_argument("--min-bytes", type=int, default=1024, help="CHECKPOINT_COMPRESSION_MIN_BYTES do serializador zlib.")
+    parser.add_argument("--level", type=int, default=6, help="CHECKPOINT_COMPRESSION_LEVEL do serializador zlib.")
+    parser.add_argument("--specialties", type=int, default=300)
+    parser.add_argument("--professionals", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Salva o resultado em JSON.")
+    parser.add_argument("--log-level", default="CRITICAL", help="Nível de log da aplicação durante a execução.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_environment()
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    stub = StubHTTP(SyntheticCatalog(SimulatorConfig(specialties=args.specialties, professionals=args.professionals, seed=args.seed)))
+    llm, _ = build_counting_llm(args.seed)
+    runner = NodeRunner(llm)
+    with mock.patch.object(HTTPAdapter, "send", lambda adapter, request, **kwargs: stub.send(adapter, request, **kwargs)):
+        states = record_fixtures(runner, stub)
+        legacy_states = {step: legacy_state(state) for step, state in states.items()}
+    runner.close()
+
+    serializers = build_serializers(args.min_bytes, args.level)
+    bytes_per_checkpoint = {
+        step: {
+            "legacy_jsonplus": checkpoint_bytes(serializers["jsonplus"], legacy_states[step]),
+            **{name: checkpoint_bytes(serde, state) for name, serde in serializers.items()},
+        }
+        for step, state in states.items()
+    }
+    results: Dict[str, Any] = {
+        "scenario": {"iterations": args.iterations, "min_bytes": args.min_bytes, "level": args.level, "python": sys.version.split()[0]},
+        "bytes_per_checkpoint": bytes_per_checkpoint,
+        "serializers": {
+            name: {"total_bytes": sum(sizes[name] for sizes in bytes_per_checkpoint.values()), **measure_in_memory(serde, states, args.iterations)}
+            for name, serde in serializers.items()
+        },
+    }
+    results["serializers"]["jsonplus"]["legacy_total_bytes"] = sum(sizes["legacy_jsonplus"] for sizes in bytes_per_checkpoint.values())
+
+    if args.database_url:
+        for name, latencies in asyncio.run(measure_postgres(args.database_url, serializers, states, args.db_iterations)).items():
+            results["serializers"][name].update(latencies)
+
+    print_report(results)
+    if args.output:
+        save_json(args.output, results)
+        print(f"\nResultado salvo em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
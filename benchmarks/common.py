@@ -0,0 +1,94 @@
+"""Utilitários compartilhados pelos benchmarks (servidores em thread, percentis e comparação com baseline)."""
+import json
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ThreadedServer:
+    """Sobe um app ASGI com uvicorn em uma thread própria (com seu próprio event loop)."""
+
+    def __init__(self, app: Any, port: Optional[int] = None, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=self.port, log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, name=f"bench-server-{self.port}", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 30.0) -> "ThreadedServer":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Servidor de benchmark na porta {self.port} não iniciou.")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(values_seconds: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/máx em milissegundos."""
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "count": len(values_seconds),
+        "p50_ms": ms(percentile(values_seconds, 50)),
+        "p95_ms": ms(percentile(values_seconds, 95)),
+        "p99_ms": ms(percentile(values_seconds, 99)),
+        "max_ms": ms(max(values_seconds) if values_seconds else None),
+    }
+
+
+def compare_with_baseline(current: Dict[str, Any], baseline: Dict[str, Any], checks: Dict[str, str], tolerance: float) -> List[str]:
+    """
+    Compara métricas (caminhos "a.b.c") com o baseline. `checks` indica se o valor deve ficar "lower" ou "higher".
+    Retorna a lista de regressões acima da tolerância relativa.
+    """
+    def lookup(data: Dict[str, Any], path: str) -> Optional[float]:
+        for key in path.split("."):
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data if isinstance(data, (int, float)) else None
+
+    regressions = []
+    for path, direction in checks.items():
+        now, before = lookup(current, path), lookup(baseline, path)
+        if now is None or not before:
+            continue
+        change = (now - before) / before
+        worse = change > tolerance if direction == "lower" else change < -tolerance
+        marker = "REGRESSÃO" if worse else "ok"
+        print(f"  {path:<40} baseline={before:<12.4g} atual={now:<12.4g} ({change:+.1%}) {marker}")
+        if worse:
+            regressions.append(path)
+    return regressions
+
+
+def save_json(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
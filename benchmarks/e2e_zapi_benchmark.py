@@ -0,0 +1,343 @@
+"""
+Benchmark ponta a ponta do webhook Z-API (/api/v1/webhooks/zapi).
+
+Sobe, no mesmo processo:
+- o simulador da API AppHealth (benchmarks.apphealth_simulator);
+- um substituto do n8n que recebe as respostas do assistente (N8N_WEBHOOK_URL) e o remove-tag;
+- a aplicação (app.main:app) com LLM_BACKEND=fake e o checkpointer no Postgres informado.
+
+Vários telefones simulados percorrem ao mesmo tempo um roteiro de agendamento de vários turnos. A latência
+de um turno vai do POST no webhook até a resposta chegar ao n8n simulado.
+
+Uso:
+    python -m benchmarks.e2e_zapi_benchmark --database-url postgresql://postgres@localhost:5432/postgres \\
+        --phones 50 --llm-latency-ms 200 --output bench_e2e.json [--baseline bench_e2e_baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import FastAPI, Request
+
+from benchmarks.apphealth_simulator import FaultConfig, SimulatorConfig, create_app as create_simulator_app
+from benchmarks.common import ThreadedServer, compare_with_baseline, latency_summary, save_json
+
+logger = logging.getLogger(__name__)
+
+# Roteiro padrão: conversa completa de agendamento até a confirmação final.
+# {specialty}, {choice3} e {choice5} são sorteados por telefone para espalhar os agendamentos pela agenda.
+SCHEDULING_SCRIPT = [
+    "oi",
+    "quero agendar uma consulta",
+    "Maria Clara Souza",
+    "{specialty}",
+    "me indique um profissional",
+    "{choice5}",
+    "{turn}",
+    "{choice3}",
+    "{choice3}",
+    "sim",
+]
+SCRIPT_SPECIALTIES = ["Cardiologia", "Dermatologia", "Pediatria", "Neurologia", "Ginecologia", "Oftalmologia"]
+
+BASELINE_CHECKS = {
+    "turns_per_second": "higher",
+    "turn_latency.p50_ms": "lower",
+    "turn_latency.p95_ms": "lower",
+    "turn_latency.p99_ms": "lower",
+    "llm_calls_per_turn": "lower",
+    "checkpoint_writes_per_turn.checkpoints": "lower",
+    "checkpoint_writes_per_turn.blobs": "lower",
+    "checkpoint_writes_per_turn.writes": "lower",
+    "pool.avg_wait_ms": "lower",
+}
+
+
+class ReplyRouter:
+    """Entrega as respostas recebidas pelo n8n simulado (outra thread/loop) às corrotinas que esperam por telefone."""
+
+    def __init__(self):
+        self._queues: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = {}
+        self._lock = threading.Lock()
+        self.remove_tag_calls = 0
+        self.unexpected_replies = 0
+
+    def register(self, phone: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._queues[phone] = (asyncio.get_running_loop(), queue)
+        return queue
+
+    def deliver(self, phone: str, message: str) -> None:
+        received_at = time.perf_counter()
+        with self._lock:
+            target = self._queues.get(phone)
+        if target is None:
+            self.unexpected_replies += 1
+            return
+        loop, queue = target
+        loop.call_soon_threadsafe(queue.put_nowait, (received_at, message))
+
+
+def create_n8n_stand_in(router: ReplyRouter) -> FastAPI:
+    n8n_app = FastAPI(title="n8n stand-in")
+
+    @n8n_app.post("/webhook/reply")
+    async def reply(request: Request):
+        body = json.loads(await request.body())
+        router.deliver(body.get("phone"), body.get("message"))
+        return {"ok": True}
+
+    @n8n_app.get("/webhook/remove-tag")
+    async def remove_tag(phone: str):
+        router.remove_tag_calls += 1
+        return {"ok": True, "phone": phone}
+
+    return n8n_app
+
+
+def configure_environment(args: argparse.Namespace, simulator_url: str, n8n_url: str) -> None:
+    """Variáveis lidas pelo Settings e pelo lifespan da aplicação; precisam existir antes de importar app.*."""
+    db = urlparse(args.database_url)
+    os.environ.update({
+        "POSTGRES_USER": db.username or "postgres",
+        "POSTGRES_PASSWORD": db.password or "bench",  # o lifespan exige senha; com auth trust ela é ignorada
+        "POSTGRES_HOST": db.hostname or "localhost",
+        "POSTGRES_PORT": str(db.port or 5432),
+        "POSTGRES_DB": (db.path or "/postgres").lstrip("/"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench-fake-key"),
+        "APPHEALTH_API_TOKEN": os.environ.get("APPHEALTH_API_TOKEN", "bench-token"),
+        "APPHEALTH_API_BASE_URL": f"{simulator_url}/api-vizi",
+        "N8N_BASE_URL": n8n_url,
+        "N8N_WEBHOOK_URL": f"{n8n_url}/webhook/reply",
+        "LLM_BACKEND": "fake",
+        "LLM_FAKE_LATENCY_MS": str(args.llm_latency_ms),
+        "LLM_FAKE_LATENCY_DISTRIBUTION": "lognormal" if args.llm_latency_sigma > 0 else "fixed",
+        "LLM_FAKE_LATENCY_JITTER": str(args.llm_latency_sigma),
+        "LLM_FAKE_ERROR_RATE": str(args.llm_error_rate),
+        "LLM_FAKE_SEED": str(args.seed),
+        "CHECKPOINT_DURABILITY": args.checkpoint_durability,
+        "HOT_SESSION_CACHE_ENABLED": str(args.hot_session_cache != "off").lower(),
+        "HOT_SESSION_CACHE_VALIDATION": args.hot_session_cache if args.hot_session_cache != "off" else "version",
+    })
+
+
+async def run_conversation(
+    client: httpx.AsyncClient,
+    router: ReplyRouter,
+    phone: str,
+    script: List[str],
+    args: argparse.Namespace,
+    results: Dict[str, Any],
+) -> None:
+    queue = router.register(phone)
+    rng = random.Random(f"{args.seed}:{phone}")
+    await asyncio.sleep(rng.uniform(0, args.ramp_seconds))
+    for turn_index, template in enumerate(script):
+        text = template.format(
+            specialty=rng.choice(SCRIPT_SPECIALTIES),
+            choice3=rng.randint(1, 3),
+            choice5=rng.randint(1, 5),
+            turn=rng.choice(["manhã", "tarde"]),
+        )
+        payload = {
+            "phone": phone,
+            "text": {"message": text},
+            "messageId": uuid.uuid4().hex,
+            "fromMe": False,
+            "isGroup": False,
+        }
+        sent_at = time.perf_counter()
+        response = await client.post("/api/v1/webhooks/zapi", json=payload)
+        if response.status_code != 200:
+            results["http_errors"] += 1
+            return
+        try:
+            received_at, message = await asyncio.wait_for(queue.get(), timeout=args.turn_timeout)
+        except asyncio.TimeoutError:
+            results["turn_timeouts"] += 1
+            return
+        results["turn_latencies"].append(received_at - sent_at)
+        if message and message.startswith("Desculpe"):
+            results["apology_replies"] += 1
+        if args.verbose:
+            print(f"[{phone}] #{turn_index + 1} > {text!r}\n[{phone}] #{turn_index + 1} < {message!r}")
+        if args.think_time_ms:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_time_ms / 1000.0)
+    results["completed_conversations"] += 1
+
+
+async def count_checkpoint_rows(database_url: str, thread_prefix: str) -> Dict[str, int]:
+    import psycopg
+
+    counts = {}
+    async with await psycopg.AsyncConnection.connect(database_url, autocommit=True) as conn:
+        for table, key in (("checkpoints", "checkpoints"), ("checkpoint_blobs", "blobs"), ("checkpoint_writes", "writes")):
+            cursor = await conn.execute(f"SELECT count(*) FROM {table} WHERE thread_id LIKE %s", (f"{thread_prefix}%",))
+            counts[key] = (await cursor.fetchone())[0]
+    return counts
+
+
+async def delete_checkpoint_rows(database_url: str, thread_prefix: str) -> None:
+    import psycopg
+
+    async with await psycopg.AsyncConnection.connect(database_url, autocommit=True) as conn:
+        for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+            await conn.execute(f"DELETE FROM {table} WHERE thread_id LIKE %s", (f"{thread_prefix}%",))
+
+
+def _llm_calls_admitted() -> int:
+    from app.infrastructure.llm_gateway import get_llm_gateway
+
+    return sum(lane["admitted"] for lane in get_llm_gateway().get_stats()["lanes"].values())
+
+
+def _hot_session_lookups() -> Dict[str, int]:
+    from app.infrastructure.metrics import HOT_SESSION_CACHE_LOOKUPS
+
+    return {result: int(HOT_SESSION_CACHE_LOOKUPS.labels(result=result)._value.get()) for result in ("hit", "stale", "miss")}
+
+
+async def drive(args: argparse.Namespace, app_url: str, router: ReplyRouter, health_app: Any, script: List[str]) -> Dict[str, Any]:
+    thread_prefix = f"5599{random.Random().randint(1000, 9999)}"
+    phones = [f"{thread_prefix}{i:05d}" for i in range(args.phones)]
+    results: Dict[str, Any] = {
+        "turn_latencies": [], "completed_conversations": 0, "turn_timeouts": 0, "http_errors": 0, "apology_replies": 0,
+    }
+
+    llm_calls_before = _llm_calls_admitted()
+    cache_lookups_before = _hot_session_lookups()
+    health_app.state.db_pool.pop_stats()
+    limits = httpx.Limits(max_connections=args.phones + 10, max_keepalive_connections=args.phones + 10)
+    started_at = time.perf_counter()
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(run_conversation(client, router, phone, script, args, results) for phone in phones))
+    elapsed = time.perf_counter() - started_at
+
+    pool_stats = health_app.state.db_pool.pop_stats()
+    llm_calls = _llm_calls_admitted() - llm_calls_before
+    cache_lookups = {result: count - cache_lookups_before[result] for result, count in _hot_session_lookups().items()}
+    checkpoint_rows = await count_checkpoint_rows(args.database_url, thread_prefix)
+    if not args.keep_checkpoints:
+        await delete_checkpoint_rows(args.database_url, thread_prefix)
+
+    turns = len(results["turn_latencies"])
+    requests_num = pool_stats.get("requests_num", 0)
+    return {
+        "scenario": {
+            "phones": args.phones,
+            "script_turns": len(script),
+            "llm_latency_ms": args.llm_latency_ms,
+            "apphealth_latency_ms": args.apphealth_latency_ms,
+            "think_time_ms": args.think_time_ms,
+            "checkpoint_durability": args.checkpoint_durability,
+            "hot_session_cache": args.hot_session_cache,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "turns": turns,
+        "turns_per_second": round(turns / elapsed, 3) if elapsed else 0.0,
+        "turn_latency": latency_summary(results["turn_latencies"]),
+        "completed_conversations": results["completed_conversations"],
+        "turn_timeouts": results["turn_timeouts"],
+        "http_errors": results["http_errors"],
+        "apology_replies": results["apology_replies"],
+        "llm_calls": llm_calls,
+        "llm_calls_per_turn": round(llm_calls / turns, 3) if turns else None,
+        "checkpoint_rows": checkpoint_rows,
+        "checkpoint_writes_per_turn": {k: round(v / turns, 3) if turns else None for k, v in checkpoint_rows.items()},
+        "hot_session_cache": cache_lookups,
+        "pool": {
+            "requests": requests_num,
+            "requests_queued": pool_stats.get("requests_queued", 0),
+            "avg_wait_ms": round(pool_stats.get("requests_wait_ms", 0) / requests_num, 3) if requests_num else 0.0,
+            "total_wait_ms": pool_stats.get("requests_wait_ms", 0),
+            "pool_max": health_app.state.db_pool.max_size,
+        },
+        "remove_tag_calls": router.remove_tag_calls,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta do webhook Z-API.")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/postgres"))
+    parser.add_argument("--phones", type=int, default=20, help="Telefones simulados em paralelo.")
+    parser.add_argument("--script", help="JSON com a lista de mensagens do roteiro (padrão: agendamento completo).")
+    parser.add_argument("--ramp-seconds", type=float, default=1.0, help="Espalha o início das conversas nesse intervalo.")
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="Pausa média entre a resposta e a próxima mensagem.")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.4)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--apphealth-latency-ms", type=float, default=50.0)
+    parser.add_argument("--apphealth-error-rate", type=float, default=0.0)
+    parser.add_argument("--specialties", type=int, default=300)
+    parser.add_argument("--professionals", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Salva o resultado em JSON.")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Piora relativa aceita antes de acusar regressão.")
+    parser.add_argument("--checkpoint-durability", choices=["step", "turn"], default="step", help="CHECKPOINT_DURABILITY da aplicação.")
+    parser.add_argument("--hot-session-cache", choices=["off", "version", "none"], default="off",
+                        help="Cache de sessões do worker (HOT_SESSION_CACHE_ENABLED/VALIDATION).")
+    parser.add_argument("--keep-checkpoints", action="store_true", help="Não apaga os checkpoints das conversas simuladas.")
+    parser.add_argument("--log-level", default="CRITICAL", help="Nível de log da aplicação durante a execução.")
+    parser.add_argument("--verbose", action="store_true", help="Imprime cada turno (útil com --phones 1).")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    script = SCHEDULING_SCRIPT
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    simulator = ThreadedServer(create_simulator_app(SimulatorConfig(
+        specialties=args.specialties,
+        professionals=args.professionals,
+        seed=args.seed,
+        faults=FaultConfig(latency_ms=args.apphealth_latency_ms, error_rate=args.apphealth_error_rate),
+    ))).start()
+    router = ReplyRouter()
+    n8n = ThreadedServer(create_n8n_stand_in(router)).start()
+    configure_environment(args, simulator.base_url, n8n.base_url)
+
+    from app.main import app as health_app  # importado depois do ambiente configurado
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    app_server = ThreadedServer(health_app).start()
+    try:
+        result = asyncio.run(drive(args, app_server.base_url, router, health_app, script))
+    finally:
+        app_server.stop()
+        n8n.stop()
+        simulator.stop()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        save_json(args.output, result)
+        print(f"Resultado salvo em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparação com {args.baseline} (tolerância {args.tolerance:.0%}):")
+        regressions = compare_with_baseline(result, baseline, BASELINE_CHECKS, args.tolerance)
+        if regressions:
+            print(f"Regressões: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
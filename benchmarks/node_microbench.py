@@ -0,0 +1,417 @@
+"""
+Micro-benchmark dos nós do grafo de agendamento, isolado de LLM, API AppHealth, n8n e Postgres.
+
+Para cada `scheduling_step` há um estado fixture de MainWorkflowState. Os fixtures são gravados percorrendo o
+caminho feliz do agendamento com os próprios nós, então o formato do estado é o mesmo que o grafo produz.
+Cada nó é executado com:
+- LLM: FakeChatModel sem latência (contando as chamadas por template);
+- HTTP: `HTTPAdapter.send` substituído por um stub em processo que responde a partir do catálogo sintético do
+  simulador (benchmarks.apphealth_simulator) e do remove-tag do n8n.
+
+Medimos, por execução do nó: tempo de CPU e de parede, o custo de serializar o estado resultante como o
+checkpointer faz (JsonPlusSerializer por canal), alocações (tracemalloc), chamadas de função (cProfile) e
+chamadas ao LLM/HTTP. Assim o overhead de Python/serialização aparece separado da latência dos serviços.
+
+Uso:
+    python -m benchmarks.node_microbench --iterations 200 [--nodes fetch_and_present_available_times_node ...] \\
+        [--top 8] [--output bench_nodes.json] [--baseline bench_nodes_baseline.json]
+"""
+import argparse
+import asyncio
+import copy
+import cProfile
+import inspect
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.apphealth_simulator import SimulatorConfig, SyntheticCatalog
+from benchmarks.common import compare_with_baseline, percentile, save_json
+
+logger = logging.getLogger(__name__)
+
+APPHEALTH_STUB_BASE_URL = "http://apphealth.bench/api-vizi"
+N8N_STUB_BASE_URL = "http://n8n.bench"
+
+# Caminho feliz usado para gravar os fixtures: (nó, mensagem do usuário antes do nó ou None).
+FIXTURE_PATH: List[Tuple[str, Optional[str]]] = [
+    ("coletar_validar_nome_agendamento_node", "Maria Clara Souza"),
+    ("coletar_validar_especialidade_node", "Cardiologia"),
+    ("solicitar_preferencia_profissional_node", None),
+    ("coletar_classificar_preferencia_profissional_node", "me indique um profissional"),
+    ("processing_professional_logic_node", None),
+    ("list_available_professionals_node", None),
+    ("collect_validate_chosen_professional_node", "1"),
+    ("solicitar_turno_node", None),
+    ("coletar_validar_turno_node", "manhã"),
+    ("fetch_and_present_available_dates_node", None),
+    ("collect_validate_chosen_date_node", "1"),
+    ("fetch_and_present_available_times_node", None),
+    ("coletar_validar_horario_escolhido_node", "1"),
+    ("process_final_scheduling_confirmation_node", "sim"),
+]
+
+BASELINE_METRICS = {"cpu_ms.p50": "lower", "calls": "lower", "alloc_peak_kib": "lower", "serde_ms.p50": "lower"}
+
+
+class StubHTTP:
+    """Responde às requisições de `requests` em processo, sem rede, e conta as chamadas por rota."""
+
+    def __init__(self, catalog: SyntheticCatalog):
+        self.catalog = catalog
+        self.calls: Counter = Counter()
+        self._get_cache: Dict[str, Tuple[int, bytes]] = {}
+
+    def _route(self, method: str, path: str, query: Dict[str, str], body: Optional[bytes]) -> Tuple[int, Any]:
+        parts = [p for p in path.split("/") if p]
+        if parts[:2] == ["webhook", "remove-tag"]:
+            return 200, {"ok": True}
+        if not parts or parts[0] != "api-vizi":
+            return 404, {"message": f"Rota não simulada: {path}"}
+        parts = parts[1:]
+        if parts == ["especialidades"]:
+            return 200, self.catalog.specialties
+        if parts == ["profissionais"]:
+            specialty_id = query.get("especialidadeId")
+            if specialty_id is None:
+                return 200, self.catalog.professionals
+            return 200, self.catalog.professionals_by_specialty.get(int(specialty_id), [])
+        if len(parts) == 4 and parts[:2] == ["agenda", "profissionais"]:
+            professional_id = int(parts[2])
+            if parts[3] == "datas":
+                return 200, self.catalog.available_dates(professional_id, int(query["mes"]), int(query["ano"]))
+            if parts[3] == "horarios":
+                return 200, self.catalog.free_slots(professional_id, date.fromisoformat(query["data"]))
+        if parts == ["agendamentos"] and method == "POST":
+            try:
+                return 201, self.catalog.book(json.loads(body or b"{}"))
+            except Exception as e:  # HTTPException do simulador
+                return getattr(e, "status_code", 500), {"message": getattr(e, "detail", str(e))}
+        return 404, {"message": f"Rota não simulada: {path}"}
+
+    def send(self, adapter: HTTPAdapter, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        url = urlparse(request.url)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        route = url.path.split("/api-vizi/", 1)[-1].split("/")[0] or url.path
+        self.calls[route] += 1
+        # GETs são memorizados para que o custo do catálogo sintético não entre na medição do nó.
+        cached = self._get_cache.get(request.url) if request.method == "GET" else None
+        if cached is None:
+            status, payload = self._route(request.method, url.path, query, body)
+            cached = (status, json.dumps(payload).encode("utf-8"))
+            if request.method == "GET":
+                self._get_cache[request.url] = cached
+
+        response = requests.Response()
+        response.status_code, response._content = cached
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def configure_environment() -> None:
+    """Variáveis lidas pelo Settings; precisam existir antes de importar app.*."""
+    os.environ.update({
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench-fake-key"),
+        "APPHEALTH_API_TOKEN": os.environ.get("APPHEALTH_API_TOKEN", "bench-token"),
+        "APPHEALTH_API_BASE_URL": APPHEALTH_STUB_BASE_URL,
+        "N8N_BASE_URL": N8N_STUB_BASE_URL,
+        "LLM_BACKEND": "fake",
+    })
+
+
+def build_counting_llm(seed: int) -> Tuple[Any, Counter]:
+    from app.infrastructure.fake_llm import FakeChatModel
+
+    calls: Counter = Counter()
+
+    class CountingFakeChatModel(FakeChatModel):
+        def respond(self, messages):
+            template_name, content = super().respond(messages)
+            calls[template_name] += 1
+            return template_name, content
+
+    return CountingFakeChatModel(latency_distribution="fixed", latency_ms=0.0, latency_jitter=0.0, seed=seed), calls
+
+
+class NodeRunner:
+    """Executa um nó do fluxo principal com o LLM falso e aplica as atualizações ao estado como o grafo faria."""
+
+    def __init__(self, llm: Any):
+        from app.application.workflows import main_conversation_flow
+
+        self.flow = main_conversation_flow
+        self.llm = llm
+        self.loop = asyncio.new_event_loop()
+        self._bound: Dict[str, Callable[..., Any]] = {}
+
+    def _bind(self, node_name: str) -> Callable[..., Any]:
+        function = getattr(self.flow, node_name)
+        kwargs = {"llm_client": self.llm}
+        if "classifier_llm_client" in inspect.signature(function).parameters:
+            kwargs["classifier_llm_client"] = self.llm
+        return partial(function, **kwargs)
+
+    def run(self, node_name: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        if node_name not in self._bound:
+            self._bound[node_name] = self._bind(node_name)
+        result = self._bound[node_name](state)
+        if inspect.iscoroutine(result):
+            result = self.loop.run_until_complete(result)
+        return result or {}
+
+    @staticmethod
+    def apply(state: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+        from langgraph.graph.message import add_messages
+
+        merged = dict(state)
+        for key, value in updates.items():
+            if key == "messages":
+                merged["messages"] = add_messages(merged.get("messages", []), value if isinstance(value, list) else [value])
+            else:
+                merged[key] = value
+        return merged
+
+    def close(self) -> None:
+        self.loop.close()
+
+
+def record_fixtures(runner: NodeRunner, stub: StubHTTP, phone: str = "5511999990000") -> Dict[str, Dict[str, Any]]:
+    """Percorre FIXTURE_PATH e guarda o estado de entrada de cada nó (chave: nome do nó)."""
+    from langchain_core.messages import HumanMessage
+    from langgraph.graph.message import add_messages
+
+    fixtures: Dict[str, Dict[str, Any]] = {}
+    state: Dict[str, Any] = {
+        "messages": [],
+        "current_operation": "SCHEDULING",
+        "categoria": "Agendamento",
+        "user_phone": phone,
+        "scheduling_step": "VALIDATING_FULL_NAME",
+    }
+    for node_name, user_message in FIXTURE_PATH:
+        if user_message is not None:
+            state["messages"] = add_messages(state["messages"], [HumanMessage(content=user_message)])
+        fixtures[node_name] = copy.deepcopy(state)
+        state = runner.apply(state, runner.run(node_name, state))
+    stub.catalog.reset_bookings()
+
+    # Passos fora do caminho feliz, derivados dos estados gravados.
+    no_availability = copy.deepcopy(fixtures["fetch_and_present_available_times_node"])
+    no_availability["scheduling_step"] = "AWAITING_RETRY_OPTION_AFTER_NO_AVAILABILITY"
+    no_availability["messages"] = add_messages(no_availability["messages"], [HumanMessage(content="quero tentar outro profissional")])
+    fixtures["process_retry_option_choice_node"] = no_availability
+
+    fallback = copy.deepcopy(fixtures["coletar_validar_horario_escolhido_node"])
+    fallback["scheduling_step"] = "AWAITING_TIME_CHOICE"
+    fallback["fallback_context_message"] = "não consegui confirmar o horário escolhido."
+    fixtures["placeholder_fallback_node"] = fallback
+    return fixtures
+
+
+def serialize_state(serde: Any, state: Dict[str, Any]) -> int:
+    """Serializa cada canal como o checkpointer (um blob por canal) e retorna o total de bytes."""
+    return sum(len(serde.dumps_typed(value)[1]) for value in state.values())
+
+
+def _summary_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": round(percentile(values, 50) * 1000, 4) if values else None,
+        "p95": round(percentile(values, 95) * 1000, 4) if values else None,
+        "mean": round(sum(values) / len(values) * 1000, 4) if values else None,
+    }
+
+
+def _hotspots(profile: cProfile.Profile, runs: int, top: int) -> Tuple[int, int, List[Dict[str, Any]]]:
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, function), (primitive, total, tottime, cumtime, _) in stats.stats.items():
+        if filename == __file__ or function.startswith("<method 'disable' of '_lsprof"):
+            continue
+        rows.append({
+            "function": f"{os.path.relpath(filename) if filename.startswith(os.sep) else filename}:{line}({function})",
+            "calls": round(total / runs, 2),
+            "tottime_ms": round(tottime / runs * 1000, 4),
+            "cumtime_ms": round(cumtime / runs * 1000, 4),
+        })
+    rows.sort(key=lambda row: row["tottime_ms"], reverse=True)
+    return round(stats.total_calls / runs), round(stats.prim_calls / runs), rows[:top]
+
+
+def benchmark_node(
+    runner: NodeRunner,
+    stub: StubHTTP,
+    llm_calls: Counter,
+    serde: Any,
+    node_name: str,
+    fixture: Dict[str, Any],
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    def fresh_state() -> Dict[str, Any]:
+        stub.catalog.reset_bookings()
+        return copy.deepcopy(fixture)
+
+    for _ in range(args.warmup):
+        runner.run(node_name, fresh_state())
+
+    # 1) Tempo de CPU/parede do nó e da serialização do estado resultante.
+    llm_calls.clear()
+    stub.calls.clear()
+    cpu, wall, serde_times = [], [], []
+    state_bytes = 0
+    updates: Dict[str, Any] = {}
+    for _ in range(args.iterations):
+        state = fresh_state()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        updates = runner.run(node_name, state)
+        cpu.append(time.thread_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+
+        merged = runner.apply(state, updates)
+        serde_start = time.perf_counter()
+        state_bytes = serialize_state(serde, merged)
+        serde_times.append(time.perf_counter() - serde_start)
+    llm_per_run = {name: round(count / args.iterations, 2) for name, count in sorted(llm_calls.items())}
+    http_per_run = {route: round(count / args.iterations, 2) for route, count in sorted(stub.calls.items())}
+
+    # 2) Alocações (tracemalloc tem overhead próprio, por isso fica fora da medição de tempo).
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(args.profile_iterations):
+            state = fresh_state()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = runner.run(node_name, state)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            del result
+    finally:
+        tracemalloc.stop()
+
+    # 3) Contagem de chamadas e hotspots (cProfile).
+    profile = cProfile.Profile()
+    for _ in range(args.profile_iterations):
+        state = fresh_state()
+        profile.enable()
+        runner.run(node_name, state)
+        profile.disable()
+    total_calls, primitive_calls, hotspots = _hotspots(profile, args.profile_iterations, args.top)
+
+    return {
+        "scheduling_step": fixture.get("scheduling_step"),
+        "next_step": updates.get("scheduling_step"),
+        "cpu_ms": _summary_ms(cpu),
+        "wall_ms": _summary_ms(wall),
+        "serde_ms": _summary_ms(serde_times),
+        "state_kib": round(state_bytes / 1024, 2),
+        "alloc_peak_kib": round(sum(peaks) / len(peaks) / 1024, 2) if peaks else None,
+        "alloc_retained_kib": round(sum(retained) / len(retained) / 1024, 2) if retained else None,
+        "calls": total_calls,
+        "primitive_calls": primitive_calls,
+        "llm_calls": llm_per_run,
+        "http_calls": http_per_run,
+        "hotspots": hotspots,
+    }
+
+
+def print_report(results: Dict[str, Dict[str, Any]]) -> None:
+    header = f"{'nó':<52} {'cpu p50':>9} {'serde':>8} {'estado':>8} {'pico':>9} {'chamadas':>9} {'llm':>4} {'http':>5}"
+    print(header)
+    print("-" * len(header))
+    for node_name, r in results.items():
+        print(
+            f"{node_name:<52} {r['cpu_ms']['p50']:>7.3f}ms {r['serde_ms']['p50']:>6.3f}ms {r['state_kib']:>6.1f}K "
+            f"{r['alloc_peak_kib']:>7.1f}K {r['calls']:>9} {sum(r['llm_calls'].values()):>4g} {sum(r['http_calls'].values()):>5g}"
+        )
+    for node_name, r in results.items():
+        if not r["hotspots"]:
+            continue
+        print(f"\n{node_name} ({r['scheduling_step']} -> {r['next_step']}):")
+        for spot in r["hotspots"]:
+            print(f"  {spot['tottime_ms']:>9.4f}ms {spot['calls']:>9g}x  {spot['function']}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro-benchmark por nó do fluxo de agendamento.")
+    parser.add_argument("--nodes", nargs="*", help="Nós a medir (padrão: todos os que têm fixture).")
+    parser.add_argument("--iterations", type=int, default=200, help="Execuções cronometradas por nó.")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--profile-iterations", type=int, default=20, help="Execuções com tracemalloc e com cProfile.")
+    parser.add_argument("--top", type=int, default=5, help="Hotspots listados por nó.")
+    parser.add_argument("--specialties", type=int, default=300)
+    parser.add_argument("--professionals", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Salva o resultado em JSON.")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Piora relativa aceita antes de acusar regressão.")
+    parser.add_argument("--log-level", default="CRITICAL", help="Nível de log da aplicação durante a execução.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_environment()
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    stub = StubHTTP(SyntheticCatalog(SimulatorConfig(specialties=args.specialties, professionals=args.professionals, seed=args.seed)))
+    llm, llm_calls = build_counting_llm(args.seed)
+    runner = NodeRunner(llm)
+    serde = JsonPlusSerializer()
+
+    with mock.patch.object(HTTPAdapter, "send", lambda adapter, request, **kwargs: stub.send(adapter, request, **kwargs)):
+        fixtures = record_fixtures(runner, stub)
+        selected = args.nodes or list(fixtures)
+        unknown = [name for name in selected if name not in fixtures]
+        if unknown:
+            print(f"Nós sem fixture: {', '.join(unknown)}. Disponíveis: {', '.join(fixtures)}")
+            return 2
+        results = {
+            name: benchmark_node(runner, stub, llm_calls, serde, name, fixtures[name], args)
+            for name in selected
+        }
+    runner.close()
+
+    output = {
+        "scenario": {"iterations": args.iterations, "profile_iterations": args.profile_iterations, "python": sys.version.split()[0]},
+        "nodes": results,
+    }
+    print_report(results)
+    if args.output:
+        save_json(args.output, output)
+        print(f"\nResultado salvo em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        checks = {f"nodes.{name}.{metric}": direction for name in results for metric, direction in BASELINE_METRICS.items()}
+        print(f"\nComparação com {args.baseline} (tolerância {args.tolerance:.0%}):")
+        regressions = compare_with_baseline(output, baseline, checks, args.tolerance)
+        if regressions:
+            print(f"Regressões: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())